@@ -5,14 +5,21 @@ from gi.repository import Adw, Gdk, Gio, GLib, GObject, Gtk
 
 import logging
 from signal import signal, SIGINT, SIGTERM, SIGHUP
-from typing import Any, Callable, Optional
+import time
+from typing import Any, Callable, Optional, Union
 
 import buffer.const as const
 import buffer.config_manager as config_manager
 
+from buffer.buffer_search_dialog import BufferSearchDialog
+from buffer.crash_journal import CrashJournal, CrashJournalManager
+from buffer.editor_style import EditorStyle
 from buffer.migration_assistant import MigrationAssistant
 from buffer.emergency_saves_manager import EmergencySavesManager
 from buffer.preferences_dialog import PreferencesDialog
+from buffer.recovery_search_dialog import RecoverySearchDialog
+from buffer.session_manager import SessionBuffer, SessionManager
+from buffer.spelling_service import SpellingService
 from buffer.widgets import load_widgets
 from buffer.window import Window
 
@@ -21,6 +28,9 @@ class Application(Adw.Application):
     development_mode = const.IS_DEVEL
     application_id = const.APP_ID
 
+    # Seconds allowed for saving buffers when terminated, within session managers' kill timeouts
+    TERMINATION_SAVE_TIMEOUT = 5
+
     def __init__(self, *args) -> None:
         super().__init__(
             *args,
@@ -33,7 +43,20 @@ class Application(Adw.Application):
         self.__windows: list[Window] = []
         self.__actions: dict[str, Gio.SimpleAction] = {}
         self.__emergency_saves_manager = EmergencySavesManager()
+        self.__crash_journal_manager = CrashJournalManager()
+        self.__journals: dict[Window, CrashJournal] = {}
+        self.__session_manager = SessionManager()
+        # Buffers of the loaded session not yet restored, by window, and those yet to get one
+        self.__restoring: dict[Window, SessionBuffer] = {}
+        self.__session_pending: list[SessionBuffer] = []
+        # Buffers whose windows were closed before being restored, kept until saved elsewhere
+        self.__session_closed: list[SessionBuffer] = []
+        self.__session_source_id: Optional[int] = None
+        self.__session_saved = False
+        self.__restored_at_startup = False
+        self.__terminating = False
         self.__preferences_dialog: Optional[PreferencesDialog] = None
+        self.__editor_style: Optional[EditorStyle] = None
 
         self.__add_cli_options()
         self.__initialise_styling()
@@ -51,10 +74,11 @@ class Application(Adw.Application):
         self.connect("handle-local-options", self.__on_handle_local_options)
         self.connect("startup", lambda _o: self.__on_startup())
         self.connect("activate", lambda _o: self.__on_activate())
+        self.connect("shutdown", lambda _o: self.__on_shutdown())
 
         signal(SIGINT, lambda _s, _f: self.__quit())
-        signal(SIGTERM, lambda _s, _f: self.__quit())
-        signal(SIGHUP, lambda _s, _f: self.__quit())
+        signal(SIGTERM, lambda _s, _f: self.__terminate())
+        signal(SIGHUP, lambda _s, _f: self.__terminate())
 
     def __on_handle_local_options(self, _obj: GObject.Object, options: GLib.VariantDict) -> int:
         """Handle options, setup logging."""
@@ -82,6 +106,9 @@ class Application(Adw.Application):
             self.register()
             if self.get_property("is-remote"):
                 self.activate_action("new-from-clipboard")
+            elif self.__restored_at_startup:
+                # Avoid pasting over restored text
+                self.__create_window_from_clipboard()
             else:
                 self.__windows[0].set_to_paste_during_init()
 
@@ -90,6 +117,7 @@ class Application(Adw.Application):
 
     def __on_startup(self) -> None:
         """Handle startup."""
+        start_time = time.monotonic()
         Gtk.Application.do_startup(self)
         Adw.init()
 
@@ -97,8 +125,19 @@ class Application(Adw.Application):
         migration_assistant.handle_version_migration()
 
         load_widgets()
+        # Before any windows, for a single style provider shared by all
+        self.__editor_style = EditorStyle(self.__dbus_proxy)
         self.__setup_actions()
-        self.__create_window()
+        if self.__restore_from_crash_journals():
+            # The journals are more recent than any session
+            self.__session_manager.discard()
+        elif not self.__restore_session():
+            self.__create_window()
+
+        config_manager.subscribe(
+            config_manager.EMERGENCY_RECOVERY_FILES, self.__on_emergency_recovery_files_changed
+        )
+        logging.debug(f"Startup took {(time.monotonic() - start_time) * 1000:.0f}ms")
 
     def __on_activate(self) -> None:
         """Handle window activation."""
@@ -106,25 +145,120 @@ class Application(Adw.Application):
 
         Application.apply_style()
 
+    def __on_shutdown(self) -> None:
+        self.__crash_journal_manager.shutdown()
+        self.__emergency_saves_manager.shutdown()
+        self.__session_manager.shutdown()
+        SpellingService.get_default().log_statistics()
+        config_manager.flush()
+
     def __on_style_change(self) -> None:
         for window in self.__windows:
             window.update_style()
 
     def __on_close_request(self, window: Window) -> bool:
-        if config_manager.get_emergency_recover_files() > 0:
-            text = window.get_text()
-            if text.strip() != "":
-                self.__emergency_saves_manager.save(text)
+        if self.__terminating:
+            # Already saved, or left to the crash journal
+            self.__windows.remove(window)
+            return False
+
+        journal = self.__journals.pop(window, None)
+
+        if window in self.__restoring:
+            self.__close_restoring(window, journal)
+            self.__windows.remove(window)
+            return False
+
+        def discard_journal(_success: bool) -> None:
+            # Only drop the journal once the buffer has reached the emergency save
+            if journal is not None:
+                self.__crash_journal_manager.discard(journal)
+
+        if config_manager.get_emergency_recover_files() > 0 and not window.is_blank():
+            self.__emergency_saves_manager.save(window.get_buffer(), discard_journal)
+        else:
+            discard_journal(False)
         self.__windows.remove(window)
         return False
 
+    def __close_restoring(self, window: Window, journal: Optional[CrashJournal]) -> None:
+        """Close a window whose text is still being restored.
+
+        Its session file holds the only complete copy of the text, so that's what's saved, and the
+        file is kept, carried into the next session, should there be no emergency save.
+        """
+        window.cancel_restore()
+        buffer = self.__restoring.pop(window)
+        # Only the part restored so far has been journaled
+        if journal is not None:
+            self.__crash_journal_manager.discard(journal)
+        self.__session_closed.append(buffer)
+
+        def on_saved(success: bool) -> None:
+            # Otherwise the file has been carried into the newly saved session
+            if success and not self.__session_saved:
+                self.__session_closed.remove(buffer)
+                self.__session_manager.remove(buffer)
+
+        if config_manager.get_emergency_recover_files() > 0:
+            self.__emergency_saves_manager.save_pieces(
+                self.__session_manager.read(buffer), on_saved
+            )
+
+    def __on_emergency_recovery_files_changed(self) -> None:
+        if config_manager.get_emergency_recover_files() > 0:
+            for window in self.__windows:
+                if window not in self.__journals:
+                    self.__start_journal(window)
+        else:
+            for journal in self.__journals.values():
+                self.__crash_journal_manager.discard(journal)
+            self.__journals.clear()
+
     def __quit(self) -> None:
+        quitting = not config_manager.get_quit_closes_window() or len(self.__windows) == 1
+        if quitting and config_manager.get_restore_session():
+            self.__save_session()
+
         if config_manager.get_quit_closes_window():
             self.get_active_window().close()
         else:
             for window in self.__windows:
                 window.close()
 
+    def __terminate(self) -> None:
+        """Save all buffers at once and quit, for when the session is ending.
+
+        Rather than each window being saved in turn as it closes, the buffers are written
+        concurrently within a time limit. Crash journals are kept for any buffers not saved in
+        time, for recovery on the next launch.
+        """
+        if self.__terminating:
+            return
+        self.__terminating = True
+
+        if config_manager.get_restore_session():
+            self.__save_session()
+
+        if config_manager.get_emergency_recover_files() > 0:
+            windows = [window for window in self.__windows if not window.is_blank()]
+            saved = self.__emergency_saves_manager.save_all(
+                [window.get_text() for window in windows], self.TERMINATION_SAVE_TIMEOUT
+            )
+            unsaved = [window for window, success in zip(windows, saved) if not success]
+            for window in unsaved:
+                logging.warning(
+                    f"Buffer of {window.get_char_count()} characters not saved before termination"
+                )
+            for window, journal in self.__journals.items():
+                if window not in unsaved:
+                    self.__crash_journal_manager.discard(journal)
+            self.__journals.clear()
+
+        for window in list(self.__windows):
+            window.close()
+        self.quit()
+
     def __initialise_styling(self) -> None:
         self.__base_css_resource = f"{self.props.resource_base_path}/ui/base_style.css"
         self.__base_css_provider = None
@@ -172,20 +306,131 @@ class Application(Adw.Application):
         add_action("quit", lambda _o, _v: self.__quit(), "<Control>q")
         add_action("settings", lambda _o, _v: self.__show_preferences_dialog(), "<Control>comma")
         add_action("new", lambda _o, _v: self.__create_window(), "<Control>n")
+        add_action(
+            "show-recovery-files", lambda _o, _v: self.__emergency_saves_manager.show_directory()
+        )
+        add_action("search-recovery-files", lambda _o, _v: self.__show_recovery_search_dialog())
+        add_action(
+            "search-buffers", lambda _o, _v: self.__show_buffer_search_dialog(), "<Control><Shift>f"
+        )
+        add_action(
+            "open-recovery-file",
+            lambda _o, v: self.__open_recovery_file(v.get_string()),
+            parameter_type=GLib.VariantType.new("s"),
+        )
         add_action(
             "new-from-clipboard",
             lambda _o, _v: self.__create_window_from_clipboard(),
             "<Control><Shift>v",
         )
 
-    def __create_window(self) -> Window:
-        window = Window(self, self.__dbus_proxy)
+    def __create_window(self, focus: bool = True) -> Window:
+        window = Window(self)
         self.add_window(window)
-        window.present()
+        if focus:
+            window.present()
+        else:
+            window.set_visible(True)
         window.connect("close-request", self.__on_close_request)
         self.__windows.append(window)
+        if config_manager.get_emergency_recover_files() > 0:
+            self.__start_journal(window)
         return window
 
+    def __start_journal(self, window: Window) -> None:
+        journal = self.__crash_journal_manager.create_journal(window.get_buffer())
+        if journal is not None:
+            self.__journals[window] = journal
+
+    def __restore_from_crash_journals(self) -> bool:
+        recovered = self.__crash_journal_manager.recover()
+        for journal, text, cursor in recovered:
+            window = Window(self)
+            self.add_window(window)
+            window.restore_text(text, cursor)
+            window.present()
+            window.connect("close-request", self.__on_close_request)
+            self.__windows.append(window)
+            journal.attach(window.get_buffer())
+            self.__journals[window] = journal
+        if recovered:
+            logging.info(f"Restored {len(recovered)} buffers from crash journal")
+            self.__restored_at_startup = True
+        return len(recovered) > 0
+
+    def __save_session(self) -> None:
+        buffers: list[Union[tuple[str, int], SessionBuffer]] = []
+        # Most recently focused first
+        for window in self.get_windows():
+            if window not in self.__windows:
+                continue
+            if window in self.__restoring:
+                # Only partly restored, so the file it's being restored from is kept instead
+                buffers.append(self.__restoring[window])
+            elif not window.is_blank():
+                buffer = window.get_buffer()
+                cursor = buffer.get_iter_at_mark(buffer.get_insert()).get_offset()
+                buffers.append((window.get_text(), cursor))
+
+        # Those without windows yet are kept too, and no longer given windows as we're quitting
+        if self.__session_source_id is not None:
+            GLib.source_remove(self.__session_source_id)
+            self.__session_source_id = None
+        buffers.extend(self.__session_pending)
+        buffers.extend(self.__session_closed)
+        self.__session_saved = True
+        self.__session_manager.save(buffers)
+
+    def __restore_session(self) -> bool:
+        """Restore the saved session.
+
+        The first window is shown straight away, the others being created over following idle
+        callbacks. Each window's text is loaded in pieces.
+        """
+        buffers = self.__session_manager.load()
+        if not buffers:
+            return False
+
+        start_time = time.monotonic()
+        remaining = len(buffers)
+
+        def restore(window: Window, buffer: SessionBuffer) -> None:
+            def on_restored() -> None:
+                nonlocal remaining
+                del self.__restoring[window]
+                # Otherwise the file has been carried into the newly saved session
+                if not self.__session_saved:
+                    self.__session_manager.remove(buffer)
+                remaining -= 1
+                if remaining == 0:
+                    elapsed = (time.monotonic() - start_time) * 1000
+                    logging.info(f"Restored session of {len(buffers)} buffers in {elapsed:.0f}ms")
+                    # Windows created since may have taken focus
+                    first_window.present()
+
+            self.__restoring[window] = buffer
+            pieces = self.__session_manager.read(buffer)
+            window.restore_text_in_pieces(pieces, buffer.cursor, on_restored)
+
+        first_window = self.__create_window()
+        restore(first_window, buffers[0])
+        logging.debug(
+            f"Session first window created in {(time.monotonic() - start_time) * 1000:.0f}ms"
+        )
+
+        self.__session_pending = buffers[1:]
+
+        def create_next() -> bool:
+            if not self.__session_pending:
+                self.__session_source_id = None
+                return GLib.SOURCE_REMOVE
+            restore(self.__create_window(focus=False), self.__session_pending.pop(0))
+            return GLib.SOURCE_CONTINUE
+
+        self.__session_source_id = GLib.idle_add(create_next, priority=GLib.PRIORITY_LOW)
+        self.__restored_at_startup = True
+        return True
+
     def __create_window_from_clipboard(self) -> None:
         window = self.__create_window()
         window.set_to_paste_during_init()
@@ -228,6 +473,26 @@ class Application(Adw.Application):
     def __on_preferences_dialog_closed(self, _dialog: GObject.Object) -> None:
         self.__preferences_dialog = None
 
+    def __show_recovery_search_dialog(self) -> None:
+        dialog = RecoverySearchDialog(self.__emergency_saves_manager)
+        window = self.get_active_window()
+        dialog.present(window)
+
+    def __show_buffer_search_dialog(self) -> None:
+        dialog = BufferSearchDialog(self.__windows)
+        window = self.get_active_window()
+        dialog.present(window)
+
+    def __open_recovery_file(self, path: str) -> None:
+        def on_loaded(text: Optional[str]) -> None:
+            if text is None:
+                logging.warning(f"Failed to open {path}")
+                return
+            window = self.__create_window()
+            window.restore_text(text, 0)
+
+        self.__emergency_saves_manager.load(path, on_loaded)
+
     @staticmethod
     def apply_style() -> None:
         """Apply style preference."""
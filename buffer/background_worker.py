@@ -0,0 +1,65 @@
+from gi.repository import GLib, GObject
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+
+class BackgroundWorker(GObject.Object):
+    """Runs tasks in submission order on a single background thread.
+
+    The thread is started on first use. Results are passed back to callbacks on the main loop.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.__name = name
+        self.__queue: queue.Queue[Optional[Callable[[], None]]] = queue.Queue()
+        self.__thread: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        task: Callable[[], Any],
+        callback: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        """Queue a task.
+
+        :param task: The function to run on the worker thread
+        :param callback: A function to call on the main loop with the task's result, or with None
+            if the task raised
+        """
+
+        def run() -> None:
+            result = None
+            try:
+                result = task()
+            except Exception as e:
+                logging.warning(f"Task on {self.__name} worker failed: %s", e)
+            if callback is not None:
+                GLib.idle_add(deliver, result)
+
+        def deliver(result: Any) -> bool:
+            assert callback is not None
+            callback(result)
+            return GLib.SOURCE_REMOVE
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name=self.__name, daemon=True)
+            self.__thread.start()
+        self.__queue.put(run)
+
+    def stop(self) -> None:
+        """Wait for queued tasks to complete and stop the thread."""
+        if self.__thread is None:
+            return
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__thread = None
+
+    def __run(self) -> None:
+        while True:
+            task = self.__queue.get()
+            if task is None:
+                break
+            task()
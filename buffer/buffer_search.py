@@ -0,0 +1,189 @@
+from gi.repository import GLib, GObject, Gtk
+
+import concurrent.futures
+import logging
+import os
+import re
+import time
+from typing import Callable, NamedTuple, Optional
+
+from buffer.search_pattern import compile_search_pattern
+
+
+class BufferSearchResult(NamedTuple):
+    start: int
+    end: int
+    line: int
+    snippet: str
+
+
+class BufferSearch(GObject.Object):
+    """Searches the text of many buffers at once.
+
+    A copy of each buffer's text is taken on the main loop, a buffer per low priority idle
+    callback, and kept until the buffer changes so that refining the search reuses it. The copies
+    are searched on a thread pool, a chunk at a time so that no thread holds the interpreter lock
+    for long, and each buffer's results passed back as soon as found.
+    """
+
+    # Marks the match in snippets
+    MATCH_START = "\x02"
+    MATCH_END = "\x03"
+    __UNMARKED = str.maketrans("", "", MATCH_START + MATCH_END)
+
+    # Characters searched between checks for a newer search
+    CHUNK = 1 << 16
+    MAX_RESULTS_PER_BUFFER = 20
+    # Characters shown either side of a match
+    SNIPPET_CONTEXT = 40
+    TITLE_LENGTH = 60
+    WORKERS = min(4, os.cpu_count() or 1)
+
+    __executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__snapshots: dict[Gtk.TextBuffer, str] = {}
+        self.__handler_ids: dict[Gtk.TextBuffer, int] = {}
+        # Used to drop results of searches which have since been superseded
+        self.__serial = 0
+        self.__source_id: Optional[int] = None
+
+    def search(
+        self,
+        query: str,
+        buffers: list[Gtk.TextBuffer],
+        on_results: Callable[[Gtk.TextBuffer, str, list[BufferSearchResult]], None],
+        on_finished: Callable[[], None],
+    ) -> None:
+        """Search buffers, superseding any search in progress.
+
+        :param str query: The text to find, ignoring case
+        :param list[Gtk.TextBuffer] buffers: The buffers
+        :param on_results: A function to call with a buffer, its title and its matches, for each
+            buffer with any
+        :param on_finished: A function to call once all buffers have been searched
+        """
+        self.cancel()
+        if BufferSearch.__executor is None:
+            BufferSearch.__executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.WORKERS, thread_name_prefix="buffer-search"
+            )
+        executor = BufferSearch.__executor
+        serial = self.__serial
+        pattern = compile_search_pattern(query, False, False, False)
+        pending = iter(buffers)
+        remaining = len(buffers)
+        start_time = time.monotonic()
+
+        def superseded() -> bool:
+            return serial != self.__serial
+
+        def run(buffer: Gtk.TextBuffer, text: str) -> None:
+            try:
+                found = self.__find(text, pattern, len(query), superseded)
+            except Exception as e:
+                logging.warning("Buffer search failed: %s", e)
+                found = (self.__title(text), [])
+            if found is not None:
+                GLib.idle_add(deliver, buffer, *found)
+
+        def deliver(buffer: Gtk.TextBuffer, title: str, results: list[BufferSearchResult]) -> bool:
+            nonlocal remaining
+            if superseded():
+                return GLib.SOURCE_REMOVE
+            remaining -= 1
+            if results:
+                on_results(buffer, title, results)
+            if remaining == 0:
+                elapsed = (time.monotonic() - start_time) * 1000
+                logging.debug(f"Searched {len(buffers)} buffers in {elapsed:.0f}ms")
+                on_finished()
+            return GLib.SOURCE_REMOVE
+
+        def submit_next() -> bool:
+            # Copies already held are submitted together, those to take one per callback
+            for buffer in pending:
+                copied = buffer in self.__snapshots
+                executor.submit(run, buffer, self.__snapshot(buffer))
+                if not copied:
+                    return GLib.SOURCE_CONTINUE
+            self.__source_id = None
+            return GLib.SOURCE_REMOVE
+
+        if remaining == 0:
+            on_finished()
+            return
+        self.__source_id = GLib.idle_add(submit_next, priority=GLib.PRIORITY_LOW)
+
+    def cancel(self) -> None:
+        """Cancel any search in progress."""
+        self.__serial += 1
+        if self.__source_id is not None:
+            GLib.source_remove(self.__source_id)
+            self.__source_id = None
+
+    def close(self) -> None:
+        """Cancel any search and drop the copies of the buffers."""
+        self.cancel()
+        for buffer, handler_id in self.__handler_ids.items():
+            buffer.disconnect(handler_id)
+        self.__handler_ids.clear()
+        self.__snapshots.clear()
+
+    def __snapshot(self, buffer: Gtk.TextBuffer) -> str:
+        text = self.__snapshots.get(buffer)
+        if text is None:
+            text = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), True)
+            self.__snapshots[buffer] = text
+            if buffer not in self.__handler_ids:
+                self.__handler_ids[buffer] = buffer.connect(
+                    "changed", lambda b: self.__snapshots.pop(b, None)
+                )
+        return text
+
+    @classmethod
+    def __find(
+        cls, text: str, pattern: re.Pattern, max_length: int, superseded: Callable[[], bool]
+    ) -> Optional[tuple[str, list[BufferSearchResult]]]:
+        results: list[BufferSearchResult] = []
+        line = 1
+        counted_to = 0
+        start = 0
+        while start < len(text) and len(results) < cls.MAX_RESULTS_PER_BUFFER:
+            if superseded():
+                return None
+            chunk_end = min(start + cls.CHUNK, len(text))
+            for match in pattern.finditer(text, start, min(chunk_end + max_length, len(text))):
+                if match.start() >= chunk_end:
+                    break
+                line += text.count("\n", counted_to, match.start())
+                counted_to = match.start()
+                results.append(
+                    BufferSearchResult(match.start(), match.end(), line, cls.__snippet(text, match))
+                )
+                if len(results) == cls.MAX_RESULTS_PER_BUFFER:
+                    break
+            start = chunk_end
+            # Let the main loop, and the other threads, take the interpreter lock
+            time.sleep(0)
+        return cls.__title(text), results
+
+    @classmethod
+    def __snippet(cls, text: str, match: re.Match) -> str:
+        before = text[max(match.start() - cls.SNIPPET_CONTEXT, 0) : match.start()]
+        after = text[match.end() : match.end() + cls.SNIPPET_CONTEXT]
+        # Any markers in the text itself are dropped, so that only the match is marked
+        return (
+            before.rsplit("\n", 1)[-1].lstrip().translate(cls.__UNMARKED)
+            + cls.MATCH_START
+            + match.group().translate(cls.__UNMARKED)
+            + cls.MATCH_END
+            + after.split("\n", 1)[0].rstrip().translate(cls.__UNMARKED)
+        )
+
+    @classmethod
+    def __title(cls, text: str) -> str:
+        # The first line with any text, as for a note's heading
+        line = re.search(r"\S.*", text[: cls.CHUNK])
+        return line.group().strip()[: cls.TITLE_LENGTH] if line is not None else ""
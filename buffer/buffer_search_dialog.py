@@ -0,0 +1,103 @@
+from gettext import gettext as _
+from gi.repository import Adw, GLib, Gtk
+
+import re
+
+from buffer.buffer_search import BufferSearch, BufferSearchResult
+from buffer.search_pattern import compile_search_pattern
+from buffer.window import Window
+
+
+@Gtk.Template(resource_path="/org/gnome/gitlab/cheywood/Buffer/ui/buffer_search_dialog.ui")
+class BufferSearchDialog(Adw.Dialog):
+    __gtype_name__ = "BufferSearchDialog"
+
+    _search_entry = Gtk.Template.Child()
+    _stack = Gtk.Template.Child()
+    _results = Gtk.Template.Child()
+
+    MATCH_MARKERS = re.compile(f"[{BufferSearch.MATCH_START}{BufferSearch.MATCH_END}]")
+    # Rows shown at most, as a list of thousands would be slow to build and of little use
+    MAX_RESULTS = 500
+
+    def __init__(self, windows: list[Window]) -> None:
+        """
+        :param list[Window] windows: The application's windows, kept current as they're closed
+        """
+        super().__init__()
+        self.__windows = windows
+        self.__search = BufferSearch()
+        self.__query = ""
+        self.__rows: dict[Gtk.ListBoxRow, tuple[Window, BufferSearchResult]] = {}
+        self.__windows_by_buffer: dict[Gtk.TextBuffer, Window] = {}
+        self.set_focus(self._search_entry)
+
+    @Gtk.Template.Callback()
+    def _on_search_changed(self, _entry: Gtk.SearchEntry) -> None:
+        self._results.remove_all()
+        self.__rows.clear()
+        self.__query = self._search_entry.get_text()
+        self._stack.set_visible_child_name("results")
+        if self.__query.strip() == "":
+            self.__search.cancel()
+            return
+
+        self.__windows_by_buffer = {window.get_buffer(): window for window in self.__windows}
+        self.__search.search(
+            self.__query,
+            list(self.__windows_by_buffer),
+            self.__add_results,
+            self.__on_search_finished,
+        )
+
+    @Gtk.Template.Callback()
+    def _on_row_activated(self, _listbox: Gtk.ListBox, row: Gtk.ListBoxRow) -> None:
+        window, result = self.__rows[row]
+        if window not in self.__windows:
+            return
+        self.close()
+        window.present()
+        # The buffer may have been edited since it was searched
+        buffer = window.get_buffer()
+        text = buffer.get_text(
+            buffer.get_iter_at_offset(result.start), buffer.get_iter_at_offset(result.end), True
+        )
+        if compile_search_pattern(self.__query, False, False, False).fullmatch(text):
+            window.select_range(result.start, result.end)
+
+    @Gtk.Template.Callback()
+    def _on_closed(self, _dialog: Adw.Dialog) -> None:
+        self.__search.close()
+
+    def __add_results(
+        self, buffer: Gtk.TextBuffer, title: str, results: list[BufferSearchResult]
+    ) -> None:
+        window = self.__windows_by_buffer.get(buffer)
+        if window is None or window not in self.__windows:
+            return
+        for result in results:
+            if len(self.__rows) == self.MAX_RESULTS:
+                return
+            row = Adw.ActionRow()
+            # Translators: Title, a buffer without text other than whitespace
+            row.set_title(GLib.markup_escape_text(title or _("Empty Buffer"), -1))
+            row.set_subtitle(self.__format_snippet(result.snippet))
+            row.set_activatable(True)
+            # Translators: Description, {0} a line number
+            line = Gtk.Label(label=_("Line {0}").format(result.line))
+            line.add_css_class("dim-label")
+            row.add_suffix(line)
+            self.__rows[row] = (window, result)
+            self._results.append(row)
+
+    def __on_search_finished(self) -> None:
+        self._stack.set_visible_child_name("results" if self.__rows else "empty")
+
+    @staticmethod
+    def __format_snippet(snippet: str) -> str:
+        markup = ""
+        # The match alternates with the surrounding text
+        for i, part in enumerate(BufferSearchDialog.MATCH_MARKERS.split(snippet)):
+            part = GLib.markup_escape_text(re.sub(r"\s+", " ", part), -1)
+            markup += f"<b>{part}</b>" if i % 2 else part
+        return markup
@@ -1,24 +1,106 @@
 from gi.repository import Gio, GLib
 
-from typing import Optional
+from typing import Any, Callable, Optional
+import weakref
 
 from buffer import const
 
 settings = Gio.Settings.new(const.APP_ID)
 
 FONT_SIZE = "font-size"
+CLEAN_PASTED_TEXT = "clean-pasted-text"
 EMERGENCY_RECOVERY_FILES = "emergency-recovery-files"
+EMERGENCY_RECOVERY_MAX_AGE = "emergency-recovery-max-age"
+EMERGENCY_RECOVERY_MAX_SIZE = "emergency-recovery-max-size"
 LAST_LAUNCHED_VERSION = "last-launched-version"
 LINE_LENGTH = "line-length"
 SHOW_CLOSE_BUTTON = "show-close-button"
 SHOW_LINE_NUMBERS = "show-line-numbers"
 SPELLING_ENABLED = "spelling-enabled"
 SPELLING_LANGUAGE = "spelling-language"
+SPELLING_RELAXED_THRESHOLD = "spelling-relaxed-threshold"
 STYLE = "style-variant"
 QUIT_CLOSES_WINDOW = "quit-closes-window"
+RESTORE_SESSION = "restore-session"
+SEARCH_COUNT_CAP = "search-count-cap"
+SEARCH_RELAXED_THRESHOLD = "search-relaxed-threshold"
 USE_MONOSPACE_FONT = "use-monospace-font"
 WINDOW_SIZE = "window-size"
 
+# Typed mirror of all keys, kept current from change notifications so that reads on hot paths
+# don't go through GSettings. Connected before anything else, so it's updated ahead of other
+# handlers, and filled once connected as changes are only notified for keys read since.
+_values: dict[str, Any] = {}
+
+
+# Changes are held back and written after a quiet period (milliseconds), so that rapid
+# adjustments such as key repeat are written once. The held back values are visible, and change
+# notifications emitted, straight away.
+WRITE_DELAY = 500
+_apply_source_id: Optional[int] = None
+
+
+# Methods to call on change of each key, held weakly so that subscribing doesn't keep objects
+# alive. Entries are dropped as their objects are finalised.
+_subscribers: dict[str, list[weakref.WeakMethod]] = {}
+
+
+def _on_changed(_settings: Gio.Settings, key: str) -> None:
+    global _apply_source_id
+    _values[key] = settings.get_value(key).unpack()
+    if settings.get_has_unapplied():
+        if _apply_source_id is not None:
+            GLib.source_remove(_apply_source_id)
+        _apply_source_id = GLib.timeout_add(WRITE_DELAY, _on_apply_timeout)
+
+    # Copied as subscribers may be added or dropped by the calls
+    for reference in list(_subscribers.get(key, ())):
+        method = reference()
+        if method is not None:
+            method()
+
+
+def _on_apply_timeout() -> bool:
+    global _apply_source_id
+    _apply_source_id = None
+    settings.apply()
+    return GLib.SOURCE_REMOVE
+
+
+settings.connect("changed", _on_changed)
+_values.update(
+    (key, settings.get_value(key).unpack()) for key in settings.props.settings_schema.list_keys()
+)
+settings.delay()
+
+
+def subscribe(key: str, method: Callable[[], None]) -> None:
+    """Call a method on change of a setting, for as long as its object is alive.
+
+    Unlike connecting to the settings directly, the subscription doesn't keep the object alive,
+    so closed windows and their widgets can be freed.
+
+    :param str key: The setting key
+    :param method: A bound method, called without arguments
+    """
+    subscribers = _subscribers.setdefault(key, [])
+    subscribers.append(weakref.WeakMethod(method, subscribers.remove))
+
+
+def flush() -> None:
+    """Write any held back changes, waiting for completion."""
+    global _apply_source_id
+    if _apply_source_id is not None:
+        GLib.source_remove(_apply_source_id)
+        _apply_source_id = None
+    settings.apply()
+    Gio.Settings.sync()
+
+
+_line_length_max: int = (
+    settings.get_property("settings-schema").get_key(LINE_LENGTH).get_range()[1][-1]
+)
+
 
 def get_font_size() -> int:
     """Get font size.
@@ -26,7 +108,7 @@ def get_font_size() -> int:
     :return: Size
     :rtype: int
     """
-    return settings.get_int(FONT_SIZE)
+    return _values[FONT_SIZE]
 
 
 def set_font_size(value: int) -> None:
@@ -46,13 +128,30 @@ def get_default_font_size() -> int:
     return settings.get_default_value(FONT_SIZE).get_int32()
 
 
+def get_clean_pasted_text() -> bool:
+    """Get whether to normalise line endings and remove control characters when pasting.
+
+    :return: Clean pasted text
+    :rtype: bool
+    """
+    return _values[CLEAN_PASTED_TEXT]
+
+
+def set_clean_pasted_text(value: bool) -> None:
+    """Set whether to normalise line endings and remove control characters when pasting.
+
+    :param bool value: New value
+    """
+    settings.set_boolean(CLEAN_PASTED_TEXT, value)
+
+
 def get_emergency_recover_files() -> int:
     """Get the number of emergency recovery files.
 
     :return: Number to save
     :rtype: int
     """
-    return settings.get_int(EMERGENCY_RECOVERY_FILES)
+    return _values[EMERGENCY_RECOVERY_FILES]
 
 
 def set_emergency_recover_files(value: int) -> None:
@@ -63,13 +162,47 @@ def set_emergency_recover_files(value: int) -> None:
     settings.set_int(EMERGENCY_RECOVERY_FILES, value)
 
 
+def get_emergency_recovery_max_age() -> int:
+    """Get the age after which emergency recovery files are removed.
+
+    :return: Age in days, 0 for unlimited
+    :rtype: int
+    """
+    return _values[EMERGENCY_RECOVERY_MAX_AGE]
+
+
+def set_emergency_recovery_max_age(value: int) -> None:
+    """Set the age after which emergency recovery files are removed.
+
+    :param int value: New value
+    """
+    settings.set_int(EMERGENCY_RECOVERY_MAX_AGE, value)
+
+
+def get_emergency_recovery_max_size() -> int:
+    """Get the total size of emergency recovery files to keep.
+
+    :return: Size in MiB, 0 for unlimited
+    :rtype: int
+    """
+    return _values[EMERGENCY_RECOVERY_MAX_SIZE]
+
+
+def set_emergency_recovery_max_size(value: int) -> None:
+    """Set the total size of emergency recovery files to keep.
+
+    :param int value: New value
+    """
+    settings.set_int(EMERGENCY_RECOVERY_MAX_SIZE, value)
+
+
 def get_last_launched_version() -> str:
     """Get the last version which was run.
 
     :return: Version
     :rtype: str
     """
-    return settings.get_string(LAST_LAUNCHED_VERSION)
+    return _values[LAST_LAUNCHED_VERSION]
 
 
 def set_last_launched_version(value: str) -> None:
@@ -86,7 +219,7 @@ def get_line_length() -> int:
     :return: Size in pixels
     :rtype: int
     """
-    return settings.get_int(LINE_LENGTH)
+    return _values[LINE_LENGTH]
 
 
 def set_line_length(value: int) -> None:
@@ -103,7 +236,7 @@ def get_line_length_max() -> int:
     :return: Size in pixels
     :rtype: int
     """
-    return settings.get_property("settings-schema").get_key(LINE_LENGTH).get_range()[1][-1]
+    return _line_length_max
 
 
 def get_use_monospace_font() -> bool:
@@ -112,7 +245,7 @@ def get_use_monospace_font() -> bool:
     :return: Using monospace font
     :rtype: bool
     """
-    return settings.get_value(USE_MONOSPACE_FONT)
+    return _values[USE_MONOSPACE_FONT]
 
 
 def set_use_monospace_font(value: bool) -> None:
@@ -123,13 +256,47 @@ def set_use_monospace_font(value: bool) -> None:
     settings.set_boolean(USE_MONOSPACE_FONT, value)
 
 
+def get_search_count_cap() -> int:
+    """Get the number of search matches above which the count is shown as a lower bound.
+
+    :return: Number of matches
+    :rtype: int
+    """
+    return _values[SEARCH_COUNT_CAP]
+
+
+def set_search_count_cap(value: int) -> None:
+    """Set the number of search matches above which the count is shown as a lower bound.
+
+    :param int value: New value
+    """
+    settings.set_int(SEARCH_COUNT_CAP, value)
+
+
+def get_search_relaxed_threshold() -> int:
+    """Get the buffer size above which search matches are counted in the background.
+
+    :return: Size in characters, 0 for no limit
+    :rtype: int
+    """
+    return _values[SEARCH_RELAXED_THRESHOLD]
+
+
+def set_search_relaxed_threshold(value: int) -> None:
+    """Set the buffer size above which search matches are counted in the background.
+
+    :param int value: New value
+    """
+    settings.set_int(SEARCH_RELAXED_THRESHOLD, value)
+
+
 def get_show_close_button() -> bool:
     """Get whether to show a close button on each window.
 
     :return: Whether to show
     :rtype: bool
     """
-    return settings.get_value(SHOW_CLOSE_BUTTON)
+    return _values[SHOW_CLOSE_BUTTON]
 
 
 def set_show_close_button(value: bool) -> None:
@@ -146,7 +313,7 @@ def get_show_line_numbers() -> bool:
     :return: Whether to show
     :rtype: bool
     """
-    return settings.get_value(SHOW_LINE_NUMBERS)
+    return _values[SHOW_LINE_NUMBERS]
 
 
 def set_show_line_numbers(value: bool) -> None:
@@ -163,7 +330,7 @@ def get_spelling_enabled() -> bool:
     :return: Spelling enabled
     :rtype: bool
     """
-    return settings.get_value(SPELLING_ENABLED)
+    return _values[SPELLING_ENABLED]
 
 
 def set_spelling_enabled(value: bool) -> None:
@@ -180,7 +347,7 @@ def get_spelling_language() -> Optional[str]:
     :return Language tag or None if empty
     :rtype: str
     """
-    lang = settings.get_string(SPELLING_LANGUAGE)
+    lang = _values[SPELLING_LANGUAGE]
     if lang.strip() == "":
         lang = None
     return lang
@@ -194,13 +361,30 @@ def set_spelling_language(value: str) -> None:
     settings.set_string(SPELLING_LANGUAGE, value)
 
 
+def get_spelling_relaxed_threshold() -> int:
+    """Get the buffer size above which spell checking follows the visible region in batches.
+
+    :return: Size in characters, 0 for no limit
+    :rtype: int
+    """
+    return _values[SPELLING_RELAXED_THRESHOLD]
+
+
+def set_spelling_relaxed_threshold(value: int) -> None:
+    """Set the buffer size above which spell checking follows the visible region in batches.
+
+    :param int value: New value
+    """
+    settings.set_int(SPELLING_RELAXED_THRESHOLD, value)
+
+
 def get_style() -> str:
     """Get style.
 
     :return: Style
     :rtype: str
     """
-    return settings.get_string(STYLE)
+    return _values[STYLE]
 
 
 def set_style(value: str) -> None:
@@ -217,7 +401,7 @@ def get_quit_closes_window() -> bool:
     :return: Quit closes window
     :rtype: bool
     """
-    return settings.get_value(QUIT_CLOSES_WINDOW)
+    return _values[QUIT_CLOSES_WINDOW]
 
 
 def set_quit_closes_window(value: bool) -> None:
@@ -228,13 +412,31 @@ def set_quit_closes_window(value: bool) -> None:
     settings.set_boolean(QUIT_CLOSES_WINDOW, value)
 
 
-def get_window_size() -> GLib.Variant:
+def get_restore_session() -> bool:
+    """Get whether to restore open buffers on the next launch after quitting.
+
+    :return: Restore session
+    :rtype: bool
+    """
+    return _values[RESTORE_SESSION]
+
+
+def set_restore_session(value: bool) -> None:
+    """Set whether to restore open buffers on the next launch after quitting.
+
+    :param bool value: New value
+    """
+    settings.set_boolean(RESTORE_SESSION, value)
+
+
+def get_window_size() -> tuple[int, int]:
     """Get window size.
 
     :return: The size
-    :rtype: GLib.Variant
+    :rtype: tuple[int, int]
     """
-    return settings.get_value(WINDOW_SIZE)
+    width, height = _values[WINDOW_SIZE]
+    return (width, height)
 
 
 def set_window_size(width: int, height: int) -> None:
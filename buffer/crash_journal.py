@@ -0,0 +1,399 @@
+from gi.repository import GLib, GObject, Gtk
+
+import json
+import logging
+import os
+import uuid
+from typing import Optional
+
+from buffer.background_worker import BackgroundWorker
+
+INSERT = "i"
+DELETE = "d"
+CURSOR = "c"
+
+
+class CrashJournal(GObject.Object):
+    """Append-only record of the edits made to a single text buffer.
+
+    Edits are captured as insert and delete deltas against a snapshot. Recording an edit only
+    appends to an in-memory list, the list is written out by the manager's worker thread.
+    """
+
+    # Avoid merging typing into a large pending insert (eg. a paste) as that copies the string
+    MAX_MERGED_INSERT_LENGTH = 4096
+
+    def __init__(self, directory: str, journal_id: str) -> None:
+        super().__init__()
+        self.id = journal_id
+        self.__directory = directory
+        self.__buffer: Optional[Gtk.TextBuffer] = None
+        self.__handler_ids: list[int] = []
+        self.__pending: list[list] = []
+        self.__last_cursor = -1
+
+        # Only accessed from the worker thread
+        self.__generation = 0
+        self.__records_in_journal = 0
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.__directory, f"{self.id}.snapshot")
+
+    def journal_path(self, generation: int) -> str:
+        """Get the path of the journal for a snapshot generation.
+
+        :param int generation: Snapshot generation
+        :return: Path
+        :rtype: str
+        """
+        return os.path.join(self.__directory, f"{self.id}-{generation}.journal")
+
+    def attach(self, buffer: Gtk.TextBuffer) -> None:
+        """Start recording the edits made to a buffer.
+
+        :param Gtk.TextBuffer buffer: The buffer
+        """
+        self.__buffer = buffer
+        self.__handler_ids = [
+            buffer.connect("insert-text", self.__on_insert_text),
+            buffer.connect("delete-range", self.__on_delete_range),
+        ]
+        self.__last_cursor = buffer.get_iter_at_mark(buffer.get_insert()).get_offset()
+
+    def detach(self) -> None:
+        """Stop recording edits."""
+        if self.__buffer is None:
+            return
+        for handler_id in self.__handler_ids:
+            self.__buffer.disconnect(handler_id)
+        self.__handler_ids = []
+        self.__buffer = None
+
+    def take_pending(self) -> list[list]:
+        """Take the records accumulated since the last call.
+
+        :return: The records
+        :rtype: list[list]
+        """
+        if self.__buffer is not None:
+            cursor = self.__buffer.get_iter_at_mark(self.__buffer.get_insert()).get_offset()
+            if cursor != self.__last_cursor:
+                self.__pending.append([CURSOR, cursor])
+                self.__last_cursor = cursor
+        records = self.__pending
+        self.__pending = []
+        return records
+
+    def load(self) -> tuple[str, int]:
+        """Rebuild the buffer contents from the snapshot and journal.
+
+        Called from the worker thread, or before the journal is attached.
+
+        :return: The text and cursor offset
+        :rtype: tuple[str, int]
+        """
+        text = ""
+        cursor = 0
+        self.__generation = 0
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8", newline="") as f:
+                header = json.loads(f.readline())
+                self.__generation = header["generation"]
+                cursor = header["cursor"]
+                text = f.read()
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Failed to read journal snapshot {self.snapshot_path}: %s", e)
+
+        records = []
+        try:
+            with open(self.journal_path(self.__generation), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A torn final write from the crash
+                        break
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Failed to read journal {self.id}: %s", e)
+
+        self.__records_in_journal = len(records)
+        return replay(text, cursor, records)
+
+    def write(self, records: list[list], compact_after: int) -> None:
+        """Append records to the journal, compacting it into a new snapshot when it grows.
+
+        Called from the worker thread.
+
+        :param list[list] records: The records
+        :param int compact_after: Number of records to allow before compacting
+        """
+        path = self.journal_path(self.__generation)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                    f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logging.warning(f"Failed to write journal {path}: %s", e)
+            return
+
+        self.__records_in_journal += len(records)
+        if self.__records_in_journal >= compact_after:
+            self.compact()
+
+    def write_snapshot(self, text: str, cursor: int) -> None:
+        """Replace the snapshot, starting a new journal generation.
+
+        Called from the worker thread.
+
+        :param str text: The full buffer text
+        :param int cursor: Cursor offset
+        """
+        previous_generation = self.__generation
+        generation = previous_generation + 1
+        temp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8", newline="") as f:
+                f.write(json.dumps({"generation": generation, "cursor": cursor}))
+                f.write("\n")
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            logging.warning(f"Failed to write journal snapshot {self.snapshot_path}: %s", e)
+            return
+
+        self.__generation = generation
+        self.__records_in_journal = 0
+        try:
+            os.unlink(self.journal_path(previous_generation))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Failed to remove compacted journal {self.id}: %s", e)
+
+    def compact(self) -> None:
+        """Fold the journal into a new snapshot.
+
+        Called from the worker thread.
+        """
+        text, cursor = self.load()
+        self.write_snapshot(text, cursor)
+        logging.debug(f"Compacted journal {self.id}")
+
+    def remove_files(self) -> None:
+        """Remove the snapshot and journal.
+
+        Called from the worker thread.
+        """
+        for path in (self.snapshot_path, self.journal_path(self.__generation)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Failed to remove {path}: %s", e)
+
+    def __on_insert_text(
+        self, _buffer: Gtk.TextBuffer, location: Gtk.TextIter, text: str, _length: int
+    ) -> None:
+        offset = location.get_offset()
+        if self.__pending:
+            last = self.__pending[-1]
+            if (
+                last[0] == INSERT
+                and last[1] + len(last[2]) == offset
+                and len(last[2]) < self.MAX_MERGED_INSERT_LENGTH
+            ):
+                last[2] += text
+                return
+        self.__pending.append([INSERT, offset, text])
+
+    def __on_delete_range(
+        self, _buffer: Gtk.TextBuffer, start: Gtk.TextIter, end: Gtk.TextIter
+    ) -> None:
+        start_offset = start.get_offset()
+        end_offset = end.get_offset()
+        if self.__pending:
+            last = self.__pending[-1]
+            if last[0] == DELETE:
+                if end_offset == last[1]:
+                    # Backspace
+                    last[1] = start_offset
+                    return
+                elif start_offset == last[1]:
+                    # Delete
+                    last[2] += end_offset - start_offset
+                    return
+        self.__pending.append([DELETE, start_offset, end_offset])
+
+
+class CrashJournalManager(GObject.Object):
+    """Journals open buffers so that they can be restored after a crash.
+
+    All file access happens on a single worker thread, which keeps per journal ordering simple.
+    """
+
+    DIRECTORY = os.path.join(GLib.get_user_data_dir(), "buffer", "journal")
+    FLUSH_INTERVAL = 2
+    COMPACT_AFTER_RECORDS = 2000
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__journals: list[CrashJournal] = []
+        self.__worker = BackgroundWorker("crash-journal")
+        self.__flush_source_id: Optional[int] = None
+
+    def create_journal(self, buffer: Gtk.TextBuffer) -> Optional[CrashJournal]:
+        """Start journaling a buffer.
+
+        :param Gtk.TextBuffer buffer: The buffer
+        :return: The journal, or None on failure
+        :rtype: Optional[CrashJournal]
+        """
+        if not self.__init_directory():
+            return None
+
+        journal = CrashJournal(self.DIRECTORY, uuid.uuid4().hex)
+        if buffer.get_char_count() > 0:
+            text = buffer.get_property("text")
+            cursor = buffer.get_iter_at_mark(buffer.get_insert()).get_offset()
+            self.__worker.submit(lambda: journal.write_snapshot(text, cursor))
+        journal.attach(buffer)
+        self.__add(journal)
+        return journal
+
+    def recover(self) -> list[tuple[CrashJournal, str, int]]:
+        """Load journals left behind by a previous run.
+
+        The returned journals need to be attached once their text has been restored.
+
+        :return: The journals along with their text and cursor offset
+        :rtype: list[tuple[CrashJournal, str, int]]
+        """
+        if not os.path.isdir(self.DIRECTORY):
+            return []
+
+        ids = set()
+        for entry in os.scandir(self.DIRECTORY):
+            name, extension = os.path.splitext(entry.name)
+            if extension == ".snapshot":
+                ids.add(name)
+            elif extension == ".journal":
+                ids.add(name.rsplit("-", 1)[0])
+
+        recovered = []
+        for journal_id in sorted(ids):
+            journal = CrashJournal(self.DIRECTORY, journal_id)
+            text, cursor = journal.load()
+            if text == "":
+                journal.remove_files()
+                continue
+            logging.info(f"Recovered journal {journal_id}")
+            self.__add(journal)
+            recovered.append((journal, text, cursor))
+        return recovered
+
+    def discard(self, journal: CrashJournal) -> None:
+        """Stop journaling a buffer and remove its files.
+
+        :param CrashJournal journal: The journal
+        """
+        journal.detach()
+        if journal in self.__journals:
+            self.__journals.remove(journal)
+        self.__worker.submit(journal.remove_files)
+
+    def shutdown(self) -> None:
+        """Flush any pending records and stop the worker."""
+        self.__flush()
+        self.__worker.stop()
+
+    def __add(self, journal: CrashJournal) -> None:
+        self.__journals.append(journal)
+        if self.__flush_source_id is None:
+            self.__flush_source_id = GLib.timeout_add_seconds(
+                self.FLUSH_INTERVAL, self.__on_flush_timeout
+            )
+
+    def __on_flush_timeout(self) -> bool:
+        self.__flush()
+        if self.__journals:
+            return GLib.SOURCE_CONTINUE
+        self.__flush_source_id = None
+        return GLib.SOURCE_REMOVE
+
+    def __flush(self) -> None:
+        for journal in self.__journals:
+            records = journal.take_pending()
+            if records:
+                self.__worker.submit(
+                    lambda j=journal, r=records: j.write(r, self.COMPACT_AFTER_RECORDS)
+                )
+
+    def __init_directory(self) -> bool:
+        if not os.path.exists(self.DIRECTORY):
+            try:
+                os.makedirs(self.DIRECTORY)
+            except OSError as e:
+                logging.warning(f"Failed to create journal directory {self.DIRECTORY}: %s", e)
+                return False
+        return True
+
+
+def replay(text: str, cursor: int, records: list[list]) -> tuple[str, int]:
+    """Apply journal records to a snapshot.
+
+    The text is held in chunks while replaying so that each edit only copies a chunk rather than
+    the whole text, keeping replay of large buffers linear.
+
+    :param str text: Snapshot text
+    :param int cursor: Snapshot cursor offset
+    :param list[list] records: The records
+    :return: The resulting text and cursor offset
+    :rtype: tuple[str, int]
+    """
+    chunk_size = 65536
+    chunks = [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+
+    def locate(offset: int) -> tuple[int, int]:
+        for index, chunk in enumerate(chunks):
+            if offset <= len(chunk):
+                return index, offset
+            offset -= len(chunk)
+        return len(chunks) - 1, len(chunks[-1])
+
+    for record in records:
+        if record[0] == INSERT:
+            index, local = locate(record[1])
+            chunk = chunks[index]
+            chunk = chunk[:local] + record[2] + chunk[local:]
+            if len(chunk) > 2 * chunk_size:
+                chunks[index : index + 1] = [
+                    chunk[i : i + chunk_size] for i in range(0, len(chunk), chunk_size)
+                ]
+            else:
+                chunks[index] = chunk
+        elif record[0] == DELETE:
+            remaining = record[2] - record[1]
+            index, local = locate(record[1])
+            while remaining > 0 and index < len(chunks):
+                chunk = chunks[index]
+                removed = min(remaining, len(chunk) - local)
+                chunks[index] = chunk[:local] + chunk[local + removed :]
+                remaining -= removed
+                index += 1
+                local = 0
+        elif record[0] == CURSOR:
+            cursor = record[1]
+
+    text = "".join(chunks)
+    return text, min(cursor, len(text))
@@ -0,0 +1,53 @@
+from gi.repository import Gdk, GLib, GObject, Gtk
+
+from typing import Optional
+
+
+class CursorMarginKeeper(GObject.Object):
+    """Keeps a margin between the cursor and the bottom of a scrolled text view.
+
+    The check runs at most once per frame, however many changes are made in between, and skips
+    the geometry lookup when neither the cursor nor the scroll position has moved since the last.
+    """
+
+    MARGIN_BELOW_CURSOR = 22
+
+    def __init__(self, view: Gtk.TextView, scrolled_window: Gtk.ScrolledWindow) -> None:
+        """
+        :param Gtk.TextView view: The view
+        :param Gtk.ScrolledWindow scrolled_window: The scrolled window holding the view
+        """
+        super().__init__()
+        self.__view = view
+        self.__scrolled_window = scrolled_window
+        self.__tick_id: Optional[int] = None
+        self.__last_state: Optional[tuple[int, int, float, float]] = None
+        view.get_buffer().connect("changed", lambda _o: self.queue_check())
+
+    def queue_check(self) -> None:
+        """Check the margin on the next frame."""
+        if self.__tick_id is None:
+            self.__tick_id = self.__view.add_tick_callback(self.__on_tick)
+
+    def __on_tick(self, _widget: Gtk.Widget, _frame_clock: Gdk.FrameClock) -> bool:
+        self.__tick_id = None
+        self.__check()
+        return GLib.SOURCE_REMOVE
+
+    def __check(self) -> None:
+        buffer = self.__view.get_buffer()
+        insert = buffer.get_iter_at_mark(buffer.get_insert())
+        adj = self.__scrolled_window.get_vadjustment()
+
+        # Skip the geometry lookup when nothing has moved since the last check
+        state = (insert.get_offset(), buffer.get_line_count(), adj.get_value(), adj.get_page_size())
+        if state == self.__last_state:
+            return
+        self.__last_state = state
+
+        rect = self.__view.get_iter_location(insert)
+        lowest_visible = self.__view.get_top_margin() + rect.y + rect.height
+        visible_below_cursor = adj.get_value() + adj.get_page_size() - lowest_visible
+        if visible_below_cursor < self.MARGIN_BELOW_CURSOR:
+            scroll_to = lowest_visible + self.MARGIN_BELOW_CURSOR - adj.get_page_size()
+            adj.set_value(scroll_to)
@@ -1,6 +1,8 @@
 from gettext import gettext as _
 from gi.repository import GObject, Gtk
 
+from typing import Optional
+
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/cheywood/Buffer/ui/editor_search_entry.ui")
 class EditorSearchEntry(Gtk.Box):
@@ -14,15 +16,18 @@ class EditorSearchEntry(Gtk.Box):
 
     def __init__(self) -> None:
         self.__occurrence_count = 0
+        self.__occurrence_count_exact = True
         self.__occurrence_position = 0
         super().__init__()
 
-    def set_occurrence_count(self, count: int) -> None:
+    def set_occurrence_count(self, count: int, exact: bool = True) -> None:
         """Set the number of search term occurrences.
 
         :param int count: New value
+        :param bool exact: Whether the count is final, rather than a lower bound while counting
         """
         self.__occurrence_count = count
+        self.__occurrence_count_exact = exact
         self.__update_position()
 
     def set_occurrence_position(self, position: int) -> None:
@@ -33,6 +38,17 @@ class EditorSearchEntry(Gtk.Box):
         self.__occurrence_position = position
         self.__update_position()
 
+    def set_error(self, message: Optional[str]) -> None:
+        """Show that the search term is in error, as for an invalid regular expression.
+
+        :param Optional[str] message: The error, or None to clear
+        """
+        if message is None:
+            self.remove_css_class("error")
+        else:
+            self.add_css_class("error")
+        self.set_tooltip_text(message)
+
     def select_all_and_focus(self) -> None:
         """Select and focus all text."""
         if self.text.get_text() != "":
@@ -61,6 +77,10 @@ class EditorSearchEntry(Gtk.Box):
     def __update_position(self) -> None:
         if self.__occurrence_count == 0:
             occurrence_str = ""
+        elif not self.__occurrence_count_exact:
+            # Translators: Description, {0} a number of search results, more of which are still
+            # being counted
+            occurrence_str = _("{0}+").format(self.__occurrence_count)
         else:
             # Translators: Description, {0} the current position in {1} a number of search results
             occurrence_str = _("{0} of {1}").format(
@@ -1,10 +1,24 @@
 import gi
 
 gi.require_version("GtkSource", "5")
-from gi.repository import Gio, GObject, Gtk, GtkSource
+from gi.repository import Gio, GLib, GObject, Gtk, GtkSource
 
+from gettext import gettext as _
+import logging
+import re
+import time
 from typing import Optional
 
+import buffer.config_manager as config_manager
+from buffer.search_match_tracker import SearchMatchTracker
+from buffer.search_pattern import (
+    MatchTimeout,
+    compile_search_pattern,
+    max_match_length,
+    time_limit,
+)
+from buffer.viewport_search_highlighter import ViewportSearchHighlighter
+
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/cheywood/Buffer/ui/editor_search_header_bar.ui")
 class EditorSearchHeaderBar(Gtk.Box):
@@ -12,6 +26,7 @@ class EditorSearchHeaderBar(Gtk.Box):
     __gsignals__ = {
         "resumed": (GObject.SignalFlags.RUN_FIRST, None, ()),
         "open-for-replace": (GObject.SignalFlags.RUN_FIRST, None, ()),
+        "replaced-all": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
     }
 
     _search_entry = Gtk.Template.Child()
@@ -21,24 +36,40 @@ class EditorSearchHeaderBar(Gtk.Box):
     _replace_entry = Gtk.Template.Child()
     _replace_toggle = Gtk.Template.Child()
 
+    # Milliseconds to wait for typing to pause before searching buffers larger than the threshold
+    # number of characters, as each change of term rescans the buffer
+    SEARCH_DELAY = 150
+    SEARCH_DELAY_THRESHOLD = 200000
+    # Seconds matching the whole buffer for replace all may take, longer than when searching as
+    # it's a one off at the user's request
+    REPLACE_ALL_TIME_LIMIT = 2.0
+    # Number of matches above which replace all edits the buffer once across the matched span
+    REPLACE_ALL_SPAN_THRESHOLD = 1000
+
     def __init__(self) -> None:
         super().__init__()
 
-        self.__settings = GtkSource.SearchSettings.new()
-        self.__settings.set_wrap_around(True)
-        self._search_entry.text.bind_property(
-            "text",
-            self.__settings,
-            "search-text",
-        )
-        self.__context: Optional[GtkSource.SearchContext] = None
         self.__offset_when_entered = 0
-        self.__context_signal_handler_id = None
         self.__cursor_signal_handler_id = None
+        self.__changed_signal_handler_id = None
         self.__current_match_tag = None
+        # Bounds of the one range tagged as the current match, kept by marks through edits
+        self.__current_match_marks: Optional[tuple[Gtk.TextMark, Gtk.TextMark]] = None
         self.__avoid_jumping_during_replace = False
         self.__active = False
         self.__restarting_with_nonempty_term = False
+        # The term searched for, applied from the entry once typing pauses
+        self.__search_text = ""
+        # The term compiled with the search options, None if empty or invalid
+        self.__pattern: Optional[re.Pattern] = None
+        # Whether matches are counted in the background, navigation not waiting for the count, for
+        # large buffers
+        self.__relaxed = False
+        self.__search_text_source_id: Optional[int] = None
+        # The term and offset of its first match, from which a longer term can be sought
+        self.__narrowing_term = ""
+        self.__narrowing_offset: Optional[int] = None
+        self.__typed_time: Optional[float] = None
 
         self._search_entry.text.connect(
             "notify::text", lambda _o, _v: self.__on_search_text_changed()
@@ -47,11 +78,15 @@ class EditorSearchHeaderBar(Gtk.Box):
         self._revealer.bind_property(
             "child-revealed", self._replace_toggle, "active", GObject.BindingFlags.SYNC_CREATE
         )
+        self._replace_entry.connect("changed", lambda _o: self.__set_replace_error(None))
 
     def setup(self, sourceview: GtkSource.View) -> None:
         """Perform initial setup."""
         self.__setup_actions()
         self.__sourceview = sourceview
+        self.__match_tracker = SearchMatchTracker(sourceview.get_buffer())
+        self.__match_tracker.connect("changed", lambda _o: self.__on_matches_changed())
+        self.__highlighter = ViewportSearchHighlighter(sourceview)
 
     def enter(self, resuming: bool, for_replace: bool) -> None:
         """Enter search.
@@ -60,7 +95,6 @@ class EditorSearchHeaderBar(Gtk.Box):
         :param bool for_replace: Whether opening directly from a ctrl-h shortcut
         """
         buffer = self.__sourceview.get_buffer()
-        self.__context = GtkSource.SearchContext.new(buffer, self.__settings)
         insert_iter = buffer.get_iter_at_mark(buffer.get_insert())
         self.__offset_when_entered = insert_iter.get_offset()
         self.__setup_current_match_styling()
@@ -77,26 +111,30 @@ class EditorSearchHeaderBar(Gtk.Box):
         elif self._search_entry.get_text() != "":
             self._search_entry.text.select_region(0, -1)
 
-        self.__context_signal_handler_id = self.__context.connect(
-            "notify::occurrences-count", lambda _o, _v: self.__occurrences_count_changed()
-        )
         self.__cursor_signal_handler_id = buffer.connect(
             "cursor-moved", lambda _o: self.__on_cursor_moved()
         )
+        self.__changed_signal_handler_id = buffer.connect(
+            "changed", lambda _o: self.__on_buffer_changed()
+        )
         self.__replace_action.set_enabled(False)
         self.__active = True
 
+        self.__track_search_text()
+        if self.__search_text:
+            self.__jump_to_first()
+
     def exit(self) -> None:
         """Exit search."""
+        self.__apply_pending_search_text()
+        self.__narrowing_offset = None
         buffer = self.__sourceview.get_buffer()
         buffer.disconnect(self.__cursor_signal_handler_id)
-        if self.__context:
-            self.__context.disconnect(self.__context_signal_handler_id)
-            self.__context = None
-        begin, end = buffer.get_bounds()
-        if self.__current_match_tag:
-            buffer.remove_tag(self.__current_match_tag, begin, end)
-            self.__current_match_tag = None
+        buffer.disconnect(self.__changed_signal_handler_id)
+        self.__match_tracker.stop()
+        self.__highlighter.set_pattern(None)
+        self.__clear_current_match()
+        self.__current_match_tag = None
         self._revealer.set_reveal_child(False)
         self.__active = False
 
@@ -150,15 +188,30 @@ class EditorSearchHeaderBar(Gtk.Box):
         action_group.add_action(action)
         self.__replace_action = action
 
+        action = Gio.SimpleAction.new("replace-all")
+        action.connect("activate", lambda _o, _v: self.__replace_all())
+        action_group.add_action(action)
+        action.set_enabled(False)
+        self.__replace_all_action = action
+
+        for name in ("case-sensitive", "whole-words", "regex"):
+            action = Gio.SimpleAction.new_stateful(name, None, GLib.Variant.new_boolean(False))
+            action.connect("change-state", self.__on_search_option_changed)
+            action_group.add_action(action)
+
         self.__action_group = action_group
         app.get_active_window().insert_action_group("editor-search", action_group)
 
-    def __on_context_forward(
-        self, context: GtkSource.SearchContext, result: Gio.AsyncResult
+    def __show_forward_match(
+        self,
+        success: bool,
+        match_start: Optional[Gtk.TextIter],
+        match_end: Optional[Gtk.TextIter],
+        first: bool,
     ) -> None:
-        if not self.__current_match_tag:
-            return
-        success, match_start, match_end, __ = context.forward_finish(result)
+        self.__log_typing_latency()
+        if first and success:
+            self.__narrowing_offset = match_start.get_offset()
         if success:
             buffer = self.__sourceview.get_buffer()
             if self.__restarting_with_nonempty_term:
@@ -172,12 +225,12 @@ class EditorSearchHeaderBar(Gtk.Box):
             self.__restarting_with_nonempty_term = False
         self.__replace_action.set_enabled(success)
 
-    def __on_context_backward(
-        self, context: GtkSource.SearchContext, result: Gio.AsyncResult
+    def __show_backward_match(
+        self,
+        success: bool,
+        match_start: Optional[Gtk.TextIter],
+        match_end: Optional[Gtk.TextIter],
     ) -> None:
-        if not self.__current_match_tag:
-            return
-        success, match_start, match_end, __ = context.backward_finish(result)
         if success:
             buffer = self.__sourceview.get_buffer()
             buffer.select_range(match_start, match_end)
@@ -186,31 +239,142 @@ class EditorSearchHeaderBar(Gtk.Box):
             self.__update_for_current_match(match_start, match_end)
         self.__replace_action.set_enabled(success)
 
+    def __on_search_option_changed(self, action: Gio.SimpleAction, value: GLib.Variant) -> None:
+        action.set_state(value)
+        # Matches of the previous options don't narrow the search for those of the new
+        self.__narrowing_term = ""
+        self.__narrowing_offset = None
+        if not self.__active:
+            return
+        self.__replace_action.set_enabled(False)
+        self._search_entry.set_occurrence_count(0)
+        self._search_entry.set_occurrence_position(0)
+        self.__clear_current_match()
+        self.__apply_search_text()
+
+    def __get_option(self, name: str) -> bool:
+        return self.__action_group.lookup_action(name).get_state().get_boolean()
+
     def __on_cursor_moved(self) -> None:
         self.__update_for_current_match(None, None)
         self.__replace_action.set_enabled(False)
 
+    def __on_buffer_changed(self) -> None:
+        # Edits may have added matches ahead of the first found
+        self.__narrowing_offset = None
+
     def __on_search_text_changed(self) -> None:
+        if self.__search_text_source_id is not None:
+            GLib.source_remove(self.__search_text_source_id)
+            self.__search_text_source_id = None
+        if self.__typed_time is None:
+            self.__typed_time = time.monotonic()
+
+        text = self._search_entry.get_text()
+        buffer = self.__sourceview.get_buffer()
+        if text == "" or buffer.get_char_count() <= self.SEARCH_DELAY_THRESHOLD:
+            self.__apply_search_text()
+        else:
+            self.__search_text_source_id = GLib.timeout_add(
+                self.SEARCH_DELAY, self.__on_search_text_timeout
+            )
+
         self.__replace_action.set_enabled(False)
         self._search_entry.set_occurrence_count(0)
         self._search_entry.set_occurrence_position(0)
         # Clear any tagged matches when deleting the search term
+        self.__clear_current_match()
+
+    def __on_search_text_timeout(self) -> bool:
+        self.__search_text_source_id = None
+        self.__apply_search_text()
+        return GLib.SOURCE_REMOVE
+
+    def __apply_pending_search_text(self) -> None:
+        if self.__search_text_source_id is not None:
+            GLib.source_remove(self.__search_text_source_id)
+            self.__search_text_source_id = None
+            self.__apply_search_text()
+
+    def __apply_search_text(self) -> None:
+        text = self._search_entry.get_text()
+        self.__search_text = text
+        if self.__active:
+            self.__track_search_text()
+        if text == "":
+            self.__typed_time = None
+            return
+        # Jump straight away, rather than after the whole buffer is scanned for the count
+        if (
+            self.__active
+            and not self.__sourceview.has_focus()
+            and not self.__avoid_jumping_during_replace
+        ):
+            self.__jump_to_first()
+
+    def __log_typing_latency(self) -> None:
+        if self.__typed_time is not None:
+            elapsed = (time.monotonic() - self.__typed_time) * 1000
+            logging.debug(f"Search match found {elapsed:.0f}ms after typing")
+            self.__typed_time = None
+
+    def __track_search_text(self) -> None:
+        text = self.__search_text
+        regex = self.__get_option("regex")
+        pattern = None
+        error = None
+        if text:
+            try:
+                pattern = compile_search_pattern(
+                    text,
+                    self.__get_option("case-sensitive"),
+                    self.__get_option("whole-words"),
+                    regex,
+                )
+            except re.error as e:
+                # Translators: Tooltip, {0} a description of the error
+                error = _("Invalid regular expression: {0}").format(e)
+        self.__pattern = pattern
+        self._search_entry.set_error(error)
+        self.__replace_all_action.set_enabled(pattern is not None)
         buffer = self.__sourceview.get_buffer()
-        begin, end = buffer.get_bounds()
-        buffer.remove_tag(self.__current_match_tag, begin, end)
-
-    def __occurrences_count_changed(self) -> None:
-        if not self.__context:
+        threshold = config_manager.get_search_relaxed_threshold()
+        self.__relaxed = threshold > 0 and buffer.get_char_count() > threshold
+
+        # Matches are highlighted, navigated, counted and replaced by the one pattern, so that
+        # they all agree. GtkSource's search would match differently, being PCRE and taking word
+        # boundaries from Pango.
+        self.__highlighter.set_pattern(pattern)
+        count_cap = config_manager.get_search_count_cap() if self.__relaxed else 0
+        self.__match_tracker.set_pattern(pattern, max_match_length(text, regex), count_cap)
+        if self.__relaxed:
+            # Navigation searches the buffer directly until the count is known
+            self.__action_group.lookup_action("backward").set_enabled(pattern is not None)
+            self.__action_group.lookup_action("forward").set_enabled(pattern is not None)
+
+    def __on_matches_changed(self) -> None:
+        if not self.__active:
             return
-        count = self.__context.get_occurrences_count()
+        if self.__match_tracker.timed_out:
+            # Translators: Tooltip
+            self._search_entry.set_error(_("Search took too long"))
+            self.__highlighter.set_pattern(None)
+            self.__action_group.lookup_action("backward").set_enabled(False)
+            self.__action_group.lookup_action("forward").set_enabled(False)
+            return
+        if not self.__match_tracker.ready:
+            if self.__match_tracker.count_capped:
+                count_cap = config_manager.get_search_count_cap()
+                self._search_entry.set_occurrence_count(count_cap, exact=False)
+            return
+        count = len(self.__match_tracker.index)
         self._search_entry.set_occurrence_count(count)
-        self._search_entry.set_occurrence_position(0)
+        self._search_entry.set_occurrence_position(self.__selected_match_position())
         search_can_move = count > 0
 
-        if not self.__sourceview.has_focus():
-            if search_can_move and not self.__avoid_jumping_during_replace:
-                self.__jump_to_first()
-            elif self.__restarting_with_nonempty_term:
+        if not search_can_move:
+            self.__log_typing_latency()
+            if not self.__sourceview.has_focus() and self.__restarting_with_nonempty_term:
                 self.__restarting_with_nonempty_term = False
 
         self.__action_group.lookup_action("backward").set_enabled(search_can_move)
@@ -219,12 +383,32 @@ class EditorSearchHeaderBar(Gtk.Box):
 
     def __jump_to_first(self) -> None:
         buffer = self.__sourceview.get_buffer()
-        start_iter = buffer.get_iter_at_offset(self.__offset_when_entered)
-        self.__move_forward(start_iter)
+        term = self.__search_text
+        offset = self.__offset_when_entered
+        # Every match of a longer term is a match of its prefix, so the search for the first can
+        # start from the prefix's first
+        if (
+            self.__narrowing_offset is not None
+            and self.__narrowing_term != ""
+            and self.__narrows(term, self.__narrowing_term)
+        ):
+            offset = self.__narrowing_offset
+        self.__narrowing_term = term
+        self.__narrowing_offset = None
+        self.__move_forward(buffer.get_iter_at_offset(offset), first=True)
+
+    def __narrows(self, term: str, prefix: str) -> bool:
+        # A longer regular expression or whole word term may match where its prefix doesn't
+        if self.__get_option("regex") or self.__get_option("whole-words"):
+            return False
+        if self.__get_option("case-sensitive"):
+            return term.startswith(prefix)
+        return term.lower().startswith(prefix.lower())
 
-    def __move_forward(self, from_iter: Optional[Gtk.TextIter] = None) -> None:
+    def __move_forward(self, from_iter: Optional[Gtk.TextIter] = None, first: bool = False) -> None:
         """Move to next search match."""
-        if self.__context is None:
+        self.__apply_pending_search_text()
+        if not self.__active:
             if self._search_entry.get_text() != "":
                 self.emit("resumed")
             else:
@@ -238,12 +422,13 @@ class EditorSearchHeaderBar(Gtk.Box):
             else:
                 mark = buffer.get_insert()
                 from_iter = buffer.get_iter_at_mark(mark)
-        if self.__context:
-            self.__context.forward_async(from_iter, None, self.__on_context_forward)
+        if self.__active:
+            self.__move_directly(from_iter, True, first)
 
     def __move_backward(self) -> None:
         """Move to previous search match."""
-        if self.__context is None:
+        self.__apply_pending_search_text()
+        if not self.__active:
             if self._search_entry.get_text() != "":
                 self.emit("resumed")
             else:
@@ -255,8 +440,21 @@ class EditorSearchHeaderBar(Gtk.Box):
         else:
             mark = buffer.get_insert()
             begin = buffer.get_iter_at_mark(mark)
-        if self.__context:
-            self.__context.backward_async(begin, None, self.__on_context_backward)
+        if self.__active:
+            self.__move_directly(begin, False, False)
+
+    def __move_directly(self, from_iter: Gtk.TextIter, forward: bool, first: bool) -> None:
+        # Through the match index, or the buffer while still counting
+        found = self.__match_tracker.find(from_iter.get_offset(), forward)
+        match_start = match_end = None
+        if found is not None:
+            buffer = self.__sourceview.get_buffer()
+            match_start = buffer.get_iter_at_offset(found[0])
+            match_end = buffer.get_iter_at_offset(found[1])
+        if forward:
+            self.__show_forward_match(found is not None, match_start, match_end, first)
+        else:
+            self.__show_backward_match(found is not None, match_start, match_end)
 
     def __toggle_replace_visible(self) -> None:
         if not self.__active:
@@ -276,33 +474,56 @@ class EditorSearchHeaderBar(Gtk.Box):
     def __update_for_current_match(
         self, match_start: Optional[Gtk.TextIter], match_end: Optional[Gtk.TextIter]
     ) -> None:
-        if not self.__context:
+        if not self.__active:
             return
         if not self.__current_match_tag:
             return
         buffer = self.__sourceview.get_buffer()
 
-        new_position = 0
-        if buffer.get_has_selection():
-            bounds = buffer.get_selection_bounds()
-            if len(bounds) == 2:
-                begin, end = bounds
-                begin.order(end)
-                new_position = self.__context.get_occurrence_position(begin, end)
-        self._search_entry.set_occurrence_position(new_position)
+        self._search_entry.set_occurrence_position(self.__selected_match_position())
 
-        if self.__current_match_tag is not None:
-            begin, end = buffer.get_bounds()
-            buffer.remove_tag(self.__current_match_tag, begin, end)
+        self.__clear_current_match()
         if match_start is not None and match_end is not None:
             buffer.apply_tag(self.__current_match_tag, match_start, match_end)
             self.__current_match_tag.set_priority(buffer.get_tag_table().get_size() - 1)
+            self.__current_match_marks = (
+                buffer.create_mark(None, match_start, True),
+                buffer.create_mark(None, match_end, False),
+            )
+
+    def __selected_match_position(self) -> int:
+        buffer = self.__sourceview.get_buffer()
+        if not self.__match_tracker.ready or not buffer.get_has_selection():
+            return 0
+        bounds = buffer.get_selection_bounds()
+        if len(bounds) != 2:
+            return 0
+        begin, end = bounds
+        begin.order(end)
+        return self.__match_tracker.index.position(begin.get_offset(), end.get_offset())
+
+    def __clear_current_match(self) -> None:
+        # Only the range last tagged, rather than the whole buffer
+        if self.__current_match_marks is None:
+            return
+        buffer = self.__sourceview.get_buffer()
+        start_mark, end_mark = self.__current_match_marks
+        self.__current_match_marks = None
+        if self.__current_match_tag is not None:
+            buffer.remove_tag(
+                self.__current_match_tag,
+                buffer.get_iter_at_mark(start_mark),
+                buffer.get_iter_at_mark(end_mark),
+            )
+        buffer.delete_mark(start_mark)
+        buffer.delete_mark(end_mark)
 
     def __setup_current_match_styling(self) -> None:
         buffer = self.__sourceview.get_buffer()
         table = buffer.get_tag_table()
         scheme = buffer.get_style_scheme()
 
+        self.__clear_current_match()
         if self.__current_match_tag is not None:
             table.remove(self.__current_match_tag)
         self.__current_match_tag = buffer.create_tag()
@@ -317,19 +538,140 @@ class EditorSearchHeaderBar(Gtk.Box):
 
     def __replace_selection(self) -> None:
         buffer = self.__sourceview.get_buffer()
-        if not self.__have_search_term_selection():
+        match = self.__match_selection()
+        if match is None:
             return
+        new_text = self._replace_entry.get_text()
+        if self.__get_option("regex"):
+            try:
+                new_text = match.expand(new_text)
+            except (re.error, IndexError) as e:
+                # Translators: Tooltip, {0} a description of the error
+                self.__set_replace_error(_("Invalid replacement: {0}").format(e))
+                return
         (start, end) = buffer.get_selection_bounds()
         self.__avoid_jumping_during_replace = True
         buffer.delete(start, end)
-        new_text = self._replace_entry.get_text()
         if new_text != "":
             buffer.insert(start, new_text)
         self.__move_forward()
 
+    def __replace_all(self) -> None:
+        self.__apply_pending_search_text()
+        if not self.__active or self.__pattern is None:
+            return
+        buffer = self.__sourceview.get_buffer()
+        start_time = time.monotonic()
+        text = buffer.get_text(*buffer.get_bounds(), True)
+        try:
+            with time_limit(self.REPLACE_ALL_TIME_LIMIT):
+                matches = [m for m in self.__pattern.finditer(text) if m.end() > m.start()]
+        except MatchTimeout:
+            # Translators: Tooltip
+            self._search_entry.set_error(_("Search took too long"))
+            return
+
+        new_text = self._replace_entry.get_text()
+        replacements = [(m.start(), m.end(), new_text) for m in matches]
+        # Expanding parses the template each time, so is avoided without group references and
+        # otherwise done once for each distinct match
+        if self.__get_option("regex") and "\\" in new_text:
+            expanded: dict[tuple, str] = {}
+            try:
+                for i, m in enumerate(matches):
+                    key = (m.group(), m.groups())
+                    if key not in expanded:
+                        expanded[key] = m.expand(new_text)
+                    replacements[i] = (m.start(), m.end(), expanded[key])
+            except (re.error, IndexError) as e:
+                # Translators: Tooltip, {0} a description of the error
+                self.__set_replace_error(_("Invalid replacement: {0}").format(e))
+                return
+        del matches
+
+        # Tracking and highlighting would otherwise respond to every edit, so are stopped and the
+        # buffer searched again once after
+        self.__clear_current_match()
+        self.__match_tracker.stop()
+        self.__highlighter.set_pattern(None)
+
+        self.__apply_replacements(buffer, text, replacements)
+        elapsed = (time.monotonic() - start_time) * 1000
+        logging.debug(f"Replaced {len(replacements)} search matches in {elapsed:.0f}ms")
+
+        self.__replace_action.set_enabled(False)
+        self.__track_search_text()
+        self.emit("replaced-all", len(replacements))
+
+    def __apply_replacements(
+        self, buffer: Gtk.TextBuffer, text: str, replacements: list[tuple[int, int, str]]
+    ) -> None:
+        # As one user action. Every edit runs the buffer's handlers, journalling among them, so
+        # beyond the threshold the text from the first match to the last is rebuilt and applied
+        # as a single edit
+        buffer.begin_user_action()
+        if len(replacements) > self.REPLACE_ALL_SPAN_THRESHOLD:
+            cursor = buffer.get_iter_at_mark(buffer.get_insert()).get_offset()
+            span_start = replacements[0][0]
+            span_end = replacements[-1][1]
+            pieces = []
+            position = span_start
+            # Characters added before the cursor. As when editing match by match, a cursor
+            # within a match lands after its replacement
+            delta = 0
+            new_cursor = None
+            for start, end, replacement in replacements:
+                pieces.append(text[position:start])
+                pieces.append(replacement)
+                position = end
+                if end <= cursor:
+                    delta += len(replacement) - (end - start)
+                elif start <= cursor:
+                    new_cursor = start + delta + len(replacement)
+            start_iter = buffer.get_iter_at_offset(span_start)
+            buffer.delete(start_iter, buffer.get_iter_at_offset(span_end))
+            buffer.insert(start_iter, "".join(pieces))
+            if new_cursor is None:
+                new_cursor = cursor + delta
+            buffer.place_cursor(buffer.get_iter_at_offset(new_cursor))
+        else:
+            # Back to front, so that the offsets of the matches yet to be replaced are unchanged
+            for start, end, replacement in reversed(replacements):
+                start_iter = buffer.get_iter_at_offset(start)
+                buffer.delete(start_iter, buffer.get_iter_at_offset(end))
+                if replacement != "":
+                    buffer.insert(start_iter, replacement)
+        buffer.end_user_action()
+
+    def __set_replace_error(self, message: Optional[str]) -> None:
+        if message is None:
+            self._replace_entry.remove_css_class("error")
+        else:
+            self._replace_entry.add_css_class("error")
+        self._replace_entry.set_tooltip_text(message)
+
     def __have_search_term_selection(self) -> bool:
+        return self.__match_selection() is not None
+
+    def __match_selection(self) -> Optional[re.Match]:
+        # The match of the pattern covering exactly the selection. Matched within the selection's
+        # lines, so that anchors and lookarounds see the surrounding text
         buffer = self.__sourceview.get_buffer()
-        if not buffer.get_has_selection():
-            return False
+        if self.__pattern is None or not buffer.get_has_selection():
+            return None
         (start, end) = buffer.get_selection_bounds()
-        return start.get_text(end).lower() == self._search_entry.get_text().lower()
+        line_start = start.copy()
+        line_start.set_line_offset(0)
+        line_end = end.copy()
+        if not line_end.ends_line():
+            line_end.forward_to_line_end()
+        text = buffer.get_text(line_start, line_end, True)
+        base = line_start.get_offset()
+        try:
+            with time_limit():
+                match = self.__pattern.match(text, start.get_offset() - base)
+        except MatchTimeout:
+            return None
+        if match is None or match.end() != end.get_offset() - base:
+            return None
+        return match
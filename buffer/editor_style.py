@@ -0,0 +1,107 @@
+from gi.repository import Gdk, Gio, GLib, GObject, Gtk, Pango
+
+import logging
+import time
+from typing import Optional
+
+import buffer.config_manager as config_manager
+
+
+class EditorStyle(GObject.Object):
+    """Application wide editor typography.
+
+    A single style provider on the display holds the font size and the desktop's monospace and
+    document font families, regenerated once per change. Views pick a family through the
+    MONOSPACE_CLASS and DOCUMENT_CLASS CSS classes.
+    """
+
+    FONT_SETTING_KEYS = ["monospace-font-name", "document-font-name"]
+    MONOSPACE_CLASS = "monospace-font"
+    DOCUMENT_CLASS = "document-font"
+
+    def __init__(self, dbus_proxy: Optional[Gio.DBusProxy]) -> None:
+        super().__init__()
+        self.__dbus_proxy = dbus_proxy
+        self.__font_families: dict[str, str] = {}
+
+        self.__css_provider = Gtk.CssProvider()
+        Gtk.StyleContext.add_provider_for_display(
+            Gdk.Display.get_default(), self.__css_provider, Gtk.STYLE_PROVIDER_PRIORITY_USER
+        )
+
+        if self.__dbus_proxy is None:
+            logging.warning("Unable to establish D-Bus proxy for FreeDesktop.org font setting")
+        else:
+            self.__load_font_families_from_setting()
+            self.__dbus_proxy.connect_object("g-signal", self.__on_desktop_setting_changed, None)
+
+        config_manager.subscribe(config_manager.FONT_SIZE, self.__update)
+        self.__update()
+
+    @staticmethod
+    def get_font_class() -> str:
+        """Get the CSS class for the font family in use.
+
+        :return: The class
+        :rtype: str
+        """
+        if config_manager.get_use_monospace_font():
+            return EditorStyle.MONOSPACE_CLASS
+        return EditorStyle.DOCUMENT_CLASS
+
+    def __on_desktop_setting_changed(
+        self, _sender_name: str, _signal_name: str, _parameters: str, data: GLib.Variant
+    ) -> None:
+        if _parameters != "SettingChanged":
+            return
+        (path, setting_name, value) = data
+        if path == "org.gnome.desktop.interface" and setting_name in self.FONT_SETTING_KEYS:
+            if value.strip() != "":
+                font_description = Pango.font_description_from_string(value)
+                self.__font_families[setting_name] = font_description.get_family()
+                self.__update()
+
+    def __load_font_families_from_setting(self) -> None:
+        if self.__dbus_proxy is None:
+            return
+
+        try:
+            variant = self.__dbus_proxy.call_sync(
+                method_name="ReadAll",
+                parameters=GLib.Variant("(as)", ("org.gnome.desktop.*",)),
+                flags=Gio.DBusCallFlags.NO_AUTO_START,
+                timeout_msec=-1,
+                cancellable=None,
+            )
+        except GLib.GError as e:
+            logging.warning("Unable to access D-Bus FreeDesktop.org font family setting: %s", e)
+            return
+
+        if variant.get_type_string() != "(a{sa{sv}})":
+            return
+        for v in variant:
+            for key, value in v.items():
+                if key == "org.gnome.desktop.interface":
+                    for font_key in self.FONT_SETTING_KEYS:
+                        if font_key in value:
+                            font_description = Pango.font_description_from_string(value[font_key])
+                            self.__font_families[font_key] = font_description.get_family()
+
+    def __update(self) -> None:
+        start_time = time.monotonic()
+        size = config_manager.get_font_size()
+        monospace = self.__font_families.get("monospace-font-name", "monospace")
+        document = self.__font_families.get("document-font-name", "monospace")
+        style = f"""
+        .editor-textview {{
+            font-size: {size}pt;
+        }}
+        .editor-textview.{self.MONOSPACE_CLASS} {{
+            font-family: {monospace}, monospace;
+        }}
+        .editor-textview.{self.DOCUMENT_CLASS} {{
+            font-family: {document}, monospace;
+        }}"""
+        self.__css_provider.load_from_data(style, -1)
+        elapsed = (time.monotonic() - start_time) * 1000
+        logging.debug(f"Editor style updated in {elapsed:.1f}ms")
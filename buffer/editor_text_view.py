@@ -3,13 +3,20 @@ import gi
 gi.require_version("GtkSource", "5")
 from gi.repository import Gdk, GLib, GObject, Gtk, GtkSource
 
-import locale
 import logging
-import re
 import sys
 from typing import Callable, Optional
 
 import buffer.config_manager as config_manager
+from buffer.editor_style import EditorStyle
+from buffer.list_grammar import (
+    LINE_BREAK,
+    ListGrammar,
+    calculate_ordered_list_index,
+    format_ordered_list_item,
+)
+from buffer.spelling_service import SpellingService
+from buffer.viewport_spell_checker import ViewportSpellChecker
 
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/cheywood/Buffer/ui/editor_text_view.ui")
@@ -20,14 +27,7 @@ class EditorTextView(GtkSource.View):
         "size-allocated": (GObject.SignalFlags.RUN_FIRST, None, ()),
     }
 
-    # k is the token, v is the continuation
-    BULLET_LIST_TOKENS = {
-        "- [ ] ": "- [ ] ",
-        "- [x] ": "- [ ] ",
-        "- ": "- ",
-        "+ ": "+ ",
-        "* ": "* ",
-    }
+    LIST_GRAMMAR = ListGrammar()
 
     BASE_MARGIN = 36
     MINIMUM_MARGIN = 10
@@ -37,35 +37,26 @@ class EditorTextView(GtkSource.View):
         super().__init__()
 
         self.__line_length = -1
-        self.__font_family = "monospace"
 
         self.__spellchecker = None
         self.__spelling_adapter = None
+        self.__viewport_spell_checker: Optional[ViewportSpellChecker] = None
+        self.__spelling_wanted = False
+        self.__spelling_relaxed = False
+        self.__spellchecker_loading = False
         if config_manager.get_spelling_enabled():
             self.__init_spellchecker()
 
-        config_manager.settings.connect(
-            f"changed::{config_manager.SPELLING_ENABLED}",
-            lambda _o, _v: self.__on_spelling_toggled(),
-        )
-        config_manager.settings.connect(
-            f"changed::{config_manager.FONT_SIZE}", lambda _o, _k: self.__update_font()
-        )
-        config_manager.settings.connect(
-            f"changed::{config_manager.SHOW_LINE_NUMBERS}",
-            lambda _o, _v: self.set_property(
-                "show-line-numbers", config_manager.get_show_line_numbers()
-            ),
-        )
-        self.set_property("show-line-numbers", config_manager.get_show_line_numbers())
+        config_manager.subscribe(config_manager.SPELLING_ENABLED, self.__on_spelling_toggled)
+        config_manager.subscribe(config_manager.USE_MONOSPACE_FONT, self.__update_font_class)
+        self.__update_font_class()
+        config_manager.subscribe(config_manager.SHOW_LINE_NUMBERS, self.__update_line_numbers)
+        self.__update_line_numbers()
 
         controller = Gtk.EventControllerKey()
         controller.connect("key-pressed", self.__on_key_pressed)
         self.add_controller(controller)
 
-        self.__css_provider = Gtk.CssProvider()
-        self.get_style_context().add_provider(self.__css_provider, Gtk.STYLE_PROVIDER_PRIORITY_USER)
-
     def do_size_allocate(self, width: int, height: int, baseline: int) -> None:
         """Allocates widget with a transformation that translates the origin to the position in
         allocation.
@@ -113,14 +104,6 @@ class EditorTextView(GtkSource.View):
         buffer = self.get_buffer()
         buffer.place_cursor(click_iter)
 
-    def update_font_family(self, font_family: str) -> None:
-        """Update font family from system preference.
-
-        :param str font_family: The font family
-        """
-        self.__font_family = font_family
-        self.__update_font()
-
     def jump_to_insertion_point(self) -> None:
         """Jump to the insertion point.
 
@@ -143,14 +126,12 @@ class EditorTextView(GtkSource.View):
 
     @GObject.Property(type=bool, default=False)
     def spellchecker_enabled(self) -> bool:
-        if self.__spelling_adapter is not None:
-            return self.__spelling_adapter.get_enabled()
-        return False
+        return self.__spelling_adapter is not None and self.__spelling_wanted
 
     @spellchecker_enabled.setter
     def set_spellchecker_enabled(self, value: bool) -> None:
-        if self.__spelling_adapter is not None:
-            self.__spelling_adapter.set_enabled(value)
+        self.__spelling_wanted = value
+        self.__update_spelling_mode()
 
     def __on_key_pressed(
         self,
@@ -175,52 +156,83 @@ class EditorTextView(GtkSource.View):
         else:
             self.spellchecker_enabled = False
 
-    def __update_font(self) -> None:
-        size = config_manager.get_font_size()
-        style = f"""
-        .editor-textview {{
-            font-size: {size}pt;
-            font-family: {self.__font_family}, monospace;
-        }}"""
-        self.__css_provider.load_from_data(style, -1)
+    def __update_line_numbers(self) -> None:
+        self.set_property("show-line-numbers", config_manager.get_show_line_numbers())
+
+    def __update_font_class(self) -> None:
+        # Typography itself is styled application wide, see EditorStyle
+        font_class = EditorStyle.get_font_class()
+        for css_class in (EditorStyle.MONOSPACE_CLASS, EditorStyle.DOCUMENT_CLASS):
+            if css_class != font_class:
+                self.remove_css_class(css_class)
+        self.add_css_class(font_class)
 
     def __init_spellchecker(self) -> None:
-        if self.__spellchecker is not None:
+        if self.__spellchecker is not None or self.__spellchecker_loading:
             return
 
-        gi.require_version("Spelling", "1")
-        from gi.repository import Spelling
-
-        pref_language = config_manager.get_spelling_language()
-        if pref_language:
-            language_code: Optional[str] = pref_language
-            logging.debug(f'Attempting to use spelling language from preference "{pref_language}"')
+        # Dictionaries load in the background, the view being usable meanwhile. Nothing is
+        # started before the view's first frame, to keep it out of the way of startup.
+        self.__spellchecker_loading = True
+        if self.get_mapped():
+            SpellingService.get_default().load(self.__on_spellchecker_loaded)
         else:
-            language_code, _ = locale.getdefaultlocale()
-            if not language_code:
-                logging.warning(
-                    "Failed to determine default locale, abandoning spelling initialisation"
-                )
-                return
-            logging.debug(f'Attempting to use locale default spelling language "{language_code}"')
+            self.add_tick_callback(self.__on_first_frame)
+
+    def __on_first_frame(self, _widget: Gtk.Widget, _frame_clock: Gdk.FrameClock) -> bool:
+        SpellingService.get_default().load(self.__on_spellchecker_loaded)
+        return GLib.SOURCE_REMOVE
 
-        self.__spellchecker = Spelling.Checker.get_default()
-        self.__spellchecker.set_language(language_code)
+    def __on_spellchecker_loaded(self, checker: Optional["Spelling.Checker"]) -> None:
+        self.__spellchecker_loading = False
+        if checker is None:
+            return
+
+        gi.require_version("Spelling", "1")
+        from gi.repository import Spelling
 
+        self.__spellchecker = checker
         buffer = self.get_buffer()
 
         self.__spelling_adapter = Spelling.TextBufferAdapter.new(buffer, self.__spellchecker)
+        spelling_service = SpellingService.get_default()
+        self.__viewport_spell_checker = ViewportSpellChecker(self, spelling_service)
 
         extra_menu = self.__spelling_adapter.get_menu_model()
         self.set_extra_menu(extra_menu)
-        self.insert_action_group("spelling", self.__spelling_adapter)
+        self.insert_action_group(
+            "spelling", spelling_service.create_action_group(self.__spelling_adapter)
+        )
 
-        self.spellchecker_enabled = False
+        pref_language = config_manager.get_spelling_language()
         if pref_language is not None:
             self.__verify_preferred_language_in_use(pref_language)
-        self.__spellchecker.connect(
-            "notify::language", lambda _o, _v: self.__spelling_language_changed()
+        spelling_service.subscribe_language(self.__spelling_language_changed)
+        buffer.connect("changed", lambda _o: self.__update_spelling_mode())
+        config_manager.subscribe(
+            config_manager.SPELLING_RELAXED_THRESHOLD, self.__update_spelling_mode
         )
+        self.__update_spelling_mode()
+
+    def __update_spelling_mode(self) -> None:
+        """Switch between checking the whole buffer and relaxed checking for large buffers.
+
+        In relaxed mode the text in and around the visible region is checked first, and the rest
+        in the background.
+        """
+        if self.__spelling_adapter is None or self.__viewport_spell_checker is None:
+            return
+
+        threshold = config_manager.get_spelling_relaxed_threshold()
+        relaxed = threshold > 0 and self.get_buffer().get_char_count() > threshold
+        if relaxed != self.__spelling_relaxed:
+            self.__spelling_relaxed = relaxed
+            logging.info("Relaxed spell checking " + ("enabled" if relaxed else "disabled"))
+
+        whole_buffer = self.__spelling_wanted and not relaxed
+        if self.__spelling_adapter.get_enabled() != whole_buffer:
+            self.__spelling_adapter.set_enabled(whole_buffer)
+        self.__viewport_spell_checker.set_enabled(self.__spelling_wanted and relaxed)
 
     def __verify_preferred_language_in_use(self, pref_language: str) -> None:
         if self.__spellchecker is None:
@@ -252,20 +264,10 @@ class EditorTextView(GtkSource.View):
         language = self.__spellchecker.get_language()
         logging.info(f'New spelling language "{language}"')
         config_manager.set_spelling_language(language)
-        self.__spelling_adapter.invalidate_all()
-
-    def __check_line_for_bullet_list_item(self, searchterm: str) -> Optional[re.Match]:
-        term = r"^\s*("
-        escaped_tokens = []
-        for token in self.BULLET_LIST_TOKENS.keys():
-            escaped_tokens.append(re.escape(token))
-        term += "|".join(escaped_tokens)
-        term += ")"
-        return re.search(term, searchterm)
-
-    def __check_line_for_ordered_list_item(self, searchterm: str) -> Optional[re.Match]:
-        term = r"^(\s*)([a-zA-Z]{1}|[0-9]+)([\.\)]){1}[ ]+"
-        return re.search(term, searchterm)
+        if self.__spelling_relaxed and self.__viewport_spell_checker is not None:
+            self.__viewport_spell_checker.invalidate()
+        else:
+            self.__spelling_adapter.invalidate_all()
 
     def __process_newline(self) -> bool:
         handled = False
@@ -278,11 +280,11 @@ class EditorTextView(GtkSource.View):
         previous_line = line_start.get_text(insert_iter)
 
         # TODO look at changing to use the GtkSourceLanguage context?
-        regex_match = self.__check_line_for_bullet_list_item(previous_line)
+        regex_match = self.LIST_GRAMMAR.match_bullet_item(previous_line)
         if regex_match is not None:
             handled = self.__extend_bullet_list(regex_match.group(), insert_iter, line_start)
         else:
-            regex_match = self.__check_line_for_ordered_list_item(previous_line)
+            regex_match = self.LIST_GRAMMAR.match_ordered_item(previous_line)
             if regex_match is not None:
                 handled = self.__extend_ordered_list(regex_match.groups(), insert_iter, line_start)
 
@@ -311,7 +313,7 @@ class EditorTextView(GtkSource.View):
         if not cur_line_end.ends_line():
             cur_line_end.forward_to_line_end()
         cur_line_text = insert_iter.get_text(cur_line_end)
-        if self.__check_line_for_bullet_list_item(cur_line_text) is not None:
+        if self.LIST_GRAMMAR.match_bullet_item(cur_line_text) is not None:
             return False
 
         def generate_sequence_previous_item() -> Optional[str]:
@@ -325,9 +327,7 @@ class EditorTextView(GtkSource.View):
             buffer.delete(line_start, insert_iter)
             buffer.insert_at_cursor("\n")
         else:
-            dict_key = matched_list_item.lstrip()
-            spacing = matched_list_item[0 : len(matched_list_item) - len(dict_key)]
-            new_entry = f"\n{spacing}{self.BULLET_LIST_TOKENS[dict_key]}"
+            new_entry = "\n" + self.LIST_GRAMMAR.continue_bullet_item(matched_list_item)
             buffer.insert_at_cursor(new_entry)
         return True
 
@@ -343,11 +343,11 @@ class EditorTextView(GtkSource.View):
         def generate_sequence_previous_item() -> Optional[str]:
             # Verify there's more than one list item. This allows inserting lines with list start
             # tokens and nothing else.
-            previous_index = EditorTextView.calculate_ordered_list_index(index, -1)
+            previous_index = calculate_ordered_list_index(index, -1)
             if previous_index is None:
                 return None
             else:
-                return self.format_ordered_list_item(spacing, previous_index, marker)
+                return format_ordered_list_item(spacing, previous_index, marker)
 
         empty_list_line = self.inserted_empty_item_at_end_of_list(
             previous_line, "".join(regex_groups), line_start, generate_sequence_previous_item
@@ -357,11 +357,11 @@ class EditorTextView(GtkSource.View):
             buffer.delete(line_start, insert_iter)
             buffer.insert_at_cursor("\n")
         else:
-            sequence_next = self.calculate_ordered_list_index(index, 1)
+            sequence_next = calculate_ordered_list_index(index, 1)
             # Handle value of Z, ending sequence
             if sequence_next is None:
                 return False
-            new_entry = "\n" + self.format_ordered_list_item(spacing, sequence_next, marker)
+            new_entry = "\n" + format_ordered_list_item(spacing, sequence_next, marker)
             buffer.insert(insert_iter, new_entry)
 
         return True
@@ -371,27 +371,63 @@ class EditorTextView(GtkSource.View):
         if buffer.get_has_selection():
             begin, end = buffer.get_selection_bounds()
             begin.order(end)
-            multi_line = "\n" in buffer.get_text(begin, end, False)
-            if multi_line:
-                line_iter = begin.copy()
-                line_mark = buffer.create_mark(None, line_iter)
-                end_mark = buffer.create_mark(None, end)
-                while line_iter.compare(end) < 0:
-                    self.__modify_single_line_indent(line_iter, increase, multi_line)
-                    line_iter = buffer.get_iter_at_mark(line_mark)
-                    line_iter.forward_line()
-                    buffer.delete_mark(line_mark)
-                    line_mark = buffer.create_mark(None, line_iter)
-                    end = buffer.get_iter_at_mark(end_mark)
-                buffer.delete_mark(line_mark)
-                buffer.delete_mark(end_mark)
+            if begin.get_line() != end.get_line():
+                self.__modify_multi_line_indent(begin, end, increase)
             else:
-                self.__modify_single_line_indent(begin, increase, multi_line)
+                self.__modify_single_line_indent(begin, increase, False)
         else:
             mark = buffer.get_insert()
             begin = buffer.get_iter_at_mark(mark)
             self.__modify_single_line_indent(begin, increase, False)
 
+    def __modify_multi_line_indent(
+        self, begin: Gtk.TextIter, end: Gtk.TextIter, increase: bool
+    ) -> None:
+        """Indent or outdent the lines of a selection in one pass.
+
+        The whole block of lines is replaced in a single user action, keeping buffer signals and
+        undo to one step however many lines are selected.
+        """
+        buffer = self.get_buffer()
+        start = begin.copy()
+        start.set_line_offset(0)
+        # A selection ending at the start of a line doesn't include that line
+        last = end.copy()
+        if last.starts_line():
+            last.backward_char()
+        if not last.ends_line():
+            last.forward_to_line_end()
+
+        text = buffer.get_text(start, last, False)
+        new_text, deltas = self.LIST_GRAMMAR.indent_lines(text, increase)
+        if new_text == text:
+            return
+
+        first_line = start.get_line()
+        last_offset = last.get_offset()
+        total_delta = len(new_text) - len(text)
+
+        # Selection positions are recalculated from the per line changes, as insertions at each
+        # line start would have moved them
+        new_line_starts = [start.get_offset()]
+        for line_break in LINE_BREAK.finditer(new_text):
+            new_line_starts.append(start.get_offset() + line_break.end())
+
+        def map_position(position: Gtk.TextIter) -> int:
+            if position.get_offset() > last_offset:
+                return position.get_offset() + total_delta
+            index = position.get_line() - first_line
+            return new_line_starts[index] + max(position.get_line_offset() + deltas[index], 0)
+
+        insert = map_position(buffer.get_iter_at_mark(buffer.get_insert()))
+        bound = map_position(buffer.get_iter_at_mark(buffer.get_selection_bound()))
+
+        buffer.begin_user_action()
+        buffer.delete(start, last)
+        buffer.insert(start, new_text)
+        buffer.end_user_action()
+        buffer.select_range(buffer.get_iter_at_offset(insert), buffer.get_iter_at_offset(bound))
+
     def __modify_single_line_indent(
         self, location: Gtk.TextIter, increase: bool, multi_line: bool
     ) -> None:
@@ -407,11 +443,8 @@ class EditorTextView(GtkSource.View):
         if multi_line and line_contents == "":
             return
 
-        list_item = (
-            self.__check_line_for_bullet_list_item(line_contents) is not None
-            or self.__check_line_for_ordered_list_item(line_contents) is not None
-        )
-        indent_chars = "  " if list_item else "\t"
+        list_item = self.LIST_GRAMMAR.is_list_item(line_contents)
+        indent_chars = self.LIST_GRAMMAR.indent_for(line_contents)
 
         if increase:
             if multi_line or list_item:
@@ -462,35 +495,3 @@ class EditorTextView(GtkSource.View):
         two_prev_start.set_line_offset(0)
         two_prev_line = two_prev_start.get_text(previous_line_start)
         return two_prev_line.startswith(sequence_previous_item)
-
-    @staticmethod
-    def calculate_ordered_list_index(reference: str, direction: int) -> Optional[str]:
-        """Calculate an item in an ordered list sequence.
-
-        :param str reference: The element to start from
-        :param str direction: The direction, 1 or -1
-        :return: The item
-        :rtype: Optional[str]
-        """
-        sequence_next = None
-        if reference.isdigit():
-            sequence_next = str(int(reference) + direction)
-            if sequence_next == 0:
-                sequence_next = None
-        elif direction > 0 and reference.upper() != "Z":
-            sequence_next = chr(ord(reference) + 1)
-        elif direction < 0 and reference.upper() != "A":
-            sequence_next = chr(ord(reference) - 1)
-        return sequence_next
-
-    @staticmethod
-    def format_ordered_list_item(spacing: str, index: str, delimiter: str) -> str:
-        """Generate string for list item.
-
-        :param str spacing: Pre marker spacing
-        :param str index: Item index
-        :param str delimiter: The delimiter before the item text
-        :return: The build string
-        :rtype: str
-        """
-        return f"{spacing}{index}{delimiter} "
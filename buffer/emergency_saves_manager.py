@@ -1,36 +1,165 @@
-from gi.repository import Gio, GObject, GLib
+import gi
+
+gi.require_version("GtkSource", "5")
+from gi.repository import Gio, GObject, GLib, GtkSource
 
-import datetime
 import logging
 import os
-from pathlib import Path
-from typing import Optional
+import queue
+import threading
+import time
+from typing import Callable, Iterator, Optional
 
 import buffer.config_manager as config_manager
+from buffer.background_worker import BackgroundWorker
+from buffer.recovery_index import RecoveryIndex
+from buffer.recovery_search_index import RecoverySearchIndex
+from buffer.recovery_store import RecoveryStore
 
 
 class EmergencySavesManager(GObject.Object):
 
     DEFAULT_EMERGENCY_FILES = 10
     DIRECTORY = os.path.join(GLib.get_user_data_dir(), "buffer", "recovery")
+    READ_LENGTH = 262144
+    MAX_SHUTDOWN_THREADS = 8
 
     def __init__(self) -> None:
         super().__init__()
+        self.__index = RecoveryIndex(self.DIRECTORY)
+        self.__store = RecoveryStore(self.DIRECTORY)
+        self.__search_index = RecoverySearchIndex(self.DIRECTORY, self.__store)
+        self.__worker = BackgroundWorker("emergency-saves")
+        # Searches have a thread of their own, so that they don't wait behind saves and exports
+        self.__search_worker = BackgroundWorker("recovery-search")
+        self.__search_index_opened = False
 
-    def save(self, contents: str) -> None:
+    def save(
+        self,
+        buffer: GtkSource.Buffer,
+        finished_callback: Optional[Callable[[bool], None]] = None,
+    ) -> None:
         """Save to file.
 
-        :param str contents: Buffer contents
+        The buffer is read out piece by piece and stored as a compressed, deduplicated snapshot on
+        a worker thread, the application being held until complete.
+
+        :param GtkSource.Buffer buffer: The buffer
+        :param finished_callback: A function to call with whether the save succeeded
         """
-        if config_manager.get_emergency_recover_files() == 0:
-            return
-        if not self.__init_export_dir():
+        filename = None
+        if config_manager.get_emergency_recover_files() > 0 and self.__init_export_dir():
+            filename = self.__index.reserve()
+        if filename:
+            self.__save(filename, buffer, finished_callback)
+        elif finished_callback is not None:
+            finished_callback(False)
+
+    def save_pieces(
+        self,
+        pieces: Iterator[str],
+        finished_callback: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        """Save text that's read piece by piece, such as from another file, to file.
+
+        The pieces are read and stored on a worker thread, the application being held until
+        complete.
+
+        :param Iterator[str] pieces: The text
+        :param finished_callback: A function to call with whether the save succeeded
+        """
+        filename = None
+        if config_manager.get_emergency_recover_files() > 0 and self.__init_export_dir():
+            filename = self.__index.reserve()
+        if not filename:
+            if finished_callback is not None:
+                finished_callback(False)
             return
 
-        filename = self.__get_unique_filename()
-        if filename:
-            self.__save(filename, contents)
-            self.__trim()
+        app = Gio.Application.get_default()
+        app.hold()
+        start_time = time.monotonic()
+        writer = self.__store.create_writer(filename)
+
+        def write() -> Optional[int]:
+            for piece in pieces:
+                if not writer.feed(piece):
+                    return None
+            return writer.finish("")
+
+        def on_saved(written: Optional[int]) -> None:
+            self.__on_saved(filename, written, start_time, finished_callback)
+            app.release()
+
+        self.__worker.submit(write, on_saved)
+
+    def save_all(self, texts: list[str], timeout: float) -> list[bool]:
+        """Save several buffers at once, for when the application is being terminated.
+
+        The texts are written concurrently on a bounded pool of threads. Blocks until all are
+        written or the timeout passes, any writes still in progress then being abandoned.
+
+        :param list[str] texts: The text of each buffer
+        :param float timeout: Seconds to wait
+        :return: Whether each buffer was saved
+        :rtype: list[bool]
+        """
+        if config_manager.get_emergency_recover_files() == 0 or not self.__init_export_dir():
+            return [False] * len(texts)
+
+        start_time = time.monotonic()
+        deadline = start_time + timeout
+        jobs: queue.SimpleQueue[tuple[int, str]] = queue.SimpleQueue()
+        filenames = []
+        for i, text in enumerate(texts):
+            filename = self.__index.reserve()
+            filenames.append(filename)
+            if filename:
+                jobs.put((i, text))
+        written: list[Optional[int]] = [None] * len(texts)
+        completed = [False] * len(texts)
+        remaining = jobs.qsize()
+        finished = threading.Condition()
+
+        def work() -> None:
+            nonlocal remaining
+            while True:
+                try:
+                    i, text = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result = self.__store.create_writer(filenames[i]).finish(text)
+                except Exception as e:
+                    logging.warning(f"Failed to save to {filenames[i]}: %s", e)
+                    result = None
+                with finished:
+                    written[i] = result
+                    completed[i] = True
+                    remaining -= 1
+                    finished.notify()
+
+        # Daemon threads, so that writes outliving the timeout don't hold up exit
+        for i in range(min(remaining, self.MAX_SHUTDOWN_THREADS, os.cpu_count() or 1)):
+            threading.Thread(target=work, name=f"emergency-saves-{i}", daemon=True).start()
+        with finished:
+            finished.wait_for(lambda: remaining == 0, max(deadline - time.monotonic(), 0))
+            results = list(written)
+            timed_out = [filename and not done for filename, done in zip(filenames, completed)]
+
+        for filename, result, late in zip(filenames, results, timed_out):
+            if result is not None:
+                self.__index.add(filename, result)
+            elif late:
+                # Kept in the manifest, so that it's trimmed in time should the write complete
+                self.__index.add(filename, 0)
+            elif filename:
+                self.__index.release(filename)
+        saved = [result is not None for result in results]
+        elapsed = (time.monotonic() - start_time) * 1000
+        logging.info(f"Saved {saved.count(True)} of {len(texts)} buffers in {elapsed:.0f}ms")
+        # Trimming and indexing are left to the next launch
+        return saved
 
     def __init_export_dir(self) -> bool:
         if not os.path.exists(self.DIRECTORY):
@@ -43,45 +172,117 @@ class EmergencySavesManager(GObject.Object):
                 return False
         return True
 
-    def __get_unique_filename(self) -> Optional[str]:
-        attempts = 0
-        success = False
-        while attempts < 100:
-            ts = datetime.datetime.now()
-            location = os.path.join(self.DIRECTORY, ts.strftime("%Y-%m-%dT%H%M%S.%f.txt"))
-            if not os.path.exists(location):
-                success = True
-                break
-            attempts += 1
-        return location if success else None
-
-    def __save(self, filename: str, contents: str) -> None:
-        try:
-            with open(filename, "w") as f:
-                f.write(contents)
-        except OSError as e:
-            logging.warning(f"Failed to save to {filename}: %s", e)
-            return
-        logging.info(f"Saved to {filename}")
+    def __save(
+        self,
+        filename: str,
+        buffer: GtkSource.Buffer,
+        finished_callback: Optional[Callable[[bool], None]],
+    ) -> None:
+        app = Gio.Application.get_default()
+        app.hold()
+        start_time = time.monotonic()
+        writer = self.__store.create_writer(filename)
+        offset = 0
 
-    def __trim(self) -> None:
-        paths = sorted(Path(self.DIRECTORY).iterdir(), key=os.path.getmtime)
-        paths = [x for x in paths if x.suffix == ".txt"]
-        limit = config_manager.get_emergency_recover_files()
-        if len(paths) > limit:
-            for path in paths[: len(paths) - limit]:
-                try:
-                    logging.debug(f"Trimming {path}")
-                    Path.unlink(path)
-                except OSError as e:
-                    logging.warning(
-                        f"Failed to remove {path} for emergency recovery trimming: %s", e
-                    )
+        def read_next(success: Optional[bool] = True) -> None:
+            # Each piece is read only once the previous has been handed off, so there's never more
+            # than a piece of the buffer copied at a time
+            nonlocal offset
+            if not success:
+                on_saved(None)
+                return
+            start = buffer.get_iter_at_offset(offset)
+            end = start.copy()
+            end.forward_chars(self.READ_LENGTH)
+            text = buffer.get_text(start, end, True)
+            offset = end.get_offset()
+            if end.is_end():
+                self.__worker.submit(lambda: writer.finish(text), on_saved)
+            else:
+                self.__worker.submit(lambda: writer.feed(text), read_next)
+
+        def on_saved(written: Optional[int]) -> None:
+            self.__on_saved(filename, written, start_time, finished_callback)
+            app.release()
+
+        read_next()
+
+    def __on_saved(
+        self,
+        filename: str,
+        written: Optional[int],
+        start_time: float,
+        finished_callback: Optional[Callable[[bool], None]],
+    ) -> None:
+        if written is not None:
+            elapsed = (time.monotonic() - start_time) * 1000
+            logging.info(f"Saved to {filename}")
+            logging.debug(f"Saved in {elapsed:.0f}ms, {written} bytes added to disk")
+            self.__index.add(filename, written)
+            self.__worker.submit(lambda: self.__search_index.add(filename))
+            self.__trim()
         else:
-            logging.debug(f"Not trimming recovery files, count {len(paths)} < {limit}")
+            logging.warning(f"Failed to save to {filename}")
+            self.__index.release(filename)
+        if finished_callback is not None:
+            finished_callback(written is not None)
+
+    def __trim(self) -> None:
+        trimmed = self.__index.trim(
+            config_manager.get_emergency_recover_files(),
+            config_manager.get_emergency_recovery_max_size() * 1024 * 1024,
+            config_manager.get_emergency_recovery_max_age() * 24 * 60 * 60,
+        )
+        if trimmed:
+            self.__worker.submit(lambda: self.__store.remove(trimmed))
+            self.__worker.submit(lambda: self.__search_index.remove(trimmed))
+
+    def search(self, query: str, callback: Callable[[list[str]], None]) -> None:
+        """Search the saves.
+
+        :param str query: The search terms
+        :param callback: A function to call with the paths of the matching saves, best first
+        """
+        if not self.__search_index_opened:
+            # Catching up with saves made while the index wasn't in use, along with other updates
+            self.__worker.submit(self.__search_index.open)
+            self.__search_index_opened = True
+        self.__search_worker.submit(
+            lambda: self.__search_index.search(query), lambda paths: callback(paths or [])
+        )
+
+    def get_snippet(self, path: str, query: str, callback: Callable[[str], None]) -> None:
+        """Get the text around the first match of a search in a save.
+
+        :param str path: The save
+        :param str query: The search terms
+        :param callback: A function to call with the text, the matched terms marked with
+            RecoverySearchIndex.MATCH_START and MATCH_END
+        """
+        self.__search_worker.submit(
+            lambda: self.__search_index.snippet(path, query), lambda text: callback(text or "")
+        )
+
+    def load(self, path: str, callback: Callable[[Optional[str]], None]) -> None:
+        """Load the text of a save.
+
+        :param str path: The save
+        :param callback: A function to call with the text, or None on failure
+        """
+        self.__worker.submit(lambda: "".join(self.__store.read(path)), callback)
+
+    def shutdown(self) -> None:
+        """Wait for any queued work to complete."""
+        self.__worker.stop()
+        self.__search_worker.stop()
+
+    def show_directory(self) -> None:
+        """Export the saves as plain text and show them in the file manager."""
+        if not os.path.exists(self.DIRECTORY):
+            return
+
+        def on_exported(directory: Optional[str]) -> None:
+            if directory is not None:
+                Gio.AppInfo.launch_default_for_uri(f"file://{directory}", None)
 
-    @staticmethod
-    def show_directory() -> None:
-        """Show saves directory in file manager."""
-        if os.path.exists(EmergencySavesManager.DIRECTORY):
-            Gio.AppInfo.launch_default_for_uri(f"file://{EmergencySavesManager.DIRECTORY}", None)
+        self.__worker.submit(self.__store.export_plain_text, on_exported)
@@ -35,9 +35,7 @@ class FontSizeSelector(Gtk.Box):
 
     def __init__(self) -> None:
         super().__init__()
-        config_manager.settings.connect(
-            f"changed::{config_manager.FONT_SIZE}", lambda _o, _k: self.__refresh_from_setting()
-        )
+        config_manager.subscribe(config_manager.FONT_SIZE, self.__refresh_from_setting)
 
     def setup(self) -> None:
         self.__setup_actions()
@@ -0,0 +1,143 @@
+import re
+from typing import Optional
+
+# k is the token, v is the continuation
+DEFAULT_BULLET_LIST_TOKENS = {
+    "- [ ] ": "- [ ] ",
+    "- [x] ": "- [ ] ",
+    "- ": "- ",
+    "+ ": "+ ",
+    "* ": "* ",
+}
+
+ORDERED_LIST_ITEM = re.compile(r"^(\s*)([a-zA-Z]{1}|[0-9]+)([\.\)]){1}[ ]+")
+# As with GtkTextBuffer, kept in the split result
+LINE_BREAK = re.compile("(\r\n|[\r\n\u2029])")
+
+LIST_ITEM_INDENT = "  "
+TEXT_INDENT = "\t"
+
+
+class ListGrammar:
+    """Detects, continues and indents Markdown style list items within lines of text.
+
+    Independent of GTK, with matchers compiled once for a set of bullet tokens.
+    """
+
+    def __init__(self, bullet_tokens: Optional[dict[str, str]] = None) -> None:
+        """
+        :param bullet_tokens: Bullet tokens mapped to the token continuing the list on the next
+            line, earlier tokens taking precedence
+        """
+        self.__bullet_tokens = dict(
+            DEFAULT_BULLET_LIST_TOKENS if bullet_tokens is None else bullet_tokens
+        )
+        escaped_tokens = [re.escape(token) for token in self.__bullet_tokens.keys()]
+        self.__bullet_item = re.compile(r"^\s*(" + "|".join(escaped_tokens) + ")")
+
+    def match_bullet_item(self, line: str) -> Optional[re.Match]:
+        """Match a bullet list item at the start of a line.
+
+        :param str line: The line
+        :return: The match, covering any leading spacing and the token
+        :rtype: Optional[re.Match]
+        """
+        return self.__bullet_item.match(line)
+
+    @staticmethod
+    def match_ordered_item(line: str) -> Optional[re.Match]:
+        """Match an ordered list item at the start of a line.
+
+        :param str line: The line
+        :return: The match, grouping the spacing, index and delimiter
+        :rtype: Optional[re.Match]
+        """
+        return ORDERED_LIST_ITEM.match(line)
+
+    def is_list_item(self, line: str) -> bool:
+        """Determine whether a line is a list item.
+
+        :param str line: The line
+        :return: Whether a list item
+        :rtype: bool
+        """
+        return (
+            self.__bullet_item.match(line) is not None or ORDERED_LIST_ITEM.match(line) is not None
+        )
+
+    def continue_bullet_item(self, matched_list_item: str) -> str:
+        """Generate the markup for the next item in a bullet list.
+
+        :param str matched_list_item: The matched spacing and token of the previous item
+        :return: The next item's spacing and token
+        :rtype: str
+        """
+        token = matched_list_item.lstrip()
+        spacing = matched_list_item[0 : len(matched_list_item) - len(token)]
+        return f"{spacing}{self.__bullet_tokens[token]}"
+
+    def indent_for(self, line: str) -> str:
+        """Determine the indentation step for a line.
+
+        :param str line: The line
+        :return: The indentation added or removed in one step
+        :rtype: str
+        """
+        return LIST_ITEM_INDENT if self.is_list_item(line) else TEXT_INDENT
+
+    def indent_lines(self, text: str, increase: bool) -> tuple[str, list[int]]:
+        """Indent or outdent each non-empty line by one step.
+
+        :param str text: The lines
+        :param bool increase: Whether to indent rather than outdent
+        :return: The new text, and the change in length at the start of each line
+        :rtype: tuple[str, list[int]]
+        """
+        parts = LINE_BREAK.split(text)
+        deltas = []
+        # Lines alternate with their line breaks
+        for i in range(0, len(parts), 2):
+            line = parts[i]
+            delta = 0
+            if line != "":
+                indent = self.indent_for(line)
+                if increase:
+                    parts[i] = indent + line
+                    delta = len(indent)
+                elif line.startswith(indent):
+                    parts[i] = line[len(indent) :]
+                    delta = -len(indent)
+            deltas.append(delta)
+        return "".join(parts), deltas
+
+
+def calculate_ordered_list_index(reference: str, direction: int) -> Optional[str]:
+    """Calculate an item in an ordered list sequence.
+
+    :param str reference: The element to start from
+    :param str direction: The direction, 1 or -1
+    :return: The item
+    :rtype: Optional[str]
+    """
+    sequence_next = None
+    if reference.isdigit():
+        sequence_next = str(int(reference) + direction)
+        if sequence_next == 0:
+            sequence_next = None
+    elif direction > 0 and reference.upper() != "Z":
+        sequence_next = chr(ord(reference) + 1)
+    elif direction < 0 and reference.upper() != "A":
+        sequence_next = chr(ord(reference) - 1)
+    return sequence_next
+
+
+def format_ordered_list_item(spacing: str, index: str, delimiter: str) -> str:
+    """Generate string for list item.
+
+    :param str spacing: Pre marker spacing
+    :param str index: Item index
+    :param str delimiter: The delimiter before the item text
+    :return: The build string
+    :rtype: str
+    """
+    return f"{spacing}{index}{delimiter} "
@@ -0,0 +1,213 @@
+from array import array
+import bisect
+import itertools
+from typing import Iterable
+
+
+class MatchIndex:
+    """Sorted start and end offsets of non-overlapping search matches.
+
+    Finding the match at or around an offset, and its position among all matches, is by
+    bisection. Offsets are held in blocks, each relative to a base, so that shifting all the
+    matches after an edit costs a step per block rather than per match.
+
+    Independent of GTK.
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self, matches: Iterable[tuple[int, int]] = ()) -> None:
+        """
+        :param matches: Start and end offsets, in order
+        """
+        self.__bases: list[int] = []
+        # Arrays rather than lists, as the garbage collector then has no need to look through them
+        self.__starts: list[array] = []
+        self.__ends: list[array] = []
+        # Absolute start of the first match in, and number of matches before, each block
+        self.__firsts: list[int] = []
+        self.__counts: list[int] = []
+        self.__length = 0
+        self.set(matches)
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def set(self, matches: Iterable[tuple[int, int]]) -> None:
+        """Replace all matches.
+
+        :param matches: Start and end offsets, in order
+        """
+        self.__bases = []
+        self.__starts = []
+        self.__ends = []
+        # Taken a block at a time, so that a generator of many matches isn't held all at once
+        iterator = iter(matches)
+        while True:
+            chunk = list(itertools.islice(iterator, self.BLOCK_SIZE))
+            if not chunk:
+                break
+            self.__insert_blocks(len(self.__bases), chunk)
+        self.__update_summary(0)
+
+    def get(self, position: int) -> tuple[int, int]:
+        """Get a match by position.
+
+        :param int position: The position, counting from 1
+        :return: The start and end offsets
+        :rtype: tuple[int, int]
+        """
+        block = self.__block_of(position)
+        i = position - 1 - self.__counts[block]
+        base = self.__bases[block]
+        return (base + self.__starts[block][i], base + self.__ends[block][i])
+
+    def position(self, start: int, end: int) -> int:
+        """Get the position of a match.
+
+        :param int start: The match start offset
+        :param int end: The match end offset
+        :return: The position counting from 1, or 0 if not a match
+        :rtype: int
+        """
+        block, i = self.__locate(start)
+        if block == len(self.__starts):
+            return 0
+        base = self.__bases[block]
+        if base + self.__starts[block][i] != start or base + self.__ends[block][i] != end:
+            return 0
+        return self.__counts[block] + i + 1
+
+    def find_forward(self, offset: int) -> int:
+        """Find the first match starting at or after an offset.
+
+        :param int offset: The offset
+        :return: The position of the match counting from 1, or 0 if none
+        :rtype: int
+        """
+        block, i = self.__locate(offset)
+        if block == len(self.__starts):
+            return 0
+        return self.__counts[block] + i + 1
+
+    def find_backward(self, offset: int) -> int:
+        """Find the last match ending at or before an offset.
+
+        :param int offset: The offset
+        :return: The position of the match counting from 1, or 0 if none
+        :rtype: int
+        """
+        position = self.find_forward(offset)
+        # The position following the last match starting before the offset
+        position = self.__length + 1 if position == 0 else position
+        if position > 1 and self.get(position - 1)[1] > offset:
+            position -= 1
+        return position - 1
+
+    def shift(self, offset: int, delta: int) -> None:
+        """Move the matches starting at or after an offset, for text inserted or removed before.
+
+        :param int offset: The offset
+        :param int delta: The change in length
+        """
+        block, i = self.__locate(offset)
+        if block == len(self.__starts):
+            return
+        starts = self.__starts[block]
+        ends = self.__ends[block]
+        for j in range(i, len(starts)):
+            starts[j] += delta
+            ends[j] += delta
+        for later in range(block + 1, len(self.__bases)):
+            self.__bases[later] += delta
+        self.__update_summary(block)
+
+    def span_overlapping(self, start: int, end: int) -> tuple[int, int]:
+        """Extend a range to cover any matches overlapping it.
+
+        :param int start: The range start offset
+        :param int end: The range end offset
+        :return: The extended start and end offsets
+        :rtype: tuple[int, int]
+        """
+        first, last = self.__positions_overlapping(start, end)
+        if first < last:
+            start = min(start, self.get(first)[0])
+            end = max(end, self.get(last - 1)[1])
+        return start, end
+
+    def replace(self, start: int, end: int, matches: list[tuple[int, int]]) -> None:
+        """Replace the matches overlapping a range.
+
+        :param int start: The range start offset
+        :param int end: The range end offset
+        :param matches: The new start and end offsets, in order, within the range
+        """
+        first, last = self.__positions_overlapping(start, end)
+        if first == last and not matches:
+            return
+
+        if not self.__starts:
+            self.__insert_blocks(0, matches)
+            self.__update_summary(0)
+            return
+
+        # The blocks holding the matches replaced, or that to insert into, are rebuilt
+        first_block = self.__block_of(min(first, self.__length))
+        last_block = self.__block_of(last - 1) if last > first else first_block
+        kept: list[tuple[int, int]] = []
+        for block in range(first_block, last_block + 1):
+            base = self.__bases[block]
+            kept.extend(
+                (base + s, base + e) for s, e in zip(self.__starts[block], self.__ends[block])
+            )
+        before = self.__counts[first_block]
+        kept[first - 1 - before : last - 1 - before] = matches
+
+        del self.__bases[first_block : last_block + 1]
+        del self.__starts[first_block : last_block + 1]
+        del self.__ends[first_block : last_block + 1]
+        self.__insert_blocks(first_block, kept)
+        self.__update_summary(first_block)
+
+    def __positions_overlapping(self, start: int, end: int) -> tuple[int, int]:
+        # The positions from the first match overlapping the range, up to but excluding that
+        # following the last
+        first = self.find_forward(start)
+        first = self.__length + 1 if first == 0 else first
+        if first > 1 and self.get(first - 1)[1] > start:
+            first -= 1
+        last = self.find_forward(end if end > start else start + 1)
+        last = self.__length + 1 if last == 0 else last
+        return first, max(first, last)
+
+    def __block_of(self, position: int) -> int:
+        return bisect.bisect_right(self.__counts, position - 1) - 1
+
+    def __locate(self, offset: int) -> tuple[int, int]:
+        # The block and index within of the first match starting at or after the offset
+        block = bisect.bisect_right(self.__firsts, offset) - 1
+        if block < 0:
+            return (0, 0)
+        i = bisect.bisect_left(self.__starts[block], offset - self.__bases[block])
+        if i == len(self.__starts[block]):
+            return (block + 1, 0)
+        return (block, i)
+
+    def __insert_blocks(self, block: int, matches: list[tuple[int, int]]) -> None:
+        for i in range(0, len(matches), self.BLOCK_SIZE):
+            chunk = matches[i : i + self.BLOCK_SIZE]
+            self.__bases.insert(block, 0)
+            self.__starts.insert(block, array("q", [s for s, _e in chunk]))
+            self.__ends.insert(block, array("q", [e for _s, e in chunk]))
+            block += 1
+
+    def __update_summary(self, block: int) -> None:
+        del self.__firsts[block:]
+        del self.__counts[block:]
+        count = self.__counts[-1] + len(self.__starts[block - 1]) if block > 0 else 0
+        for later in range(block, len(self.__starts)):
+            self.__firsts.append(self.__bases[later] + self.__starts[later][0])
+            self.__counts.append(count)
+            count += len(self.__starts[later])
+        self.__length = count
@@ -0,0 +1,184 @@
+from gi.repository import Gdk, Gio, GLib, GObject, Gtk
+
+import codecs
+import logging
+import re
+import time
+from typing import Callable, Optional
+
+
+class PastePipeline(GObject.Object):
+    """Pastes clipboard text into a view as it's read, a chunk at a time.
+
+    The clipboard is read as a stream, so that huge contents are never held whole, with the view
+    redrawn between chunks. The paste is a single user action, undone in one step, and the view
+    isn't editable until complete.
+    """
+
+    MIME_TYPE = "text/plain;charset=utf-8"
+    READ_LENGTH = 1048576
+    # Other than tabs and line breaks
+    CONTROL_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+    def __init__(self, view: Gtk.TextView, clean: bool = False) -> None:
+        """
+        :param Gtk.TextView view: The view to paste into
+        :param bool clean: Whether to normalise line endings and remove control characters
+        """
+        super().__init__()
+        self.__view = view
+        self.__buffer = view.get_buffer()
+        self.__clean = clean
+        self.__cancellable = Gio.Cancellable()
+        self.__decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # A carriage return at the end of a chunk may be followed by a line feed in the next
+        self.__held_back = ""
+        self.__mark: Optional[Gtk.TextMark] = None
+        self.__stream: Optional[Gio.InputStream] = None
+        self.__bytes_read = 0
+        self.__was_editable = True
+        self.__start_time = 0.0
+        self.__progress_callback: Optional[Callable[[int], None]] = None
+        self.__finished_callback: Optional[Callable[[bool], None]] = None
+
+    def start(
+        self,
+        clipboard: Gdk.Clipboard,
+        progress_callback: Optional[Callable[[int], None]] = None,
+        finished_callback: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        """Start pasting.
+
+        :param Gdk.Clipboard clipboard: The clipboard to paste from
+        :param progress_callback: A function to call with the number of bytes pasted, after each
+            chunk beyond the first
+        :param finished_callback: A function to call with whether the paste completed
+        """
+        self.__progress_callback = progress_callback
+        self.__finished_callback = finished_callback
+        self.__start_time = time.monotonic()
+        clipboard.read_async(
+            [self.MIME_TYPE], GLib.PRIORITY_DEFAULT, self.__cancellable, self.__on_read_started
+        )
+
+    def cancel(self) -> None:
+        """Stop pasting, keeping the text pasted so far."""
+        self.__cancellable.cancel()
+
+    def __on_read_started(self, clipboard: Gdk.Clipboard, result: Gio.AsyncResult) -> None:
+        try:
+            self.__stream, _mime_type = clipboard.read_finish(result)
+        except GLib.GError as e:
+            if self.__cancellable.is_cancelled():
+                self.__finish(False)
+                return
+            # Clipboard contents not offered as UTF-8 text need converting by GDK, which isn't
+            # available as a stream
+            logging.debug("Falling back to reading clipboard text whole: %s", e)
+            clipboard.read_text_async(self.__cancellable, self.__on_text_read)
+            return
+
+        self.__begin()
+        self.__read_next()
+
+    def __on_text_read(self, clipboard: Gdk.Clipboard, result: Gio.AsyncResult) -> None:
+        try:
+            text = clipboard.read_text_finish(result)
+        except GLib.GError as e:
+            if not self.__cancellable.is_cancelled():
+                logging.warning("Failed to read clipboard: %s", e)
+            self.__finish(False)
+            return
+        if text is None:
+            self.__finish(False)
+            return
+
+        self.__begin()
+        pieces = iter(range(0, len(text), self.READ_LENGTH))
+
+        def insert_next() -> bool:
+            start = next(pieces, None)
+            if self.__cancellable.is_cancelled():
+                self.__finish(False)
+                return GLib.SOURCE_REMOVE
+            if start is None:
+                self.__insert("", final=True)
+                self.__finish(True)
+                return GLib.SOURCE_REMOVE
+            piece = text[start : start + self.READ_LENGTH]
+            self.__insert(piece, final=False)
+            self.__on_chunk_pasted(len(piece.encode("utf-8")))
+            return GLib.SOURCE_CONTINUE
+
+        GLib.idle_add(insert_next, priority=GLib.PRIORITY_LOW)
+
+    def __read_next(self) -> None:
+        assert self.__stream is not None
+        # Low priority so that the view is redrawn between chunks
+        self.__stream.read_bytes_async(
+            self.READ_LENGTH, GLib.PRIORITY_LOW, self.__cancellable, self.__on_bytes_read
+        )
+
+    def __on_bytes_read(self, stream: Gio.InputStream, result: Gio.AsyncResult) -> None:
+        try:
+            data = stream.read_bytes_finish(result).get_data()
+        except GLib.GError as e:
+            if not self.__cancellable.is_cancelled():
+                logging.warning("Failed to read clipboard: %s", e)
+            self.__finish(False)
+            return
+
+        if not data:
+            self.__insert(self.__decoder.decode(b"", final=True), final=True)
+            self.__finish(True)
+            return
+
+        self.__insert(self.__decoder.decode(data), final=False)
+        self.__on_chunk_pasted(len(data))
+        self.__read_next()
+
+    def __on_chunk_pasted(self, length: int) -> None:
+        first = self.__bytes_read == 0
+        self.__bytes_read += length
+        if not first and self.__progress_callback is not None:
+            self.__progress_callback(self.__bytes_read)
+
+    def __begin(self) -> None:
+        buffer = self.__buffer
+        self.__was_editable = self.__view.get_editable()
+        buffer.begin_user_action()
+        buffer.delete_selection(True, self.__was_editable)
+        insert_iter = buffer.get_iter_at_mark(buffer.get_insert())
+        # Right gravity, so moving along with each chunk inserted
+        self.__mark = buffer.create_mark(None, insert_iter, False)
+        self.__view.set_editable(False)
+
+    def __insert(self, text: str, final: bool) -> None:
+        if self.__clean:
+            text = self.__held_back + text
+            self.__held_back = ""
+            if not final and text.endswith("\r"):
+                self.__held_back = "\r"
+                text = text[:-1]
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+            text = self.CONTROL_CHARACTERS.sub("", text)
+        if text and self.__mark is not None:
+            self.__buffer.insert(self.__buffer.get_iter_at_mark(self.__mark), text)
+
+    def __finish(self, success: bool) -> None:
+        if self.__mark is not None:
+            buffer = self.__buffer
+            self.__view.set_editable(self.__was_editable)
+            buffer.place_cursor(buffer.get_iter_at_mark(self.__mark))
+            buffer.delete_mark(self.__mark)
+            self.__mark = None
+            buffer.end_user_action()
+            self.__view.scroll_mark_onscreen(buffer.get_insert())
+        if self.__stream is not None:
+            self.__stream.close_async(GLib.PRIORITY_DEFAULT, None, None)
+            self.__stream = None
+
+        elapsed = (time.monotonic() - self.__start_time) * 1000
+        logging.debug(f"Pasted {self.__bytes_read} bytes in {elapsed:.0f}ms")
+        if self.__finished_callback is not None:
+            self.__finished_callback(success)
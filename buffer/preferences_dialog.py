@@ -10,6 +10,7 @@ class PreferencesDialog(Adw.PreferencesDialog):
     __gtype_name__ = "PreferencesDialog"
 
     _show_files_button = Gtk.Template.Child()
+    _search_files_button = Gtk.Template.Child()
 
     def __init__(self) -> None:
         super().__init__()
@@ -19,7 +20,12 @@ class PreferencesDialog(Adw.PreferencesDialog):
 
     @Gtk.Template.Callback()
     def _on_show_recovery_files(self, _button: Gtk.Button) -> None:
-        EmergencySavesManager.show_directory()
+        self.__app.activate_action("show-recovery-files")
+
+    @Gtk.Template.Callback()
+    def _on_search_recovery_files(self, _button: Gtk.Button) -> None:
+        self.close()
+        self.__app.activate_action("search-recovery-files")
 
     def __build_actions(self) -> None:
         action_group = Gio.SimpleActionGroup.new()
@@ -31,7 +37,9 @@ class PreferencesDialog(Adw.PreferencesDialog):
         for key in (
             config_manager.USE_MONOSPACE_FONT,
             config_manager.SPELLING_ENABLED,
+            config_manager.CLEAN_PASTED_TEXT,
             config_manager.QUIT_CLOSES_WINDOW,
+            config_manager.RESTORE_SESSION,
             config_manager.SHOW_CLOSE_BUTTON,
             config_manager.SHOW_LINE_NUMBERS,
         ):
@@ -51,6 +59,7 @@ class PreferencesDialog(Adw.PreferencesDialog):
         action_group.add_action(action)
         self.__files_action = action
         self._show_files_button.set_sensitive(init_state)
+        self._search_files_button.set_sensitive(init_state)
 
         self.insert_action_group("settings", action_group)
 
@@ -67,3 +76,4 @@ class PreferencesDialog(Adw.PreferencesDialog):
         new_value = EmergencySavesManager.DEFAULT_EMERGENCY_FILES if state.get_boolean() else 0
         config_manager.set_emergency_recover_files(new_value)
         self._show_files_button.set_sensitive(state.get_boolean())
+        self._search_files_button.set_sensitive(state.get_boolean())
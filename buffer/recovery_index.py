@@ -0,0 +1,173 @@
+from gi.repository import GObject
+
+from collections import OrderedDict
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+
+class RecoveryIndex(GObject.Object):
+    """Manifest of the files in the emergency recovery directory, oldest first.
+
+    The manifest is an append-only log of additions and removals which is rewritten once it holds
+    mostly stale lines, so that recording a save or trimming a file doesn't depend on how many
+    files the directory holds. Sizes are the bytes each save added to disk, which with
+    deduplicated storage can be less than the size of the snapshot.
+    """
+
+    FILENAME = "manifest"
+    SUFFIX = ".snapshot"
+    LEGACY_SUFFIX = ".txt"
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.__directory = directory
+        self.__path = os.path.join(directory, self.FILENAME)
+        self.__entries: Optional[OrderedDict[str, tuple[int, float]]] = None
+        self.__total_bytes = 0
+        self.__log_lines = 0
+
+    def reserve(self) -> Optional[str]:
+        """Claim a new, unique filename by exclusively creating it.
+
+        :return: The path, or None on failure
+        :rtype: Optional[str]
+        """
+        stem = datetime.datetime.now().strftime("%Y-%m-%dT%H%M%S.%f")
+        for attempt in range(100):
+            suffix = f"-{attempt}" if attempt else ""
+            path = os.path.join(self.__directory, f"{stem}{suffix}{self.SUFFIX}")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+                return path
+            except FileExistsError:
+                continue
+            except OSError as e:
+                logging.warning(f"Failed to create {path}: %s", e)
+                return None
+        return None
+
+    def release(self, path: str) -> None:
+        """Give up a reserved filename that didn't get used.
+
+        :param str path: The path
+        """
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def add(self, path: str, size: int) -> None:
+        """Record a completed save.
+
+        :param str path: The path
+        :param int size: Bytes the save added to disk
+        """
+        entries = self.__load()
+        name = os.path.basename(path)
+        added = time.time()
+        if name in entries:
+            self.__total_bytes -= entries[name][0]
+        entries[name] = (size, added)
+        self.__total_bytes += size
+        self.__append({"add": name, "size": size, "time": added})
+
+    def trim(self, max_count: int, max_bytes: int = 0, max_age: float = 0) -> list[str]:
+        """Drop the oldest files from the manifest until within the limits.
+
+        :param int max_count: The maximum number of files to keep
+        :param int max_bytes: The maximum total size to keep, 0 for unlimited
+        :param float max_age: The maximum age in seconds, 0 for unlimited
+        :return: Paths of the files to remove
+        :rtype: list[str]
+        """
+        entries = self.__load()
+        cutoff = time.time() - max_age if max_age > 0 else None
+        trimmed = []
+        while entries:
+            name, (size, added) = next(iter(entries.items()))
+            over_count = len(entries) > max_count
+            over_size = max_bytes > 0 and self.__total_bytes > max_bytes
+            too_old = cutoff is not None and added < cutoff
+            if not (over_count or over_size or too_old):
+                break
+
+            path = os.path.join(self.__directory, name)
+            logging.debug(f"Trimming {path}")
+            trimmed.append(path)
+            entries.popitem(last=False)
+            self.__total_bytes -= size
+            self.__append({"remove": name})
+
+        if len(entries) * 2 + 64 < self.__log_lines:
+            self.__rewrite()
+        return trimmed
+
+    def __load(self) -> OrderedDict[str, tuple[int, float]]:
+        if self.__entries is not None:
+            return self.__entries
+
+        self.__entries = OrderedDict()
+        self.__total_bytes = 0
+        self.__log_lines = 0
+        try:
+            with open(self.__path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self.__log_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "add" in record:
+                        self.__entries[record["add"]] = (record["size"], record["time"])
+                    elif "remove" in record:
+                        self.__entries.pop(record["remove"], None)
+        except FileNotFoundError:
+            self.__rebuild()
+            return self.__entries
+        except OSError as e:
+            logging.warning(f"Failed to read recovery manifest {self.__path}: %s", e)
+
+        self.__total_bytes = sum(size for size, _added in self.__entries.values())
+        return self.__entries
+
+    def __rebuild(self) -> None:
+        """Build the manifest from the directory, for files saved before it existed."""
+        assert self.__entries is not None
+        found = []
+        for entry in os.scandir(self.__directory):
+            if entry.name.endswith((self.SUFFIX, self.LEGACY_SUFFIX)):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(found):
+            self.__entries[name] = (size, mtime)
+        self.__total_bytes = sum(size for _mtime, _name, size in found)
+        logging.debug(f"Rebuilt recovery manifest with {len(found)} files")
+        self.__rewrite()
+
+    def __rewrite(self) -> None:
+        assert self.__entries is not None
+        temp_path = f"{self.__path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for name, (size, added) in self.__entries.items():
+                    f.write(json.dumps({"add": name, "size": size, "time": added}))
+                    f.write("\n")
+            os.replace(temp_path, self.__path)
+        except OSError as e:
+            logging.warning(f"Failed to write recovery manifest {self.__path}: %s", e)
+            return
+        self.__log_lines = len(self.__entries)
+
+    def __append(self, record: dict) -> None:
+        try:
+            with open(self.__path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record))
+                f.write("\n")
+        except OSError as e:
+            logging.warning(f"Failed to update recovery manifest {self.__path}: %s", e)
+            return
+        self.__log_lines += 1
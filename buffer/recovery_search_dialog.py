@@ -0,0 +1,107 @@
+from gi.repository import Adw, Gio, GLib, Gtk
+
+import datetime
+import os
+import re
+from typing import Iterator
+
+from buffer.emergency_saves_manager import EmergencySavesManager
+from buffer.recovery_search_index import RecoverySearchIndex
+
+
+@Gtk.Template(resource_path="/org/gnome/gitlab/cheywood/Buffer/ui/recovery_search_dialog.ui")
+class RecoverySearchDialog(Adw.Dialog):
+    __gtype_name__ = "RecoverySearchDialog"
+
+    _search_entry = Gtk.Template.Child()
+    _stack = Gtk.Template.Child()
+    _results = Gtk.Template.Child()
+
+    MATCH_MARKERS = re.compile(
+        f"[{RecoverySearchIndex.MATCH_START}{RecoverySearchIndex.MATCH_END}]"
+    )
+
+    def __init__(self, emergency_saves_manager: EmergencySavesManager) -> None:
+        super().__init__()
+        self.__app = Gio.Application.get_default()
+        self.__emergency_saves_manager = emergency_saves_manager
+        # Used to drop results for terms which have since changed
+        self.__query_serial = 0
+        self.__paths: dict[Gtk.ListBoxRow, str] = {}
+        self.set_focus(self._search_entry)
+        # Stops snippets being loaded
+        self.connect("closed", lambda _d: self.__cancel())
+
+    @Gtk.Template.Callback()
+    def _on_search_changed(self, _entry: Gtk.SearchEntry) -> None:
+        serial = self.__cancel()
+        query = self._search_entry.get_text()
+
+        def on_results(paths: list[str]) -> None:
+            if serial == self.__query_serial:
+                self.__show_results(paths)
+                rows = iter(list(self.__paths.items()))
+                self.__load_next_snippet(serial, query, rows)
+
+        if query.strip() == "":
+            self.__show_results([])
+        else:
+            self.__emergency_saves_manager.search(query, on_results)
+
+    @Gtk.Template.Callback()
+    def _on_row_activated(self, _listbox: Gtk.ListBox, row: Gtk.ListBoxRow) -> None:
+        self.__app.activate_action("open-recovery-file", GLib.Variant("s", self.__paths[row]))
+        self.close()
+
+    def __cancel(self) -> int:
+        self.__query_serial += 1
+        return self.__query_serial
+
+    def __show_results(self, paths: list[str]) -> None:
+        self._results.remove_all()
+        self.__paths.clear()
+        for path in paths:
+            row = Adw.ActionRow()
+            row.set_title(self.__describe(path))
+            row.set_subtitle_lines(3)
+            row.set_activatable(True)
+            self.__paths[row] = path
+            self._results.append(row)
+
+        have_results = len(paths) > 0 or self._search_entry.get_text().strip() == ""
+        self._stack.set_visible_child_name("results" if have_results else "empty")
+
+    def __load_next_snippet(
+        self, serial: int, query: str, rows: Iterator[tuple[Adw.ActionRow, str]]
+    ) -> None:
+        # Snippets are read from the saves, so are loaded after the results are shown, and one at
+        # a time so that a new search never waits behind more than one
+        entry = next(rows, None)
+        if entry is None:
+            return
+        row, path = entry
+
+        def on_snippet(snippet: str) -> None:
+            if serial == self.__query_serial:
+                row.set_subtitle(self.__format_snippet(snippet))
+                self.__load_next_snippet(serial, query, rows)
+
+        self.__emergency_saves_manager.get_snippet(path, query, on_snippet)
+
+    @staticmethod
+    def __describe(path: str) -> str:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            saved = datetime.datetime.strptime(stem[:24], "%Y-%m-%dT%H%M%S.%f")
+        except ValueError:
+            return stem
+        return saved.strftime("%c")
+
+    @staticmethod
+    def __format_snippet(snippet: str) -> str:
+        markup = ""
+        # Matched terms alternate with the surrounding text
+        for i, part in enumerate(RecoverySearchDialog.MATCH_MARKERS.split(snippet)):
+            part = GLib.markup_escape_text(re.sub(r"\s+", " ", part), -1)
+            markup += f"<b>{part}</b>" if i % 2 else part
+        return markup
@@ -0,0 +1,307 @@
+from gi.repository import GObject
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Optional
+import zlib
+
+from buffer.recovery_store import RecoveryStore
+
+
+class RecoverySearchIndex(GObject.Object):
+    """Full text index of the emergency recovery snapshots, using SQLite FTS5.
+
+    The index is brought up to date with the snapshots on disk when first opened, after which it's
+    updated as snapshots are saved and trimmed.
+
+    The full text table is contentless, holding only the index and not a second, uncompressed
+    copy of every snapshot. Snippets are instead taken from the snapshots themselves, a result at
+    a time. SQLite before 3.43 can't delete from a contentless table without the original text,
+    so there rows of removed snapshots are left unreachable and the table rebuilt once they
+    outnumber the rest.
+
+    Updated from one worker thread and searched from another, each with its own connection. The
+    database is in write-ahead log mode, so that searches don't wait for updates.
+    """
+
+    FILENAME = "search.db"
+    # Increased on changes to the tables, which are then rebuilt
+    SCHEMA_VERSION = 2
+    CONTENTLESS_DELETE = sqlite3.sqlite_version_info >= (3, 43, 0)
+    # Unreachable rows tolerated regardless of the number of snapshots
+    MIN_REBUILD_ORPHANS = 100
+
+    # Matches ranked, the most recently indexed, so that ranking stays quick however many match
+    RANKED_CANDIDATES = 2000
+
+    # Marks the matched terms in snippets
+    MATCH_START = "\x02"
+    MATCH_END = "\x03"
+    # Characters shown before the first match, and in all
+    SNIPPET_CONTEXT = 60
+    SNIPPET_LENGTH = 200
+
+    def __init__(self, directory: str, store: RecoveryStore) -> None:
+        super().__init__()
+        self.__path = os.path.join(directory, self.FILENAME)
+        self.__store = store
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__search_connection: Optional[sqlite3.Connection] = None
+        self.__unavailable = False
+        # Set once the index has caught up with the snapshots on disk, or can't be opened
+        self.__opened = threading.Event()
+
+    def open(self) -> None:
+        """Open the index, catching up with the snapshots on disk.
+
+        Called from the updating thread, ahead of any search.
+        """
+        self.__connect()
+
+    def add(self, path: str) -> None:
+        """Index a snapshot.
+
+        :param str path: The snapshot
+        """
+        connection = self.__connect()
+        if connection is None:
+            return
+        self.__index(connection, path)
+        connection.commit()
+
+    def remove(self, paths: list[str]) -> None:
+        """Remove snapshots from the index.
+
+        :param list[str] paths: The snapshots
+        """
+        connection = self.__connect()
+        if connection is None:
+            return
+        for path in paths:
+            self.__unindex(connection, os.path.basename(path))
+        connection.commit()
+        self.__rebuild_if_sparse(connection)
+
+    def search(self, query: str, limit: int = 50) -> list[str]:
+        """Search the snapshots, best matches first.
+
+        Waits for the index to be opened.
+
+        :param str query: The terms, the last treated as a prefix
+        :param int limit: Maximum number of results
+        :return: The paths of the matching snapshots
+        :rtype: list[str]
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        connection = self.__connect_for_search()
+        if connection is None:
+            return []
+
+        # Quote terms so that user input can't be taken as query syntax
+        match = " ".join('"{}"'.format(term.replace('"', '""')) for term in terms) + "*"
+        try:
+            # Ranking every match of a common term takes time in proportion to the number of
+            # snapshots, so only the most recent are ranked. Descending rowid order is the index's
+            # own, so they're found without visiting the rest.
+            candidates = connection.execute(
+                "SELECT rowid, rank FROM snapshots WHERE snapshots MATCH ?"
+                " ORDER BY rowid DESC LIMIT ?",
+                (match, self.RANKED_CANDIDATES),
+            ).fetchall()
+            best = [rowid for rowid, _rank in sorted(candidates, key=lambda row: row[1])]
+            best = best[:limit]
+            names = dict(
+                connection.execute(
+                    "SELECT rowid, name FROM names WHERE rowid IN ({})".format(
+                        ",".join("?" * len(best))
+                    ),
+                    best,
+                ).fetchall()
+            )
+        except sqlite3.Error as e:
+            logging.warning("Recovery search failed: %s", e)
+            return []
+
+        directory = os.path.dirname(self.__path)
+        # Rows left by removed snapshots have no name
+        return [os.path.join(directory, names[rowid]) for rowid in best if rowid in names]
+
+    def snippet(self, path: str, query: str) -> str:
+        """Get the text around the first match of a search in a snapshot.
+
+        :param str path: The snapshot
+        :param str query: The search terms
+        :return: The text, the matched terms marked with MATCH_START and MATCH_END
+        :rtype: str
+        """
+        return self.__snippet(path, self.__terms_pattern(query.split()))
+
+    def __connect(self) -> Optional[sqlite3.Connection]:
+        if self.__connection is not None or self.__unavailable:
+            return self.__connection
+
+        try:
+            connection = self.__open()
+        except sqlite3.DatabaseError as e:
+            # Rebuild from scratch if damaged
+            logging.warning(f"Recreating recovery search index {self.__path}: %s", e)
+            try:
+                os.unlink(self.__path)
+                connection = self.__open()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Failed to open recovery search index {self.__path}: %s", e)
+                self.__unavailable = True
+                self.__opened.set()
+                return None
+
+        self.__connection = connection
+        self.__synchronise(connection)
+        self.__opened.set()
+        return connection
+
+    def __connect_for_search(self) -> Optional[sqlite3.Connection]:
+        if self.__search_connection is not None:
+            return self.__search_connection
+        self.__opened.wait()
+        if self.__connection is None:
+            return None
+        try:
+            self.__search_connection = sqlite3.connect(self.__path)
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to open recovery search index {self.__path}: %s", e)
+        return self.__search_connection
+
+    def __open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.__path)
+        connection.execute("PRAGMA journal_mode = WAL")
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        if version != self.SCHEMA_VERSION:
+            # Earlier versions held a copy of the text or fewer prefix indexes, so are dropped and
+            # indexed afresh
+            connection.execute("DROP TABLE IF EXISTS snapshots")
+            connection.execute("DROP TABLE IF EXISTS names")
+            connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.__create_tables(connection)
+        connection.commit()
+        return connection
+
+    def __create_tables(self, connection: sqlite3.Connection) -> None:
+        # Snapshot names are kept apart from the full text table so that they're looked up through
+        # a regular index
+        connection.execute("CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY)")
+        # Prefix indexes keep search as you type quick, as otherwise the index of every word
+        # sharing the prefix is merged. Longer prefixes are shared by few enough words.
+        options = "content='', prefix='1 2 3 4 5 6'"
+        if self.CONTENTLESS_DELETE:
+            options += ", contentless_delete=1"
+        connection.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS snapshots USING fts5(content, {options})"
+        )
+
+    def __synchronise(self, connection: sqlite3.Connection) -> None:
+        """Catch up with snapshots saved or removed while the index wasn't in use."""
+        indexed = {name for (name,) in connection.execute("SELECT name FROM names")}
+        on_disk = {os.path.basename(path): path for path in self.__store.list_snapshots()}
+
+        stale = indexed - on_disk.keys()
+        for name in stale:
+            self.__unindex(connection, name)
+        missing = on_disk.keys() - indexed
+        # In order saved, as names are timestamps, so that recent snapshots are ranked
+        for name in sorted(missing):
+            self.__index(connection, on_disk[name])
+        connection.commit()
+        if stale or missing:
+            logging.debug(f"Recovery search index added {len(missing)}, removed {len(stale)}")
+        self.__rebuild_if_sparse(connection)
+
+    def __rebuild_if_sparse(self, connection: sqlite3.Connection) -> None:
+        if self.CONTENTLESS_DELETE:
+            return
+        (rows,) = connection.execute("SELECT count(*) FROM snapshots").fetchone()
+        (indexed,) = connection.execute("SELECT count(*) FROM names").fetchone()
+        if rows - indexed <= max(indexed, self.MIN_REBUILD_ORPHANS):
+            return
+        logging.debug(f"Rebuilding recovery search index, {rows - indexed} removed rows")
+        connection.execute("DROP TABLE snapshots")
+        connection.execute("DELETE FROM names")
+        self.__create_tables(connection)
+        for path in sorted(self.__store.list_snapshots()):
+            self.__index(connection, path)
+        connection.commit()
+
+    def __index(self, connection: sqlite3.Connection, path: str) -> None:
+        try:
+            text = "".join(self.__store.read(path))
+        except (OSError, ValueError, zlib.error) as e:
+            logging.warning(f"Failed to read {path} for indexing: %s", e)
+            return
+        if text == "":
+            # Reserved for a save still in progress, indexed on completion
+            return
+        name = os.path.basename(path)
+        self.__unindex(connection, name)
+        rowid = connection.execute("INSERT INTO names (name) VALUES (?)", (name,)).lastrowid
+        connection.execute("INSERT INTO snapshots (rowid, content) VALUES (?, ?)", (rowid, text))
+
+    def __unindex(self, connection: sqlite3.Connection, name: str) -> None:
+        row = connection.execute("SELECT rowid FROM names WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            # Otherwise the row is left, unreachable as it's only found through its name
+            if self.CONTENTLESS_DELETE:
+                connection.execute("DELETE FROM snapshots WHERE rowid = ?", row)
+            connection.execute("DELETE FROM names WHERE rowid = ?", row)
+
+    @staticmethod
+    def __terms_pattern(terms: list[str]) -> re.Pattern:
+        # Approximates the index's matching: whole words, ignoring case, the last term a prefix
+        phrases = []
+        for i, term in enumerate(terms):
+            words = re.findall(r"\w+", term)
+            if words:
+                phrase = r"\W+".join(re.escape(word) for word in words)
+                phrases.append(phrase + (r"\w*" if i == len(terms) - 1 else r"(?!\w)"))
+        if not phrases:
+            return re.compile(r"(?!)")
+        return re.compile(r"(?<!\w)(?:{})".format("|".join(phrases)), re.IGNORECASE)
+
+    def __snippet(self, path: str, pattern: re.Pattern) -> str:
+        # Read only as far as the first match, plus what's needed to show the text following it
+        text = ""
+        found = None
+        try:
+            for piece in self.__store.read(path):
+                text += piece.replace(self.MATCH_START, "").replace(self.MATCH_END, "")
+                if found is None:
+                    found = pattern.search(text)
+                    if found is None:
+                        # Kept in case a match spans into the next piece
+                        text = text[-self.SNIPPET_LENGTH :]
+                        continue
+                if len(text) - found.start() >= self.SNIPPET_LENGTH:
+                    break
+        except (OSError, ValueError, zlib.error) as e:
+            logging.warning(f"Failed to read {path} for a search snippet: %s", e)
+
+        start = 0 if found is None else max(found.start() - self.SNIPPET_CONTEXT, 0)
+        if start > 0:
+            # From the start of a word
+            space = text.find(" ", start, found.start() if found is not None else None)
+            start = space + 1 if space != -1 else start
+        end = min(start + self.SNIPPET_LENGTH, len(text))
+        snippet = "…" if start > 0 else ""
+        position = start
+        for match in pattern.finditer(text, start, end):
+            snippet += (
+                text[position : match.start()] + self.MATCH_START + match.group() + self.MATCH_END
+            )
+            position = match.end()
+        snippet += text[position:end]
+        if end < len(text):
+            snippet += "…"
+        return snippet
@@ -0,0 +1,343 @@
+from gi.repository import GObject
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Iterator, Optional
+import zlib
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class SnapshotWriter:
+    """Splits text into content-defined chunks as it's fed in, storing each chunk once.
+
+    Chunk boundaries are placed after lines whose hash matches a mask, so an edit only changes the
+    chunk it falls in and the rest of a revised buffer deduplicates against earlier snapshots.
+
+    Used from the worker thread only.
+    """
+
+    MIN_CHUNK_LENGTH = 16384
+    MAX_CHUNK_LENGTH = 262144
+    BOUNDARY_MASK = 0x3FF
+
+    def __init__(self, store: "RecoveryStore", path: str) -> None:
+        self.__store = store
+        self.__path = path
+        self.__remainder = ""
+        self.__lines: list[str] = []
+        self.__length = 0
+        self.__hashes: list[str] = []
+        self.__new_bytes = 0
+
+    def feed(self, text: str) -> bool:
+        """Add text to the snapshot.
+
+        On failure the chunks stored so far are released, and the writer shouldn't be used
+        further.
+
+        :param str text: The next piece of text
+        :return: Success
+        :rtype: bool
+        """
+        try:
+            success = self.__feed(text)
+        except Exception:
+            self.__abort()
+            raise
+        if not success:
+            self.__abort()
+        return success
+
+    def finish(self, text: str) -> Optional[int]:
+        """Add the final text and write out the snapshot.
+
+        On failure the chunks stored so far are released.
+
+        :param str text: The final piece of text
+        :return: Number of bytes newly written to disk, or None on failure
+        :rtype: Optional[int]
+        """
+        try:
+            written = self.__finish(text)
+        except Exception:
+            self.__abort()
+            raise
+        if written is None:
+            self.__abort()
+        return written
+
+    def __feed(self, text: str) -> bool:
+        lines = (self.__remainder + text).splitlines(keepends=True)
+        # The last line may continue in the next piece
+        self.__remainder = lines.pop() if lines else ""
+        for line in lines:
+            if not self.__add_line(line):
+                return False
+
+        while len(self.__remainder) >= self.MAX_CHUNK_LENGTH:
+            if not self.__add_line(self.__remainder[: self.MAX_CHUNK_LENGTH]):
+                return False
+            self.__remainder = self.__remainder[self.MAX_CHUNK_LENGTH :]
+        return True
+
+    def __finish(self, text: str) -> Optional[int]:
+        if not self.__feed(text):
+            return None
+        if self.__remainder:
+            self.__lines.append(self.__remainder)
+            self.__remainder = ""
+        if self.__lines and not self.__store_chunk():
+            return None
+
+        temp_path = f"{self.__path}.tmp"
+        contents = json.dumps({"chunks": self.__hashes})
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(contents)
+            os.replace(temp_path, self.__path)
+        except OSError as e:
+            logging.warning(f"Failed to write snapshot {self.__path}: %s", e)
+            _remove_quietly(temp_path)
+            return None
+
+        return self.__new_bytes + len(contents)
+
+    def __abort(self) -> None:
+        # Otherwise the chunks stored for the failed snapshot would never be removed
+        hashes = self.__hashes
+        self.__hashes = []
+        self.__lines = []
+        self.__remainder = ""
+        self.__store.release(hashes)
+
+    def __add_line(self, line: str) -> bool:
+        self.__lines.append(line)
+        self.__length += len(line)
+        if self.__length >= self.MAX_CHUNK_LENGTH or (
+            self.__length >= self.MIN_CHUNK_LENGTH
+            and zlib.crc32(line.encode("utf-8")) & self.BOUNDARY_MASK == 0
+        ):
+            return self.__store_chunk()
+        return True
+
+    def __store_chunk(self) -> bool:
+        data = "".join(self.__lines).encode("utf-8")
+        self.__lines = []
+        self.__length = 0
+        digest = hashlib.sha256(data).hexdigest()
+        written = self.__store.write_chunk(digest, data)
+        if written is None:
+            return False
+        self.__new_bytes += written
+        self.__hashes.append(digest)
+        return True
+
+
+class RecoveryStore(GObject.Object):
+    """Compressed, deduplicated storage for emergency recovery snapshots.
+
+    Each snapshot is a list of chunk hashes, chunks being zlib compressed and shared between
+    snapshots. Chunks are reference counted and removed along with the last snapshot using them.
+
+    Other than creating writers, used from the worker thread only, except that writers may run
+    concurrently at shutdown. Chunk writes and reference counting are safe for that.
+    """
+
+    CHUNKS_DIRECTORY = "chunks"
+    PLAIN_TEXT_DIRECTORY = "plain-text"
+    SNAPSHOT_SUFFIX = ".snapshot"
+    LEGACY_SUFFIX = ".txt"
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.__directory = directory
+        self.__chunks_directory = os.path.join(directory, self.CHUNKS_DIRECTORY)
+        self.__references: Optional[dict[str, int]] = None
+        self.__references_lock = threading.Lock()
+
+    @property
+    def plain_text_directory(self) -> str:
+        return os.path.join(self.__directory, self.PLAIN_TEXT_DIRECTORY)
+
+    def create_writer(self, path: str) -> SnapshotWriter:
+        """Start writing a snapshot.
+
+        :param str path: The snapshot's path
+        :return: The writer
+        :rtype: SnapshotWriter
+        """
+        return SnapshotWriter(self, path)
+
+    def write_chunk(self, digest: str, data: bytes) -> Optional[int]:
+        """Store a chunk if not already present, counting a reference to it.
+
+        :param str digest: The chunk's hash
+        :param bytes data: The chunk
+        :return: Number of bytes written, or None on failure
+        :rtype: Optional[int]
+        """
+        path = self.__chunk_path(digest)
+        # Counted before checking for the chunk so that a snapshot being removed meanwhile can't
+        # take it
+        with self.__references_lock:
+            references = self.__load_references()
+            references[digest] = references.get(digest, 0) + 1
+            if os.path.exists(path):
+                return 0
+
+        compressed = zlib.compress(data)
+        # Unique to the thread, as concurrent writers can store the same chunk
+        temp_path = f"{path}.{threading.get_native_id()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write recovery chunk {path}: %s", e)
+            _remove_quietly(temp_path)
+            self.__remove_references([digest])
+            return None
+        return len(compressed)
+
+    def release(self, hashes: list[str]) -> None:
+        """Drop references to chunks, removing any no longer used.
+
+        :param list[str] hashes: The chunks, once for each reference
+        """
+        self.__remove_references(hashes)
+
+    def remove(self, paths: list[str]) -> None:
+        """Remove snapshots, along with any chunks no longer used.
+
+        :param list[str] paths: The snapshots
+        """
+        for path in paths:
+            hashes = self.__read_hashes(path) if path.endswith(self.SNAPSHOT_SUFFIX) else []
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Failed to remove {path} for emergency recovery trimming: %s", e)
+                continue
+            self.__remove_references(hashes)
+
+    def read(self, path: str) -> Iterator[str]:
+        """Read a snapshot's text, piece by piece.
+
+        :param str path: The snapshot
+        :return: The text
+        :rtype: Iterator[str]
+        """
+        if path.endswith(self.LEGACY_SUFFIX):
+            with open(path, "r", encoding="utf-8") as f:
+                while True:
+                    text = f.read(SnapshotWriter.MAX_CHUNK_LENGTH)
+                    if not text:
+                        break
+                    yield text
+            return
+
+        for digest in self.__read_hashes(path):
+            with open(self.__chunk_path(digest), "rb") as f:
+                yield zlib.decompress(f.read()).decode("utf-8")
+
+    def list_snapshots(self) -> list[str]:
+        """List the paths of all snapshots, including those in the previous plain text format.
+
+        :return: The paths
+        :rtype: list[str]
+        """
+        paths = []
+        for entry in os.scandir(self.__directory):
+            if entry.name.endswith((self.SNAPSHOT_SUFFIX, self.LEGACY_SUFFIX)):
+                paths.append(entry.path)
+        return paths
+
+    def export_plain_text(self) -> Optional[str]:
+        """Make each snapshot available as a plain text file.
+
+        Only snapshots not yet exported are written, exports of removed snapshots are removed.
+
+        :return: The directory containing the files, or None on failure
+        :rtype: Optional[str]
+        """
+        directory = self.plain_text_directory
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logging.warning(f"Failed to create {directory}: %s", e)
+            return None
+
+        wanted = {}
+        for path in self.list_snapshots():
+            stem = os.path.splitext(os.path.basename(path))[0]
+            wanted[f"{stem}.txt"] = path
+
+        for entry in os.scandir(directory):
+            if entry.name not in wanted:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+        for name, source in wanted.items():
+            target = os.path.join(directory, name)
+            if os.path.exists(target) or os.path.getsize(source) == 0:
+                # Already exported, or reserved for a save still in progress
+                continue
+            temp_path = f"{target}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    for text in self.read(source):
+                        f.write(text)
+                os.replace(temp_path, target)
+            except (OSError, ValueError, zlib.error) as e:
+                logging.warning(f"Failed to export {source}: %s", e)
+        return directory
+
+    def __chunk_path(self, digest: str) -> str:
+        return os.path.join(self.__chunks_directory, digest[:2], digest)
+
+    def __read_hashes(self, path: str) -> list[str]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["chunks"]
+        except (OSError, ValueError, KeyError):
+            # Includes files reserved for saves still in progress
+            return []
+
+    def __remove_references(self, hashes: list[str]) -> None:
+        with self.__references_lock:
+            references = self.__load_references()
+            for digest in hashes:
+                count = references.get(digest, 0) - 1
+                if count > 0:
+                    references[digest] = count
+                    continue
+                references.pop(digest, None)
+                try:
+                    os.unlink(self.__chunk_path(digest))
+                except OSError:
+                    pass
+
+    def __load_references(self) -> dict[str, int]:
+        if self.__references is not None:
+            return self.__references
+
+        self.__references = {}
+        for path in self.list_snapshots():
+            if path.endswith(self.SNAPSHOT_SUFFIX):
+                for digest in self.__read_hashes(path):
+                    self.__references[digest] = self.__references.get(digest, 0) + 1
+        return self.__references
@@ -0,0 +1,474 @@
+from gi.repository import GLib, GObject, Gtk
+
+from array import array
+import logging
+import re
+import time
+from typing import Callable, Optional
+
+from buffer.background_worker import BackgroundWorker
+from buffer.match_index import MatchIndex
+from buffer.search_pattern import MatchTimeout, time_limit
+
+
+class SearchMatchTracker(GObject.Object):
+    """Keeps an index of the matches of a search pattern in a buffer.
+
+    The buffer is scanned once on a worker thread, a window at a time, after which the index is
+    kept current by rescanning only around each edit. Until then matches are found by searching
+    the buffer directly, a chunk at a time.
+
+    Regular expressions may backtrack catastrophically, and can't be interrupted on a worker
+    thread, so are instead scanned on the main thread in time limited slices. As their matches
+    have no bounded length the whole buffer is rescanned shortly after edits. Empty matches are
+    ignored.
+    """
+
+    __gsignals__ = {
+        "changed": (GObject.SignalFlags.RUN_FIRST, None, ()),
+    }
+
+    # Matches scanned between checks for a newer pattern
+    CANCEL_CHECK_INTERVAL = 4096
+    # Characters searched at a time when searching the buffer directly
+    SEARCH_CHUNK = 65536
+    # Seconds of scanning per idle callback, for patterns scanned on the main thread
+    TIME_BUDGET = 0.004
+    # Milliseconds after an edit before rescanning, for patterns of unbounded length
+    RESCAN_DELAY = 300
+
+    __worker: Optional[BackgroundWorker] = None
+
+    def __init__(self, buffer: Gtk.TextBuffer) -> None:
+        """
+        :param Gtk.TextBuffer buffer: The buffer
+        """
+        super().__init__()
+        self.__buffer = buffer
+        self.__index = MatchIndex()
+        self.__pattern: Optional[re.Pattern] = None
+        self.__max_length: Optional[int] = 0
+        self.__ready = False
+        self.__count_cap = 0
+        self.__count_capped = False
+        self.__timed_out = False
+        self.__rescan_source_id: Optional[int] = None
+        # Edited while scanning, so that the scan is out of date
+        self.__stale = False
+        # Incremented for each scan, to discard results from superseded ones
+        self.__generation = 0
+        self.__handler_ids: list[int] = []
+        self.__deleted_at = 0
+
+    @property
+    def index(self) -> MatchIndex:
+        return self.__index
+
+    @property
+    def ready(self) -> bool:
+        return self.__ready
+
+    @property
+    def count_capped(self) -> bool:
+        """Whether, while still scanning, more matches than the count cap have been found."""
+        return self.__count_capped
+
+    @property
+    def timed_out(self) -> bool:
+        """Whether matching the pattern ran beyond the time limit, so was abandoned."""
+        return self.__timed_out
+
+    def set_pattern(
+        self, pattern: Optional[re.Pattern], max_length: Optional[int], count_cap: int = 0
+    ) -> None:
+        """Start tracking a pattern.
+
+        :param Optional[re.Pattern] pattern: The pattern, or None for no matches
+        :param Optional[int] max_length: The greatest length of text the pattern can match, or
+            None if unbounded, as for regular expressions
+        :param int count_cap: The number of matches after which "changed" is emitted during the
+            scan, 0 for none
+        """
+        self.__pattern = pattern
+        self.__max_length = max_length
+        self.__count_cap = count_cap
+        self.__count_capped = False
+        self.__timed_out = False
+        self.__cancel_rescan()
+        self.__index.set([])
+        self.__ready = pattern is None
+        self.__generation += 1
+        if pattern is None:
+            self.emit("changed")
+            return
+
+        if not self.__handler_ids:
+            buffer = self.__buffer
+            self.__handler_ids = [
+                buffer.connect_after("insert-text", self.__on_inserted),
+                buffer.connect("delete-range", self.__on_deleting),
+                buffer.connect_after("delete-range", self.__on_deleted),
+            ]
+        self.__scan()
+
+    def stop(self) -> None:
+        """Stop tracking, freeing the index."""
+        for handler_id in self.__handler_ids:
+            self.__buffer.disconnect(handler_id)
+        self.__handler_ids = []
+        self.__pattern = None
+        self.__generation += 1
+        self.__cancel_rescan()
+        self.__index.set([])
+        self.__ready = False
+        self.__count_capped = False
+        self.__timed_out = False
+
+    def find(self, offset: int, forward: bool) -> Optional[tuple[int, int]]:
+        """Find the next or previous match, wrapping around the buffer.
+
+        :param int offset: The offset to search from, forward for a match starting at or after and
+            backward for one ending at or before
+        :param bool forward: Whether to search forward
+        :return: The start and end offsets of the match, or None if none
+        :rtype: Optional[tuple[int, int]]
+        """
+        if self.__pattern is None or self.__timed_out:
+            return None
+
+        if self.__ready:
+            index = self.__index
+            position = index.find_forward(offset) if forward else index.find_backward(offset)
+            if position == 0 and len(index) > 0:
+                position = 1 if forward else len(index)
+            return index.get(position) if position > 0 else None
+
+        if self.__max_length is None:
+            return self.__find_unbounded(offset, forward)
+        length = self.__buffer.get_char_count()
+        if forward:
+            return self.__search_forward(offset, length) or self.__search_forward(0, offset)
+        return self.__search_backward(0, offset) or self.__search_backward(offset, length)
+
+    def __search_forward(self, start: int, end: int) -> Optional[tuple[int, int]]:
+        # The first match starting within the range
+        assert self.__pattern is not None and self.__max_length is not None
+        length = self.__buffer.get_char_count()
+        while start < end:
+            chunk_end = min(start + self.SEARCH_CHUNK, end)
+            text = self.__get_text(start, min(chunk_end + self.__max_length, length))
+            for match in self.__pattern.finditer(text):
+                if start + match.start() >= chunk_end:
+                    break
+                if match.end() > match.start():
+                    return (start + match.start(), start + match.end())
+            start = chunk_end
+        return None
+
+    def __search_backward(self, start: int, end: int) -> Optional[tuple[int, int]]:
+        # The last match ending within the range
+        assert self.__pattern is not None and self.__max_length is not None
+        while end > start:
+            chunk_start = max(end - self.SEARCH_CHUNK, start)
+            text_start = max(chunk_start - self.__max_length, 0)
+            found = None
+            for match in self.__pattern.finditer(self.__get_text(text_start, end)):
+                if text_start + match.end() > chunk_start and match.end() > match.start():
+                    found = (text_start + match.start(), text_start + match.end())
+            if found is not None:
+                return found
+            end = chunk_start
+        return None
+
+    def __find_unbounded(self, offset: int, forward: bool) -> Optional[tuple[int, int]]:
+        # Matches may be of any length, so are sought in the whole text, with the time limited
+        text = self.__get_text(0, self.__buffer.get_char_count())
+        length = len(text)
+        try:
+            with time_limit():
+                if forward:
+                    found = self.__search_text_forward(text, offset, length)
+                    return found or self.__search_text_forward(text, 0, offset)
+                found = self.__search_text_backward(text, 0, offset)
+                return found or self.__search_text_backward(text, offset, length)
+        except MatchTimeout:
+            self.__abandon()
+            return None
+
+    def __search_text_forward(self, text: str, start: int, end: int) -> Optional[tuple[int, int]]:
+        # The first match starting within the range
+        assert self.__pattern is not None
+        for match in self.__pattern.finditer(text, start):
+            if match.start() >= end:
+                break
+            if match.end() > match.start():
+                return match.span()
+        return None
+
+    def __search_text_backward(self, text: str, start: int, end: int) -> Optional[tuple[int, int]]:
+        # The last match ending within the range, looking back a chunk at a time
+        assert self.__pattern is not None
+        chunk_end = end
+        while chunk_end > start:
+            chunk_start = max(chunk_end - self.SEARCH_CHUNK, start)
+            # Matches ending within the range may start before it
+            from_offset = (
+                max(chunk_start - self.SEARCH_CHUNK, 0) if chunk_start == start else chunk_start
+            )
+            found = None
+            for match in self.__pattern.finditer(text, from_offset):
+                if match.start() >= chunk_end:
+                    break
+                if start < match.end() <= end and match.end() > match.start():
+                    found = match.span()
+            if found is not None:
+                return found
+            chunk_end = chunk_start
+        return None
+
+    def __abandon(self) -> None:
+        logging.warning("Search pattern took too long to match, abandoning")
+        self.__generation += 1
+        self.__cancel_rescan()
+        self.__timed_out = True
+        self.__ready = False
+        self.__index.set([])
+        self.emit("changed")
+
+    def __get_text(self, start: int, end: int) -> str:
+        buffer = self.__buffer
+        return buffer.get_text(
+            buffer.get_iter_at_offset(start), buffer.get_iter_at_offset(end), True
+        )
+
+    def __scan(self) -> None:
+        assert self.__pattern is not None
+        self.__stale = False
+        generation = self.__generation
+        start_time = time.monotonic()
+
+        def on_capped() -> None:
+            if generation == self.__generation and not self.__ready:
+                self.__count_capped = True
+                self.emit("changed")
+
+        def on_scanned(index: Optional[MatchIndex]) -> None:
+            if generation != self.__generation or index is None:
+                return
+            if self.__stale:
+                self.__scan()
+                return
+            elapsed = (time.monotonic() - start_time) * 1000
+            logging.debug(f"Indexed {len(index)} search matches in {elapsed:.0f}ms")
+            self.__index = index
+            self.__ready = True
+            self.__count_capped = False
+            self.emit("changed")
+
+        if self.__max_length is None:
+            text = self.__get_text(0, self.__buffer.get_char_count())
+            self.__scan_in_slices(text, generation, on_capped, on_scanned)
+        else:
+            self.__scan_in_windows(generation, on_capped, on_scanned)
+
+    def __scan_in_slices(
+        self,
+        text: str,
+        generation: int,
+        on_capped: Callable[[], None],
+        on_scanned: Callable[[Optional[MatchIndex]], None],
+    ) -> None:
+        assert self.__pattern is not None
+        matches: list[tuple[int, int]] = []
+        iterator = self.__pattern.finditer(text)
+
+        def scan_slice() -> bool:
+            if generation != self.__generation:
+                return GLib.SOURCE_REMOVE
+            deadline = time.monotonic() + self.TIME_BUDGET
+            try:
+                with time_limit():
+                    for match in iterator:
+                        if match.end() > match.start():
+                            matches.append(match.span())
+                            if len(matches) == self.__count_cap:
+                                on_capped()
+                        if time.monotonic() > deadline:
+                            return GLib.SOURCE_CONTINUE
+            except MatchTimeout:
+                self.__abandon()
+                return GLib.SOURCE_REMOVE
+            on_scanned(MatchIndex(matches))
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(scan_slice, priority=GLib.PRIORITY_LOW)
+
+    def __scan_in_windows(
+        self,
+        generation: int,
+        on_capped: Callable[[], None],
+        on_scanned: Callable[[Optional[MatchIndex]], None],
+    ) -> None:
+        # Each window of the buffer is read on the main loop and searched on the worker, the next
+        # being read once the previous has been searched. Neither thread holds the interpreter
+        # lock for long, and no more than a window of the buffer is copied at a time.
+        assert self.__pattern is not None and self.__max_length is not None
+        if SearchMatchTracker.__worker is None:
+            SearchMatchTracker.__worker = BackgroundWorker("search")
+        worker = SearchMatchTracker.__worker
+        pattern = self.__pattern
+        count_cap = self.__count_cap
+        # Kept as arrays rather than a list of pairs, as the garbage collector would otherwise look
+        # through what may be millions of objects, holding up the main loop as matching does
+        starts = array("q")
+        ends = array("q")
+        # Where searching resumes, the end of the last match or the start of the next window.
+        # Only used on the worker.
+        position = 0
+        window_start = 0
+
+        def read_next(_result: None = None) -> None:
+            nonlocal window_start
+            if generation != self.__generation:
+                return
+            if self.__stale:
+                # Offsets read before and after the edit don't line up, so start again
+                self.__scan()
+                return
+            if count_cap and not self.__count_capped and len(starts) >= count_cap:
+                on_capped()
+            length = self.__buffer.get_char_count()
+            if window_start >= length:
+                # Built on the worker too, being slow for many matches
+                worker.submit(lambda: MatchIndex(zip(starts, ends)), on_scanned)
+                return
+            window_end = min(window_start + self.SEARCH_CHUNK, length)
+            text_start, text = self.__get_window(window_start, window_end)
+            worker.submit(lambda: search(text, text_start, window_end), read_next)
+            window_start = window_end
+
+        def search(text: str, text_start: int, window_end: int) -> None:
+            nonlocal position
+            for match in pattern.finditer(text, position - text_start):
+                start = text_start + match.start()
+                if start >= window_end:
+                    break
+                if match.end() > match.start():
+                    position = text_start + match.end()
+                    starts.append(start)
+                    ends.append(position)
+            position = max(position, window_end)
+            # Let the main loop take the interpreter lock
+            time.sleep(0)
+
+        read_next()
+
+    def __get_window(self, start: int, end: int) -> tuple[int, str]:
+        # The text in which to find matches starting within a range. Includes a match length
+        # after, and a character either side for the lookarounds of whole word matching.
+        assert self.__max_length is not None
+        text_start = max(start - 1, 0)
+        text_end = min(end + self.__max_length + 1, self.__buffer.get_char_count())
+        return text_start, self.__get_text(text_start, text_end)
+
+    def __on_inserted(
+        self, _buffer: Gtk.TextBuffer, location: Gtk.TextIter, text: str, _length: int
+    ) -> None:
+        if not self.__ready:
+            self.__stale = True
+            return
+        if self.__max_length is None:
+            self.__queue_rescan()
+            return
+        # The location has been moved to the end of the inserted text
+        end = location.get_offset()
+        start = end - len(text)
+        self.__index.shift(start, end - start)
+        self.__rescan_around(start, end)
+
+    def __on_deleting(
+        self, _buffer: Gtk.TextBuffer, start: Gtk.TextIter, end: Gtk.TextIter
+    ) -> None:
+        if not self.__ready:
+            self.__stale = True
+            return
+        if self.__max_length is None:
+            self.__queue_rescan()
+            return
+        start_offset = start.get_offset()
+        end_offset = end.get_offset()
+        if start_offset > end_offset:
+            start_offset, end_offset = end_offset, start_offset
+        self.__index.replace(start_offset, end_offset, [])
+        self.__index.shift(end_offset, start_offset - end_offset)
+        self.__deleted_at = start_offset
+
+    def __on_deleted(
+        self, _buffer: Gtk.TextBuffer, _start: Gtk.TextIter, _end: Gtk.TextIter
+    ) -> None:
+        if self.__ready:
+            self.__rescan_around(self.__deleted_at, self.__deleted_at)
+
+    def __queue_rescan(self) -> None:
+        # Until rescanned the index is out of date, so navigation searches the buffer directly
+        self.__ready = False
+        self.__generation += 1
+        self.__index.set([])
+        self.__rescan_source_id = GLib.timeout_add(self.RESCAN_DELAY, self.__on_rescan_timeout)
+
+    def __on_rescan_timeout(self) -> bool:
+        self.__rescan_source_id = None
+        if self.__pattern is not None:
+            self.__scan()
+        return GLib.SOURCE_REMOVE
+
+    def __cancel_rescan(self) -> None:
+        if self.__rescan_source_id is not None:
+            GLib.source_remove(self.__rescan_source_id)
+            self.__rescan_source_id = None
+
+    def __rescan_around(self, start: int, end: int) -> None:
+        assert self.__pattern is not None and self.__max_length is not None
+        length = self.__buffer.get_char_count()
+        # Any match including edited text lies within a match length either side
+        rescan_start, rescan_end = self.__index.span_overlapping(
+            max(0, start - self.__max_length), min(length, end + self.__max_length)
+        )
+        # Where the term can overlap itself, as "aa" in a run of "a", the matches after the edit
+        # can fall differently from those indexed. Rescanning continues until the two line up,
+        # at an offset beyond any match the edit touched with no match, old or new, running
+        # across it. Matching from there is on unchanged text so finds what's indexed.
+        sync_from = max(rescan_end, min(end + 1, length))
+        matches: list[tuple[int, int]] = []
+        position = rescan_start
+        window_end = sync_from
+        while True:
+            text_start, text = self.__get_window(position, window_end)
+            for match in self.__pattern.finditer(text, position - text_start):
+                match_start = text_start + match.start()
+                if match_start >= window_end:
+                    break
+                if match_start >= sync_from and not self.__runs_across(match_start):
+                    self.__replace(rescan_start, match_start, matches)
+                    return
+                if match.end() > match.start():
+                    position = text_start + match.end()
+                    matches.append((match_start, position))
+            position = max(position, window_end)
+            if position >= length or not self.__runs_across(position):
+                self.__replace(rescan_start, position, matches)
+                return
+            if window_end - sync_from >= self.SEARCH_CHUNK:
+                # A long run of the term, left to a rescan on the worker
+                self.__queue_rescan()
+                return
+            window_end = min(window_end + self.SEARCH_CHUNK, length)
+
+    def __runs_across(self, offset: int) -> bool:
+        # Whether an indexed match starts before and ends after an offset
+        return self.__index.span_overlapping(offset, offset)[0] < offset
+
+    def __replace(self, start: int, end: int, matches: list[tuple[int, int]]) -> None:
+        if end > start:
+            self.__index.replace(start, end, matches)
+        self.emit("changed")
@@ -0,0 +1,75 @@
+import re
+import signal
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional
+
+# Seconds a single match may take on the main thread before it's abandoned
+MATCH_TIME_LIMIT = 0.5
+
+
+class MatchTimeout(Exception):
+    """Matching ran beyond its time limit."""
+
+
+@lru_cache(maxsize=32)
+def compile_search_pattern(
+    text: str, case_sensitive: bool, whole_words: bool, regex: bool
+) -> re.Pattern:
+    """Compile a search term, once per term and options.
+
+    :param str text: The term
+    :param bool case_sensitive: Whether case must match
+    :param bool whole_words: Whether matches must start and end at word boundaries
+    :param bool regex: Whether the term is a regular expression rather than literal text
+    :return: The pattern
+    :rtype: re.Pattern
+    :raises re.error: If the regular expression is invalid
+    """
+    expression = text if regex else re.escape(text)
+    if whole_words:
+        expression = rf"(?<!\w)(?:{expression})(?!\w)"
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    return re.compile(expression, flags)
+
+
+def max_match_length(text: str, regex: bool) -> Optional[int]:
+    """Get the greatest length of text a search term can match.
+
+    :param str text: The term
+    :param bool regex: Whether the term is a regular expression
+    :return: The length, or None if unbounded
+    :rtype: Optional[int]
+    """
+    return None if regex else len(text)
+
+
+@contextmanager
+def time_limit(seconds: float = MATCH_TIME_LIMIT) -> Iterator[None]:
+    """Raise MatchTimeout from matching that runs beyond a time limit.
+
+    Matching checks for signals as it proceeds, so a timer signal interrupts even a pattern
+    backtracking catastrophically. Matching holds the GIL throughout, so can't be moved to a
+    thread instead. Only the main thread receives signals; elsewhere there's no limit.
+
+    :param float seconds: The limit
+    """
+    if threading.current_thread() is not threading.main_thread() or not hasattr(
+        signal, "setitimer"
+    ):
+        yield
+        return
+
+    def on_timer(_signal_number: int, _frame: object) -> None:
+        raise MatchTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_timer)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
@@ -0,0 +1,135 @@
+from gi.repository import GLib, GObject
+
+import json
+import logging
+import os
+from typing import Iterator, NamedTuple, Union
+
+from buffer.background_worker import BackgroundWorker
+
+
+class SessionBuffer(NamedTuple):
+    path: str
+    cursor: int
+
+
+class SessionManager(GObject.Object):
+    """Persists open buffers on quit so that they can be restored on the next launch.
+
+    Buffers are listed most recently focused first.
+    """
+
+    DIRECTORY = os.path.join(GLib.get_user_data_dir(), "buffer", "session")
+    FILENAME = "session.json"
+    READ_LENGTH = 1048576
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__worker = BackgroundWorker("session")
+
+    def save(self, buffers: list[Union[tuple[str, int], SessionBuffer]]) -> None:
+        """Save the session.
+
+        The files are written on a worker thread, completed before shutdown.
+
+        :param list[Union[tuple[str, int], SessionBuffer]] buffers: The text and cursor offset of
+            each buffer, or for buffers of the loaded session not yet restored, the loaded entry,
+            whose file is kept as it is
+        """
+        self.__worker.submit(lambda: self.__write(buffers))
+
+    def load(self) -> list[SessionBuffer]:
+        """Take the saved session, if any.
+
+        The session is consumed, with each buffer's file to be removed once restored.
+
+        :return: The buffers
+        :rtype: list[SessionBuffer]
+        """
+        path = os.path.join(self.DIRECTORY, self.FILENAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            os.unlink(path)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to read session {path}: %s", e)
+            return []
+
+        return [
+            SessionBuffer(os.path.join(self.DIRECTORY, entry["file"]), entry["cursor"])
+            for entry in entries
+        ]
+
+    def discard(self) -> None:
+        """Remove any saved session."""
+        for buffer in self.load():
+            self.remove(buffer)
+
+    def read(self, buffer: SessionBuffer) -> Iterator[str]:
+        """Read a buffer's text, piece by piece.
+
+        :param SessionBuffer buffer: The buffer
+        :return: The text
+        :rtype: Iterator[str]
+        """
+        try:
+            with open(buffer.path, "r", encoding="utf-8", newline="") as f:
+                while True:
+                    text = f.read(self.READ_LENGTH)
+                    if not text:
+                        break
+                    yield text
+        except OSError as e:
+            logging.warning(f"Failed to read session buffer {buffer.path}: %s", e)
+
+    def remove(self, buffer: SessionBuffer) -> None:
+        """Remove a buffer's file once restored.
+
+        :param SessionBuffer buffer: The buffer
+        """
+        try:
+            os.unlink(buffer.path)
+        except OSError:
+            pass
+
+    def shutdown(self) -> None:
+        """Wait for any queued writes to complete."""
+        self.__worker.stop()
+
+    def __write(self, buffers: list[Union[tuple[str, int], SessionBuffer]]) -> None:
+        kept = {
+            os.path.basename(buffer.path) for buffer in buffers if isinstance(buffer, SessionBuffer)
+        }
+        try:
+            os.makedirs(self.DIRECTORY, exist_ok=True)
+            for entry in os.scandir(self.DIRECTORY):
+                if entry.name not in kept:
+                    os.unlink(entry.path)
+
+            entries = []
+            index = 0
+            for buffer in buffers:
+                if isinstance(buffer, SessionBuffer):
+                    entries.append({"file": os.path.basename(buffer.path), "cursor": buffer.cursor})
+                    continue
+                text, cursor = buffer
+                while f"{index}.txt" in kept:
+                    index += 1
+                filename = f"{index}.txt"
+                index += 1
+                path = os.path.join(self.DIRECTORY, filename)
+                with open(path, "w", encoding="utf-8", newline="") as f:
+                    f.write(text)
+                entries.append({"file": filename, "cursor": cursor})
+
+            # Written last, so that a partially written session isn't restored
+            path = os.path.join(self.DIRECTORY, self.FILENAME)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.warning("Failed to save session: %s", e)
+            return
+        logging.info(f"Saved session of {len(buffers)} buffers, {len(kept)} carried over")
@@ -0,0 +1,229 @@
+import gi
+from gi.repository import Gio, GLib, GObject
+
+from collections import OrderedDict
+import locale
+import logging
+import time
+from typing import Callable, Optional
+import weakref
+
+import buffer.config_manager as config_manager
+from buffer.background_worker import BackgroundWorker
+
+
+class SpellingService(GObject.Object):
+    """Application wide spell checker, with dictionaries loaded in the background.
+
+    Loading the dictionary is slow enough to hold up showing the first window, so it's done on a
+    worker thread once. The checker is then set up on the main thread and shared by all views.
+    Verdicts on words are cached for the relaxed mode checkers of all views, least recently used
+    words being evicted. The libspelling adapters checking smaller buffers don't use the cache, as
+    libspelling offers no way in: its checker can't be subclassed and the provider and dictionary
+    classes are private.
+    """
+
+    CACHE_SIZE = 65536
+
+    __default: Optional["SpellingService"] = None
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__worker = BackgroundWorker("spelling")
+        self.__checker: Optional[GObject.Object] = None
+        self.__dictionary: Optional[GObject.Object] = None
+        self.__loading = False
+        self.__waiting: list[Callable[[Optional[GObject.Object]], None]] = []
+        self.__verdicts: OrderedDict[tuple[str, str], bool] = OrderedDict()
+        self.__language = ""
+        self.__hits = 0
+        self.__misses = 0
+        # Held weakly, as with settings subscriptions, so that closed views can be freed
+        self.__language_subscribers: list[weakref.WeakMethod] = []
+
+    @classmethod
+    def get_default(cls) -> "SpellingService":
+        """Fetch the shared instance.
+
+        :return: The service
+        :rtype: SpellingService
+        """
+        if cls.__default is None:
+            cls.__default = SpellingService()
+        return cls.__default
+
+    def load(self, callback: Callable[[Optional[GObject.Object]], None]) -> None:
+        """Fetch the checker, loading it if needed.
+
+        :param callback: A function to call on the main loop with the Spelling.Checker, or with
+            None on failure
+        """
+        if self.__checker is not None:
+            callback(self.__checker)
+            return
+
+        self.__waiting.append(callback)
+        if self.__loading:
+            return
+        self.__loading = True
+        # Even importing the typelib and finding the provider take long enough to be felt at
+        # startup, so wait until the loop is otherwise idle, after the window has been drawn
+        GLib.idle_add(self.__start_loading, time.monotonic(), priority=GLib.PRIORITY_LOW)
+
+    def subscribe_language(self, method: Callable[[], None]) -> None:
+        """Call a method on change of the checker's language, for as long as its object is alive.
+
+        :param method: A bound method, called without arguments
+        """
+        subscribers = self.__language_subscribers
+        subscribers.append(weakref.WeakMethod(method, subscribers.remove))
+
+    def check_word(self, word: str) -> bool:
+        """Check a word, using the cache where possible.
+
+        :param str word: The word
+        :return: Whether correctly spelt
+        :rtype: bool
+        """
+        assert self.__checker is not None
+        key = (self.__language, word)
+        verdict = self.__verdicts.get(key)
+        if verdict is not None:
+            self.__hits += 1
+            self.__verdicts.move_to_end(key)
+            return verdict
+
+        self.__misses += 1
+        verdict = self.__checker.check_word(word, -1)
+        self.__verdicts[key] = verdict
+        if len(self.__verdicts) > self.CACHE_SIZE:
+            self.__verdicts.popitem(last=False)
+        return verdict
+
+    def clear_cache(self) -> None:
+        """Forget cached verdicts, for when the personal dictionary has changed."""
+        self.log_statistics()
+        self.__verdicts.clear()
+
+    def log_statistics(self) -> None:
+        """Log the cache hit rate, for tuning its size."""
+        lookups = self.__hits + self.__misses
+        if lookups > 0:
+            logging.debug(
+                f"Spelling cache hit rate {self.__hits / lookups:.1%} of {lookups} lookups,"
+                f" {len(self.__verdicts)} words cached"
+            )
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def create_action_group(self, adapter: GObject.Object) -> Gio.ActionGroup:
+        """Proxy the actions of a spelling adapter for its menu.
+
+        Cached verdicts are forgotten when words are added to the personal dictionary or ignored
+        through the menu.
+
+        :param Spelling.TextBufferAdapter adapter: The adapter
+        :return: The actions
+        :rtype: Gio.ActionGroup
+        """
+        group = Gio.SimpleActionGroup.new()
+
+        def on_activate(name: str, parameter: Optional[GLib.Variant]) -> None:
+            adapter.activate_action(name, parameter)
+            if name in ("add", "ignore"):
+                self.clear_cache()
+
+        for name in adapter.list_actions():
+            _found, enabled, parameter_type, _state_type, _hint, state = adapter.query_action(name)
+            if state is not None:
+                action = Gio.SimpleAction.new_stateful(name, parameter_type, state)
+                action.connect(
+                    "change-state", lambda _a, v, n=name: adapter.change_action_state(n, v)
+                )
+            else:
+                action = Gio.SimpleAction.new(name, parameter_type)
+            action.set_enabled(enabled)
+            action.connect("activate", lambda _a, p, n=name: on_activate(n, p))
+            group.add_action(action)
+
+        adapter.connect(
+            "action-state-changed", lambda _o, n, v: group.lookup_action(n).set_state(v)
+        )
+        adapter.connect(
+            "action-enabled-changed", lambda _o, n, e: group.lookup_action(n).set_enabled(e)
+        )
+        return group
+
+    def __start_loading(self, start_time: float) -> bool:
+        lookup_start_time = time.monotonic()
+        language_code = self.__get_language_code()
+        try:
+            gi.require_version("Spelling", "1")
+            from gi.repository import Spelling
+        except (ImportError, ValueError) as e:
+            logging.warning("Spelling unavailable: %s", e)
+            language_code = None
+        if language_code is None:
+            self.__on_loaded(None)
+            return GLib.SOURCE_REMOVE
+
+        # Only the dictionary is loaded on the worker, the checker being created and configured on
+        # the main thread once the provider has it to hand
+        provider = Spelling.Provider.get_default()
+        elapsed = (time.monotonic() - lookup_start_time) * 1000
+        logging.debug(f"Spelling typelib and provider found in {elapsed:.0f}ms")
+
+        def on_dictionary_loaded(dictionary: Optional[GObject.Object]) -> None:
+            # Held so that the provider doesn't drop it before the checker takes it up
+            self.__dictionary = dictionary
+            checker = Spelling.Checker.get_default()
+            checker.set_language(language_code)
+            elapsed = (time.monotonic() - start_time) * 1000
+            logging.debug(f"Spelling loaded in {elapsed:.0f}ms")
+            self.__on_loaded(checker)
+
+        self.__worker.submit(lambda: provider.load_dictionary(language_code), on_dictionary_loaded)
+        return GLib.SOURCE_REMOVE
+
+    def __on_language_changed(self) -> None:
+        assert self.__checker is not None
+        self.__language = self.__checker.get_language() or ""
+        # Verdicts for the previous language are unlikely to be wanted again soon
+        self.clear_cache()
+        for reference in list(self.__language_subscribers):
+            method = reference()
+            if method is not None:
+                method()
+
+    def __on_loaded(self, checker: Optional[GObject.Object]) -> None:
+        self.__loading = False
+        self.__checker = checker
+        if checker is not None:
+            self.__language = checker.get_language() or ""
+            checker.connect("notify::language", lambda _o, _v: self.__on_language_changed())
+        waiting = self.__waiting
+        self.__waiting = []
+        for waiting_callback in waiting:
+            waiting_callback(checker)
+
+    @staticmethod
+    def __get_language_code() -> Optional[str]:
+        pref_language = config_manager.get_spelling_language()
+        if pref_language:
+            logging.debug(f'Attempting to use spelling language from preference "{pref_language}"')
+            return pref_language
+
+        language_code, _ = locale.getdefaultlocale()
+        if not language_code:
+            logging.warning(
+                "Failed to determine default locale, abandoning spelling initialisation"
+            )
+            return None
+        logging.debug(f'Attempting to use locale default spelling language "{language_code}"')
+        return language_code
@@ -16,9 +16,7 @@ class ThemeSelector(Gtk.Box):
     def __init__(self) -> None:
         super().__init__()
         self.__populate()
-        config_manager.settings.connect(
-            f"changed::{config_manager.STYLE}", lambda _o, _k: self.__populate()
-        )
+        config_manager.subscribe(config_manager.STYLE, self.__populate)
 
     @Gtk.Template.Callback()
     def _on_option_selected(self, _widget: Gtk.CheckButton) -> None:
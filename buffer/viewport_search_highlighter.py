@@ -0,0 +1,131 @@
+import gi
+
+gi.require_version("GtkSource", "5")
+from gi.repository import GLib, GObject, Gtk, GtkSource
+
+import logging
+import re
+from typing import Optional
+
+from buffer.search_pattern import MatchTimeout, time_limit
+
+
+class ViewportSearchHighlighter(GObject.Object):
+    """Highlights the matches of a search pattern in and around the visible region of a view.
+
+    Used in place of GtkSource's search highlighting, so that what's highlighted is matched by the
+    same pattern as the count, navigation and replacement, and so that large buffers aren't
+    scanned in full to highlight. Highlighting is updated in a low priority idle callback after
+    scrolling or editing. Matching is time limited, so a
+    pattern that backtracks catastrophically leaves the region unhighlighted.
+    """
+
+    # Pages of text highlighted above and below the visible region
+    MARGIN_PAGES = 1
+
+    def __init__(self, view: GtkSource.View) -> None:
+        """
+        :param GtkSource.View view: The view
+        """
+        super().__init__()
+        self.__view = view
+        self.__buffer = view.get_buffer()
+        self.__pattern: Optional[re.Pattern] = None
+        self.__tag: Optional[Gtk.TextTag] = None
+        # Bounds of the region last highlighted, kept by marks through edits
+        self.__tagged: Optional[tuple[Gtk.TextMark, Gtk.TextMark]] = None
+        self.__source_id: Optional[int] = None
+        self.__handler_ids: list[tuple[GObject.Object, int]] = []
+
+    def set_pattern(self, pattern: Optional[re.Pattern]) -> None:
+        """Highlight the matches of a pattern.
+
+        :param Optional[re.Pattern] pattern: The pattern, or None to stop highlighting
+        """
+        self.__pattern = pattern
+        if pattern is None:
+            self.__stop()
+            return
+
+        if self.__tag is None:
+            self.__setup_tag()
+        if not self.__handler_ids:
+            adjustment = self.__view.get_vadjustment()
+            self.__handler_ids = [
+                (self.__buffer, self.__buffer.connect("changed", lambda _o: self.__queue())),
+                (adjustment, adjustment.connect("value-changed", lambda _o: self.__queue())),
+            ]
+        self.__queue()
+
+    def __stop(self) -> None:
+        if self.__source_id is not None:
+            GLib.source_remove(self.__source_id)
+            self.__source_id = None
+        for source, handler_id in self.__handler_ids:
+            source.disconnect(handler_id)
+        self.__handler_ids = []
+        self.__clear()
+        if self.__tag is not None:
+            self.__buffer.get_tag_table().remove(self.__tag)
+            self.__tag = None
+
+    def __setup_tag(self) -> None:
+        buffer = self.__buffer
+        self.__tag = buffer.create_tag()
+        scheme = buffer.get_style_scheme()
+        if scheme is not None:
+            style = scheme.get_style("search-match")
+            if style is not None:
+                style.apply(self.__tag)
+
+    def __queue(self) -> None:
+        if self.__source_id is None:
+            self.__source_id = GLib.idle_add(self.__highlight, priority=GLib.PRIORITY_LOW)
+
+    def __clear(self) -> None:
+        if self.__tagged is None:
+            return
+        buffer = self.__buffer
+        start_mark, end_mark = self.__tagged
+        self.__tagged = None
+        if self.__tag is not None:
+            buffer.remove_tag(
+                self.__tag, buffer.get_iter_at_mark(start_mark), buffer.get_iter_at_mark(end_mark)
+            )
+        buffer.delete_mark(start_mark)
+        buffer.delete_mark(end_mark)
+
+    def __highlight(self) -> bool:
+        self.__source_id = None
+        if self.__pattern is None or self.__tag is None:
+            return GLib.SOURCE_REMOVE
+
+        visible = self.__view.get_visible_rect()
+        margin = visible.height * self.MARGIN_PAGES
+        start, _y = self.__view.get_line_at_y(visible.y - margin)
+        end, _y = self.__view.get_line_at_y(visible.y + visible.height + margin)
+        if not end.ends_line():
+            end.forward_to_line_end()
+
+        buffer = self.__buffer
+        start_offset = start.get_offset()
+        end_offset = end.get_offset()
+        text = buffer.get_text(start, end, True)
+        self.__clear()
+        try:
+            with time_limit():
+                spans = [m.span() for m in self.__pattern.finditer(text) if m.end() > m.start()]
+        except MatchTimeout:
+            logging.warning("Search pattern took too long to highlight")
+            spans = []
+        for match_start, match_end in spans:
+            buffer.apply_tag(
+                self.__tag,
+                buffer.get_iter_at_offset(start_offset + match_start),
+                buffer.get_iter_at_offset(start_offset + match_end),
+            )
+        self.__tagged = (
+            buffer.create_mark(None, buffer.get_iter_at_offset(start_offset), True),
+            buffer.create_mark(None, buffer.get_iter_at_offset(end_offset), False),
+        )
+        return GLib.SOURCE_REMOVE
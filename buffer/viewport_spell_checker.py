@@ -0,0 +1,233 @@
+import gi
+
+gi.require_version("GtkSource", "5")
+from gi.repository import GLib, GObject, Gtk, GtkSource, Pango
+
+import re
+import time
+from typing import Iterator, Optional
+
+from buffer.spelling_service import SpellingService
+
+
+class ViewportSpellChecker(GObject.Object):
+    """Checks the spelling of the text in and around the visible region of a view, then the rest.
+
+    Used in place of checking the whole buffer once it's large. Words are checked in batches over
+    low priority idle callbacks, each batch limited to a time budget so that the view keeps
+    drawing. Once the visible region is checked the rest of the buffer is checked a chunk at a
+    time, going back to the visible region first whenever it's scrolled or edited.
+
+    The ranges checked are kept, shifted along with edits, so that only the lines edited are
+    checked again.
+    """
+
+    # Pages of text checked above and below the visible region
+    MARGIN_PAGES = 1
+    # Seconds of checking per idle callback
+    TIME_BUDGET = 0.004
+    # Characters of text taken at a time, so that a large region isn't copied out all at once
+    CHUNK = 65536
+    WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+    LAST_SPACE = re.compile(r"\s(?=\S*\Z)")
+
+    def __init__(self, view: GtkSource.View, spelling_service: SpellingService) -> None:
+        """
+        :param GtkSource.View view: The view
+        :param SpellingService spelling_service: The loaded spelling service
+        """
+        super().__init__()
+        self.__view = view
+        self.__spelling_service = spelling_service
+        self.__buffer = view.get_buffer()
+        self.__tag = self.__buffer.create_tag(None, underline=Pango.Underline.ERROR)
+        self.__enabled = False
+        self.__source_id: Optional[int] = None
+        self.__words: Optional[Iterator[re.Match]] = None
+        # Offset of the text being checked, from which it's been recorded as checked, and its end
+        self.__text_offset = 0
+        self.__region_start = 0
+        self.__region_end = 0
+        # Offset up to which the region has been retagged
+        self.__position = 0
+        # Sorted, separate start and end offsets of the ranges checked and tagged
+        self.__checked: list[tuple[int, int]] = []
+
+        self.__buffer.connect("insert-text", self.__on_insert_text)
+        self.__buffer.connect("delete-range", self.__on_delete_range)
+        self.__buffer.connect("changed", lambda _o: self.__queue_check())
+        view.get_vadjustment().connect("value-changed", lambda _o: self.__queue_check())
+
+    def set_enabled(self, enabled: bool) -> None:
+        """Enable or disable checking, disabling clearing any marked words.
+
+        :param bool enabled: Whether enabled
+        """
+        if enabled == self.__enabled:
+            return
+        self.__enabled = enabled
+        if enabled:
+            self.__queue_check()
+        else:
+            self.__cancel()
+            self.__clear()
+
+    def invalidate(self) -> None:
+        """Check again, for after the language has changed."""
+        if self.__enabled:
+            self.__cancel()
+            self.__clear()
+            self.__queue_check()
+
+    def __queue_check(self) -> None:
+        if not self.__enabled:
+            return
+        # Words from an earlier pass may no longer be where they were, and the visible region is
+        # checked first
+        self.__cancel()
+        self.__source_id = GLib.idle_add(self.__check_batch, priority=GLib.PRIORITY_LOW)
+
+    def __cancel(self) -> None:
+        if self.__source_id is not None:
+            GLib.source_remove(self.__source_id)
+            self.__source_id = None
+        self.__words = None
+
+    def __clear(self) -> None:
+        start, end = self.__buffer.get_bounds()
+        self.__buffer.remove_tag(self.__tag, start, end)
+        self.__checked = []
+
+    def __remove_tag(self, start: int, end: int) -> None:
+        if start < end:
+            buffer = self.__buffer
+            buffer.remove_tag(
+                self.__tag, buffer.get_iter_at_offset(start), buffer.get_iter_at_offset(end)
+            )
+
+    def __on_insert_text(
+        self, _buffer: Gtk.TextBuffer, location: Gtk.TextIter, text: str, _length: int
+    ) -> None:
+        offset = location.get_offset()
+        self.__on_edit(offset, offset, len(text))
+
+    def __on_delete_range(
+        self, _buffer: Gtk.TextBuffer, start: Gtk.TextIter, end: Gtk.TextIter
+    ) -> None:
+        self.__on_edit(start.get_offset(), end.get_offset(), 0)
+
+    def __on_edit(self, start: int, end: int, length: int) -> None:
+        """Shift the checked ranges for text about to replace that from start to end, dropping
+        the lines it touches."""
+        if not self.__checked:
+            return
+
+        def shift(offset: int) -> int:
+            return offset + length - (end - start) if offset >= end else min(offset, start)
+
+        line_start = self.__buffer.get_iter_at_offset(start)
+        line_start.set_line_offset(0)
+        line_end = self.__buffer.get_iter_at_offset(end)
+        if not line_end.ends_line():
+            line_end.forward_to_line_end()
+        unchecked_start = line_start.get_offset()
+        unchecked_end = shift(line_end.get_offset())
+
+        checked = []
+        for range_start, range_end in self.__checked:
+            range_start, range_end = shift(range_start), shift(range_end)
+            if range_start < unchecked_start:
+                checked.append((range_start, min(range_end, unchecked_start)))
+            if range_end > unchecked_end:
+                checked.append((max(range_start, unchecked_end), range_end))
+        self.__checked = checked
+
+    def __add_checked(self, start: int, end: int) -> None:
+        if start >= end:
+            return
+        checked = []
+        for range_start, range_end in self.__checked:
+            if range_end < start or range_start > end:
+                checked.append((range_start, range_end))
+            else:
+                start, end = min(start, range_start), max(end, range_end)
+        checked.append((start, end))
+        checked.sort()
+        self.__checked = checked
+
+    def __first_unchecked(self, start: int, end: int) -> Optional[tuple[int, int]]:
+        position = start
+        gap_end = end
+        for range_start, range_end in self.__checked:
+            if range_start > position:
+                gap_end = min(range_start, end)
+                break
+            position = max(position, range_end)
+        return (position, gap_end) if position < gap_end else None
+
+    def __start_next_region(self) -> bool:
+        visible = self.__view.get_visible_rect()
+        margin = visible.height * self.MARGIN_PAGES
+        start, _y = self.__view.get_line_at_y(visible.y - margin)
+        end, _y = self.__view.get_line_at_y(visible.y + visible.height + margin)
+        if not end.ends_line():
+            end.forward_to_line_end()
+        visible_start, visible_end = start.get_offset(), end.get_offset()
+
+        # Then the rest of the buffer, onward from the visible region
+        region = (
+            self.__first_unchecked(visible_start, visible_end)
+            or self.__first_unchecked(visible_end, self.__buffer.get_char_count())
+            or self.__first_unchecked(0, visible_start)
+        )
+        if region is None:
+            return False
+
+        start_offset, end_offset = region
+        end_offset = min(end_offset, start_offset + self.CHUNK)
+        buffer = self.__buffer
+        text = buffer.get_text(
+            buffer.get_iter_at_offset(start_offset), buffer.get_iter_at_offset(end_offset), False
+        )
+        if end_offset < region[1]:
+            # Cut short at a space so as not to split a word, the rest taken with the next chunk
+            space = self.LAST_SPACE.search(text)
+            if space is not None and space.start() > 0:
+                text = text[: space.start()]
+                end_offset = start_offset + space.start()
+
+        # Marks within the region are replaced as checking proceeds, to avoid flicker
+        self.__text_offset = start_offset
+        self.__region_start = start_offset
+        self.__region_end = end_offset
+        self.__position = start_offset
+        self.__words = self.WORD.finditer(text)
+        return True
+
+    def __check_batch(self) -> bool:
+        buffer = self.__buffer
+        deadline = time.monotonic() + self.TIME_BUDGET
+        while True:
+            if self.__words is None and not self.__start_next_region():
+                self.__source_id = None
+                return GLib.SOURCE_REMOVE
+            assert self.__words is not None
+
+            for match in self.__words:
+                word_end = self.__text_offset + match.end()
+                self.__remove_tag(self.__position, word_end)
+                self.__position = word_end
+                if not self.__spelling_service.check_word(match.group()):
+                    start = buffer.get_iter_at_offset(self.__text_offset + match.start())
+                    buffer.apply_tag(self.__tag, start, buffer.get_iter_at_offset(word_end))
+                if time.monotonic() > deadline:
+                    # Recorded so that it's kept should the region be left for another
+                    self.__add_checked(self.__region_start, self.__position)
+                    self.__region_start = self.__position
+                    return GLib.SOURCE_CONTINUE
+
+            self.__remove_tag(self.__position, self.__region_end)
+            self.__add_checked(self.__region_start, self.__region_end)
+            self.__words = None
+            if time.monotonic() > deadline:
+                return GLib.SOURCE_CONTINUE
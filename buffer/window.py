@@ -1,17 +1,19 @@
-from gettext import gettext as _
+from gettext import gettext as _, ngettext
 import gi
 
 gi.require_version("GtkSource", "5")
-from gi.repository import Adw, Gdk, Gio, GLib, GObject, Gtk, GtkSource, Pango
+from gi.repository import Adw, Gdk, Gio, GLib, GObject, Gtk, GtkSource
 
 import logging
 import time
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
 import buffer.config_manager as config_manager
 from buffer import const
+from buffer.cursor_margin_keeper import CursorMarginKeeper
 from buffer.editor_text_view import EditorTextView
 from buffer.font_size_selector import FontSizeSelector
+from buffer.paste_pipeline import PastePipeline
 from buffer.theme_selector import ThemeSelector
 
 
@@ -19,12 +21,10 @@ from buffer.theme_selector import ThemeSelector
 class Window(Adw.ApplicationWindow):
     __gtype_name__ = "Window"
 
-    FONT_SETTING_KEYS = ["monospace-font-name", "document-font-name"]
     MENU_BUTTON_SHOWN_DURATION = 4
     MENU_BUTTON_SHOWN_INIT_DURATION = 2
     SETTING_CHANGE_NOTIFICATION_DURATION = 3.0
     LINE_LENGTH_STEP = 50
-    MARGIN_BELOW_CURSOR = 22
 
     _textview = Gtk.Template.Child()
     _scrolled_window = Gtk.Template.Child()
@@ -35,16 +35,15 @@ class Window(Adw.ApplicationWindow):
     _toolbar_view = Gtk.Template.Child()
     _search_header_bar = Gtk.Template.Child()
 
-    def __init__(self, app: Adw.Application, dbus_proxy: Optional[Gio.DBusProxy]):
+    def __init__(self, app: Adw.Application):
         super().__init__(application=app)
 
-        self.__dbus_proxy = dbus_proxy
-
         self.__initialising = True
-        self.__font_families: dict[str, str] = {}
         self.__timeout_signal_id = None
         self.__motion_during_menu_hide_timeout: Optional[float] = None
         self.__paste_during_init = False
+        self.__paste_pipeline: Optional[PastePipeline] = None
+        self.__restore_source_id: Optional[int] = None
 
         self.set_icon_name(const.APP_ID)
 
@@ -70,21 +69,7 @@ class Window(Adw.ApplicationWindow):
         (width, height) = config_manager.get_window_size()
         self.set_default_size(width, height)
 
-        if self.__dbus_proxy is None:
-            logging.warning("Unable to establish D-Bus proxy for FreeDesktop.org font setting")
-        else:
-            self.__load_font_family_from_setting()
-            self.__dbus_proxy.connect_object("g-signal", self.__on_desktop_setting_changed, None)
-
-        if self.__dbus_proxy is not None:
-            config_manager.settings.connect(
-                f"changed::{config_manager.USE_MONOSPACE_FONT}",
-                lambda _o, _k: self.__load_font_family_from_setting(),
-            )
-
-        config_manager.settings.connect(
-            f"changed::{config_manager.LINE_LENGTH}", lambda _o, _k: self.__on_line_length_changed()
-        )
+        config_manager.subscribe(config_manager.LINE_LENGTH, self.__on_line_length_changed)
 
         self.connect("notify::is-active", lambda _o, _v: self.__on_window_active_changed())
         self._menu_button.connect("notify::active", lambda _o, _v: self.__on_menu_active_changed())
@@ -100,16 +85,19 @@ class Window(Adw.ApplicationWindow):
         self._search_header_bar.connect(
             "open-for-replace", lambda _o: self.__enter_search(resuming=False, for_replace=True)
         )
+        self._search_header_bar.connect(
+            "replaced-all", lambda _o, count: self.__notify_replaced_all(count)
+        )
 
         self.update_style()
 
         if config_manager.get_spelling_enabled():
             self._textview.spellchecker_enabled = True
 
+        self._textview.connect("paste-clipboard", self.__on_paste_clipboard)
+
         # Maintain a margin between the cursor and the bottom of the window
-        self._textview.get_buffer().connect(
-            "changed", lambda _o: GLib.idle_add(self.__check_and_scroll_for_cursor)
-        )
+        self.__cursor_margin_keeper = CursorMarginKeeper(self._textview, self._scrolled_window)
 
     def update_style(self) -> None:
         """Update style for dark mode and high contrast."""
@@ -137,6 +125,100 @@ class Window(Adw.ApplicationWindow):
         """
         return self._textview.get_buffer().get_property("text")
 
+    def is_blank(self) -> bool:
+        """Check whether the buffer contains only whitespace, without copying its contents.
+
+        :return: Whether blank
+        :rtype: bool
+        """
+        start = self._textview.get_buffer().get_start_iter()
+        if not start.get_char().isspace():
+            return start.is_end()
+        return not start.forward_find_char(lambda char, _data: not char.isspace(), None, None)
+
+    def get_buffer(self) -> GtkSource.Buffer:
+        """Fetch the text buffer.
+
+        :return: The buffer
+        :rtype: GtkSource.Buffer
+        """
+        return self._textview.get_buffer()
+
+    def get_char_count(self) -> int:
+        """Fetch the number of characters in the buffer.
+
+        :return: The count
+        :rtype: int
+        """
+        return self._textview.get_buffer().get_char_count()
+
+    def select_range(self, start: int, end: int) -> None:
+        """Select a range of the buffer and scroll to it.
+
+        :param int start: The start offset
+        :param int end: The end offset
+        """
+        buffer = self._textview.get_buffer()
+        buffer.select_range(buffer.get_iter_at_offset(start), buffer.get_iter_at_offset(end))
+        self._textview.scroll_to_mark(buffer.get_insert(), 0.0, True, 0.0, 0.5)
+
+    def restore_text(self, text: str, cursor_offset: int) -> None:
+        """Restore previous buffer contents, without making it undoable.
+
+        :param str text: The text
+        :param int cursor_offset: Where to place the cursor
+        """
+        buffer = self._textview.get_buffer()
+        buffer.begin_irreversible_action()
+        buffer.set_text(text)
+        buffer.end_irreversible_action()
+        buffer.place_cursor(buffer.get_iter_at_offset(cursor_offset))
+        self._textview.scroll_to_mark(buffer.get_insert(), 0.0, True, 0.0, 0.5)
+
+    def restore_text_in_pieces(
+        self,
+        pieces: Iterator[str],
+        cursor_offset: int,
+        finished_callback: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Restore previous buffer contents a piece per idle callback, keeping the UI responsive.
+
+        The buffer isn't editable until complete.
+
+        :param Iterator[str] pieces: The text
+        :param int cursor_offset: Where to place the cursor
+        :param finished_callback: A function to call once complete
+        """
+        buffer = self._textview.get_buffer()
+        self._textview.set_editable(False)
+
+        def restore_next() -> bool:
+            piece = next(pieces, None)
+            if piece is not None:
+                buffer.begin_irreversible_action()
+                buffer.insert(buffer.get_end_iter(), piece)
+                buffer.end_irreversible_action()
+                return GLib.SOURCE_CONTINUE
+
+            self.__restore_source_id = None
+            buffer.place_cursor(buffer.get_iter_at_offset(cursor_offset))
+            self._textview.scroll_to_mark(buffer.get_insert(), 0.0, True, 0.0, 0.5)
+            self._textview.set_editable(True)
+            if finished_callback is not None:
+                finished_callback()
+            return GLib.SOURCE_REMOVE
+
+        self.__restore_source_id = GLib.idle_add(restore_next, priority=GLib.PRIORITY_LOW)
+
+    def cancel_restore(self) -> None:
+        """Stop restoring text in pieces, leaving the part restored so far.
+
+        The finished callback isn't called.
+        """
+        if self.__restore_source_id is not None:
+            GLib.source_remove(self.__restore_source_id)
+            self.__restore_source_id = None
+
     @Gtk.Template.Callback()
     def _on_window_close_clicked(self, _button: Gtk.Button) -> None:
         self.close()
@@ -193,9 +275,45 @@ class Window(Adw.ApplicationWindow):
                 self._textview.move_cursor(x, y)
         return Gdk.EVENT_PROPAGATE
 
-    def __on_paste_cb(self, clipboard: Gdk.Clipboard, task: Gio.Task) -> None:
-        out = clipboard.read_text_finish(task)
-        self._textview.get_buffer().set_text(out)
+    def __on_paste_clipboard(self, textview: EditorTextView) -> None:
+        if not textview.get_editable():
+            return
+        textview.stop_emission_by_name("paste-clipboard")
+        self.__paste(textview.get_clipboard())
+
+    def __paste(self, clipboard: Gdk.Clipboard) -> None:
+        if self.__paste_pipeline is not None:
+            return
+
+        progress_shown = False
+        cancelled = False
+
+        def on_progress(length: int) -> None:
+            nonlocal progress_shown
+            progress_shown = True
+            # Translators: Description, notification, {0} is a size eg. "12.5 MB"
+            msg = _("Pasting {0}…").format(GLib.format_size(length))
+            # Translators: Button
+            self._timed_notification.show(msg, 0.0, _("Cancel"), on_cancel)
+
+        def on_cancel() -> None:
+            nonlocal cancelled
+            cancelled = True
+            pipeline.cancel()
+
+        def on_finished(success: bool) -> None:
+            self.__paste_pipeline = None
+            if cancelled:
+                # Translators: Description, notification
+                self.__notify_setting_change(_("Paste cancelled"))
+            elif progress_shown:
+                # Translators: Description, notification
+                msg = _("Pasted") if success else _("Paste failed")
+                self.__notify_setting_change(msg)
+
+        pipeline = PastePipeline(self._textview, config_manager.get_clean_pasted_text())
+        self.__paste_pipeline = pipeline
+        pipeline.start(clipboard, on_progress, on_finished)
 
     def __on_close_request(self) -> None:
         """On window destroyed."""
@@ -263,8 +381,7 @@ class Window(Adw.ApplicationWindow):
         self.__reveal_buttons()
         if self.__initialising:
             if self.__paste_during_init:
-                clipboard = self._textview.get_primary_clipboard()
-                clipboard.read_text_async(None, self.__on_paste_cb)
+                self.__paste(self._textview.get_primary_clipboard())
             self.__initialising = False
 
     def __on_menu_active_changed(self) -> None:
@@ -283,18 +400,6 @@ class Window(Adw.ApplicationWindow):
         else:
             self.__reveal_buttons()
 
-    def __on_desktop_setting_changed(
-        self, _sender_name: str, _signal_name: str, _parameters: str, data: GLib.Variant
-    ) -> None:
-        if _parameters != "SettingChanged":
-            return
-        (path, setting_name, value) = data
-        if path == "org.gnome.desktop.interface" and setting_name in self.FONT_SETTING_KEYS:
-            if value.strip() != "":
-                font_description = Pango.font_description_from_string(value)
-                self.__font_families[setting_name] = font_description.get_family()
-                self.__push_font_updates()
-
     def __on_enter_search(self) -> None:
         if self._search_header_bar.active:
             self._search_header_bar.refocus_search_and_select()
@@ -314,18 +419,6 @@ class Window(Adw.ApplicationWindow):
         visible = self.get_visible_dialog() is not None
         self.__cancel_action.set_enabled(not visible)
 
-    def __check_and_scroll_for_cursor(self) -> None:
-        buffer = self._textview.get_buffer()
-        insert = buffer.get_iter_at_mark(buffer.get_insert())
-
-        rect = self._textview.get_iter_location(insert)
-        adj = self._scrolled_window.get_vadjustment()
-        lowest_visible = self._textview.get_top_margin() + rect.y + rect.height
-        visible_below_cursor = adj.get_value() + adj.get_page_size() - lowest_visible
-        if visible_below_cursor < self.MARGIN_BELOW_CURSOR:
-            scroll_to = lowest_visible + self.MARGIN_BELOW_CURSOR - adj.get_page_size()
-            adj.set_value(scroll_to)
-
     def __setup_actions(self) -> None:
         app = Gio.Application.get_default()
 
@@ -398,49 +491,6 @@ class Window(Adw.ApplicationWindow):
         else:
             self.fullscreen()
 
-    def __process_desktop_settings(self, variant: GLib.Variant) -> None:
-        if variant.get_type_string() != "(a{sa{sv}})":
-            return
-        for v in variant:
-            for key, value in v.items():
-                if key == "org.gnome.desktop.interface":
-                    for font_key in self.FONT_SETTING_KEYS:
-                        if font_key in value:
-                            font_description = Pango.font_description_from_string(value[font_key])
-                            self.__font_families[font_key] = font_description.get_family()
-        self.__push_font_updates()
-
-    def __push_font_updates(self) -> None:
-        font_setting = self.__fetch_editor_font_setting_name()
-        if font_setting in self.__font_families:
-            family = self.__font_families[font_setting]
-            self._textview.update_font_family(family)
-
-    def __fetch_editor_font_setting_name(self) -> str:
-        return (
-            "monospace-font-name"
-            if config_manager.get_use_monospace_font()
-            else "document-font-name"
-        )
-
-    def __load_font_family_from_setting(self) -> None:
-        if self.__dbus_proxy is None:
-            return
-
-        try:
-            variant = self.__dbus_proxy.call_sync(
-                method_name="ReadAll",
-                parameters=GLib.Variant("(as)", ("org.gnome.desktop.*",)),
-                flags=Gio.DBusCallFlags.NO_AUTO_START,
-                timeout_msec=-1,
-                cancellable=None,
-            )
-        except GLib.GError as e:
-            logging.warning("Unable to access D-Bus FreeDesktop.org font family setting: %s", e)
-            return
-
-        self.__process_desktop_settings(variant)
-
     def __refresh_line_length_from_setting(self) -> None:
         length = config_manager.get_line_length()
         length_for_view = -1 if length == config_manager.get_line_length_max() else length
@@ -492,6 +542,11 @@ class Window(Adw.ApplicationWindow):
         msg = _("Font size now {0}pt").format(size)
         self.__notify_setting_change(msg)
 
+    def __notify_replaced_all(self, count: int) -> None:
+        # Translators: Description, notification, {0} is a number
+        msg = ngettext("Replaced {0} match", "Replaced {0} matches", count).format(count)
+        self.__notify_setting_change(msg)
+
     def __notify_setting_change(self, msg: str) -> None:
         self._timed_notification.show(
             msg,
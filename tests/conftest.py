@@ -0,0 +1,385 @@
+"""Shared test setup.
+
+The tests cover logic that doesn't need a display. The modules under test import from
+gi.repository all the same, so where PyGObject isn't installed a minimal stand-in is provided,
+enough for those modules to import and for plain objects to connect and emit signals. Main loop
+callbacks are run by hand through the main_loop fixture either way.
+"""
+
+import importlib
+import itertools
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import types
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, Iterator
+
+import pytest
+
+try:
+    import gi  # noqa: F401
+
+    FAKE_GI = False
+except ImportError:
+    FAKE_GI = True
+
+    class _Object:
+        def __init__(self, **_properties: Any) -> None:
+            self.__handlers: dict[int, tuple[str, Callable]] = {}
+            self.__next_id = itertools.count(1)
+
+        def connect(self, name: str, handler: Callable, *args: Any) -> int:
+            handler_id = next(self.__next_id)
+            self.__handlers[handler_id] = (name, lambda *values: handler(*values, *args))
+            return handler_id
+
+        connect_after = connect
+
+        def disconnect(self, handler_id: int) -> None:
+            self.__handlers.pop(handler_id, None)
+
+        def emit(self, name: str, *values: Any) -> None:
+            for handler_name, handler in list(self.__handlers.values()):
+                if handler_name == name:
+                    handler(self, *values)
+
+    class _PlaceholderType(type):
+        def __getattr__(cls, name: str) -> Any:
+            if name.startswith("__"):
+                raise AttributeError(name)
+            value = _PlaceholderType(name, (_Placeholder,), {})
+            setattr(cls, name, value)
+            return value
+
+    class _Placeholder(metaclass=_PlaceholderType):
+        """Accepts any arguments, and passes through what it decorates, so that modules
+        defining widgets import."""
+
+        def __init__(self, *_args: Any, **_kwargs: Any) -> None:
+            pass
+
+        def __call__(self, *args: Any, **_kwargs: Any) -> Any:
+            return args[0] if len(args) == 1 and callable(args[0]) else _Placeholder()
+
+        def __getattr__(self, name: str) -> Any:
+            if name.startswith("__"):
+                raise AttributeError(name)
+            return _Placeholder()
+
+    class _Namespace(types.ModuleType):
+        # Names not given are placeholder classes, as used in annotations and as base classes
+        def __getattr__(self, name: str) -> Any:
+            if name.startswith("__"):
+                raise AttributeError(name)
+            value = _PlaceholderType(name, (_Placeholder,), {})
+            setattr(self, name, value)
+            return value
+
+    def _unavailable(*_args: Any, **_kwargs: Any) -> Any:
+        raise RuntimeError("Not available without PyGObject, use the main_loop fixture")
+
+    repository = types.ModuleType("gi.repository")
+    for namespace in (
+        "Adw",
+        "Gdk",
+        "Gio",
+        "GLib",
+        "GObject",
+        "Gtk",
+        "GtkSource",
+        "Pango",
+        "Spelling",
+    ):
+        module = _Namespace(f"gi.repository.{namespace}")
+        setattr(repository, namespace, module)
+        sys.modules[module.__name__] = module
+    repository.GObject.Object = _Object
+    repository.GObject.Property = lambda **_kwargs: property
+    repository.GObject.SignalFlags = types.SimpleNamespace(RUN_FIRST=1, RUN_LAST=2)
+    repository.GLib.SOURCE_REMOVE = False
+    repository.GLib.SOURCE_CONTINUE = True
+    repository.GLib.PRIORITY_DEFAULT = 0
+    repository.GLib.PRIORITY_DEFAULT_IDLE = 200
+    repository.GLib.PRIORITY_LOW = 300
+    repository.GLib.get_user_data_dir = lambda: os.path.join(tempfile.gettempdir(), "data")
+    for function in ("idle_add", "timeout_add", "timeout_add_seconds", "source_remove"):
+        setattr(repository.GLib, function, _unavailable)
+
+    gi = types.ModuleType("gi")
+    gi.require_version = lambda _namespace, _version: None
+    gi.repository = repository
+    sys.modules["gi"] = gi
+    sys.modules["gi.repository"] = repository
+
+try:
+    import buffer.const  # noqa: F401
+except ImportError:
+    # Generated at build time
+    const = types.ModuleType("buffer.const")
+    const.APP_ID = "org.gnome.gitlab.cheywood.Buffer"
+    const.IS_DEVEL = False
+    sys.modules["buffer.const"] = const
+
+
+class MainLoop:
+    """Stands in for the GLib main loop, running idle and timeout callbacks on demand.
+
+    Time only passes through advance(), so timeouts run in a predictable order. Callbacks may be
+    added from other threads, as by BackgroundWorker, and are run on the calling thread.
+    """
+
+    def __init__(self) -> None:
+        self.now = 0
+        # Due time, interval, function and arguments of each source
+        self.__sources: dict[int, tuple[int, int, Callable, tuple]] = {}
+        self.__ids = itertools.count(1)
+        self.__lock = threading.Lock()
+
+    def idle_add(self, function: Callable, *args: Any, priority: int = 0) -> int:
+        return self.__add(0, function, args)
+
+    def timeout_add(self, interval: int, function: Callable, *args: Any, priority: int = 0) -> int:
+        return self.__add(interval, function, args)
+
+    def timeout_add_seconds(
+        self, interval: int, function: Callable, *args: Any, priority: int = 0
+    ) -> int:
+        return self.__add(interval * 1000, function, args)
+
+    def source_remove(self, source_id: int) -> bool:
+        with self.__lock:
+            return self.__sources.pop(source_id, None) is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self.__sources)
+
+    def step(self) -> bool:
+        """Run the next callback due now, if any.
+
+        :return: Whether one was run
+        :rtype: bool
+        """
+        return self.__run_next(self.now)
+
+    def run_pending(self) -> None:
+        """Run the callbacks due now, and those they add, until none are due."""
+        while self.__run_next(self.now):
+            pass
+
+    def advance(self, milliseconds: int) -> None:
+        """Let time pass, running callbacks as they become due."""
+        deadline = self.now + milliseconds
+        while self.__run_next(deadline):
+            pass
+        self.now = deadline
+
+    def run_until(self, condition: Callable[[], bool], timeout: float = 10.0) -> None:
+        """Run callbacks as they become due, including those added from other threads, until a
+        condition holds."""
+        give_up = time.monotonic() + timeout
+        while True:
+            self.run_pending()
+            if condition():
+                return
+            if time.monotonic() > give_up:
+                raise TimeoutError()
+            time.sleep(0.0001)
+
+    def __add(self, interval: int, function: Callable, args: tuple) -> int:
+        with self.__lock:
+            source_id = next(self.__ids)
+            self.__sources[source_id] = (self.now + interval, interval, function, args)
+        return source_id
+
+    def __run_next(self, deadline: int) -> bool:
+        with self.__lock:
+            due = [(source[0], i) for i, source in self.__sources.items() if source[0] <= deadline]
+            if not due:
+                return False
+            # The earliest, then the first queued
+            when, source_id = min(due, key=lambda source: source[0])
+            _when, interval, function, args = self.__sources[source_id]
+        self.now = max(self.now, when)
+        repeat = function(*args)
+        with self.__lock:
+            if not repeat:
+                self.__sources.pop(source_id, None)
+            elif source_id in self.__sources and interval == 0:
+                # Idle callbacks run again straight away, though after others due
+                del self.__sources[source_id]
+                self.__sources[source_id] = (self.now, interval, function, args)
+            elif source_id in self.__sources:
+                self.__sources[source_id] = (self.now + interval, interval, function, args)
+        return True
+
+
+@pytest.fixture
+def main_loop(monkeypatch: pytest.MonkeyPatch) -> MainLoop:
+    from gi.repository import GLib
+
+    loop = MainLoop()
+    monkeypatch.setattr(GLib, "idle_add", loop.idle_add)
+    monkeypatch.setattr(GLib, "timeout_add", loop.timeout_add)
+    monkeypatch.setattr(GLib, "timeout_add_seconds", loop.timeout_add_seconds, raising=False)
+    monkeypatch.setattr(GLib, "source_remove", loop.source_remove)
+    return loop
+
+
+class StubSettings:
+    """Stands in for Gio.Settings, counting writes to the backend."""
+
+    def __init__(self, values: dict[str, Any]) -> None:
+        self.props = SimpleNamespace(
+            settings_schema=SimpleNamespace(list_keys=lambda: list(values))
+        )
+        self.written = dict(values)
+        self.unapplied: dict[str, Any] = {}
+        self.delayed = False
+        self.writes = 0
+        # Keys read with no handler connected, for which GSettings wouldn't notify changes
+        self.unwatched_reads = 0
+        self.__handlers: list[Callable] = []
+
+    def connect(self, name: str, handler: Callable) -> int:
+        assert name == "changed"
+        self.__handlers.append(handler)
+        return len(self.__handlers)
+
+    def delay(self) -> None:
+        self.delayed = True
+
+    def apply(self) -> None:
+        if self.unapplied:
+            self.written.update(self.unapplied)
+            self.unapplied.clear()
+            self.writes += 1
+
+    def get_has_unapplied(self) -> bool:
+        return bool(self.unapplied)
+
+    def get_value(self, key: str) -> SimpleNamespace:
+        if not self.__handlers:
+            self.unwatched_reads += 1
+        value = self.unapplied.get(key, self.written[key])
+        return SimpleNamespace(unpack=lambda: value)
+
+    def get_property(self, name: str) -> SimpleNamespace:
+        assert name == "settings-schema"
+        key = SimpleNamespace(get_range=lambda: ("range", (0, 2000)))
+        return SimpleNamespace(get_key=lambda _key: key)
+
+    def set_int(self, key: str, value: int) -> None:
+        self.__set(key, value)
+
+    set_boolean = set_int
+    set_string = set_int
+
+    def __set(self, key: str, value: Any) -> None:
+        if self.delayed:
+            self.unapplied[key] = value
+        else:
+            self.written[key] = value
+            self.writes += 1
+        for handler in list(self.__handlers):
+            handler(self, key)
+
+
+@pytest.fixture
+def settings(monkeypatch) -> StubSettings:
+    from gi.repository import Gio
+
+    settings = StubSettings(
+        {
+            "emergency-recovery-files": 10,
+            "emergency-recovery-max-age": 0,
+            "emergency-recovery-max-size": 0,
+            "font-size": 12,
+            "line-length": 800,
+            "quit-closes-window": False,
+            "restore-session": True,
+            "show-line-numbers": False,
+            "spelling-language": "en_US",
+            "spelling-relaxed-threshold": 500000,
+            "use-monospace-font": True,
+        }
+    )
+    monkeypatch.setattr(Gio.Settings, "new", lambda _schema_id: settings, raising=False)
+    return settings
+
+
+@pytest.fixture
+def config_manager(settings, main_loop) -> Iterator[ModuleType]:
+    # Imported afresh, as the module connects to the settings on import
+    previous = sys.modules.pop("buffer.config_manager", None)
+    yield importlib.import_module("buffer.config_manager")
+    if previous is not None:
+        sys.modules["buffer.config_manager"] = previous
+    else:
+        sys.modules.pop("buffer.config_manager", None)
+
+
+@pytest.fixture
+def gtk() -> ModuleType:
+    """The Gtk namespace, for tests of real widgets, skipped where GTK can't be used."""
+    if FAKE_GI:
+        pytest.skip("Needs PyGObject")
+    import gi
+
+    try:
+        gi.require_version("Gtk", "4.0")
+        from gi.repository import Gtk
+    except (ImportError, ValueError):
+        pytest.skip("Needs GTK 4")
+    if not Gtk.init_check():
+        pytest.skip("Needs a display")
+    return Gtk
+
+
+@pytest.fixture
+def application(config_manager, main_loop, tmp_path, monkeypatch) -> Iterator[Any]:
+    """An Application with FakeWindows in place of its windows, and its files in tmp_path.
+
+    Startup isn't run, as that builds widgets, so tests call the private methods they need.
+    """
+    if not FAKE_GI:
+        pytest.skip("Needs the stand-in for PyGObject, as the windows are fakes")
+
+    from fake_window import FakeWindow
+    from gi.repository import Gio
+
+    import buffer.application
+    import buffer.emergency_saves_manager
+    from buffer.crash_journal import CrashJournalManager
+    from buffer.emergency_saves_manager import EmergencySavesManager
+    from buffer.session_manager import SessionManager
+
+    # The modules may have been imported along with an earlier stand-in for the settings
+    for module in (buffer.application, buffer.emergency_saves_manager):
+        monkeypatch.setattr(module, "config_manager", config_manager)
+    monkeypatch.setattr(buffer.application, "Window", FakeWindow)
+    monkeypatch.setattr(CrashJournalManager, "DIRECTORY", str(tmp_path / "journal"))
+    monkeypatch.setattr(EmergencySavesManager, "DIRECTORY", str(tmp_path / "recovery"))
+    monkeypatch.setattr(SessionManager, "DIRECTORY", str(tmp_path / "session"))
+    # The application handles these, and is driven by sending them
+    handlers = {
+        number: signal.getsignal(number)
+        for number in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+    }
+
+    app = buffer.application.Application()
+    monkeypatch.setattr(Gio.Application, "get_default", lambda: app, raising=False)
+    # Most recently focused first
+    app.get_windows = lambda: list(reversed(app._Application__windows))
+    app.quit = lambda: None
+    yield app
+
+    app._Application__crash_journal_manager.shutdown()
+    app._Application__emergency_saves_manager.shutdown()
+    app._Application__session_manager.shutdown()
+    for number, handler in handlers.items():
+        signal.signal(number, handler)
@@ -0,0 +1,104 @@
+from typing import Any, Callable, Optional
+
+
+class FakeTextIter:
+    def __init__(self, offset: int, buffer: Optional["FakeTextBuffer"] = None) -> None:
+        self.__offset = offset
+        # For moving by lines, not kept current through edits
+        self.__buffer = buffer
+
+    def get_offset(self) -> int:
+        return self.__offset
+
+    def set_line_offset(self, line_offset: int) -> None:
+        assert self.__buffer is not None and line_offset == 0
+        self.__offset = self.__buffer.text.rfind("\n", 0, self.__offset) + 1
+
+    def ends_line(self) -> bool:
+        assert self.__buffer is not None
+        text = self.__buffer.text
+        return self.__offset == len(text) or text[self.__offset] == "\n"
+
+    def forward_to_line_end(self) -> None:
+        assert self.__buffer is not None
+        end = self.__buffer.text.find("\n", self.__offset)
+        self.__offset = len(self.__buffer.text) if end == -1 else end
+
+
+class FakeTextBuffer:
+    """Stands in for Gtk.TextBuffer, for code using offsets, text and the edit signals."""
+
+    def __init__(self, text: str = "") -> None:
+        self.text = text
+        self.cursor = 0
+        self.__handlers: dict[tuple[str, bool], dict[int, Callable]] = {}
+        self.__next_id = 0
+
+    def connect(self, name: str, handler: Callable) -> int:
+        return self.__connect(name, False, handler)
+
+    def connect_after(self, name: str, handler: Callable) -> int:
+        return self.__connect(name, True, handler)
+
+    def disconnect(self, handler_id: int) -> None:
+        for handlers in self.__handlers.values():
+            handlers.pop(handler_id, None)
+
+    def get_property(self, name: str) -> Any:
+        assert name == "text"
+        return self.text
+
+    def get_insert(self) -> str:
+        return "insert"
+
+    def get_iter_at_mark(self, mark: str) -> FakeTextIter:
+        assert mark == "insert"
+        return FakeTextIter(min(self.cursor, len(self.text)), self)
+
+    def place_cursor(self, location: FakeTextIter) -> None:
+        self.cursor = location.get_offset()
+
+    def get_char_count(self) -> int:
+        return len(self.text)
+
+    def get_iter_at_offset(self, offset: int) -> FakeTextIter:
+        return FakeTextIter(min(max(offset, 0), len(self.text)), self)
+
+    def get_bounds(self) -> tuple[FakeTextIter, FakeTextIter]:
+        return FakeTextIter(0, self), FakeTextIter(len(self.text), self)
+
+    def get_start_iter(self) -> FakeTextIter:
+        return FakeTextIter(0, self)
+
+    def get_end_iter(self) -> FakeTextIter:
+        return FakeTextIter(len(self.text), self)
+
+    def get_text(self, start: FakeTextIter, end: FakeTextIter, _include_hidden: bool) -> str:
+        return self.text[start.get_offset() : end.get_offset()]
+
+    def insert(self, offset: int, text: str) -> None:
+        self.__emit("insert-text", False, FakeTextIter(offset), text, len(text))
+        self._replace(offset, offset, text)
+        # As after the default handler, the location has been moved to the end of the text
+        self.__emit("insert-text", True, FakeTextIter(offset + len(text)), text, len(text))
+        self.__emit("changed", False)
+        self.__emit("changed", True)
+
+    def delete(self, start: int, end: int) -> None:
+        self.__emit("delete-range", False, FakeTextIter(start), FakeTextIter(end))
+        self._replace(start, end, "")
+        self.__emit("delete-range", True, FakeTextIter(start), FakeTextIter(start))
+        self.__emit("changed", False)
+        self.__emit("changed", True)
+
+    def _replace(self, start: int, end: int, text: str) -> None:
+        self.text = self.text[:start] + text + self.text[end:]
+
+    def __connect(self, name: str, after: bool, handler: Callable) -> int:
+        self.__next_id += 1
+        self.__handlers.setdefault((name, after), {})[self.__next_id] = handler
+        return self.__next_id
+
+    def __emit(self, name: str, after: bool, *args: Any) -> None:
+        for handler in list(self.__handlers.get((name, after), {}).values()):
+            handler(self, *args)
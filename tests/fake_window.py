@@ -0,0 +1,71 @@
+from typing import Callable, Iterator, Optional
+
+from fake_text_buffer import FakeTextBuffer
+from gi.repository import GLib
+
+
+class FakeWindow:
+    """Stands in for Window, for the application's handling of windows and their text."""
+
+    def __init__(self, _app: object = None) -> None:
+        self.buffer = FakeTextBuffer()
+        self.closed = False
+        self.__close_handlers: list[Callable] = []
+        self.__restore_source_id: Optional[int] = None
+
+    def present(self) -> None:
+        pass
+
+    def set_visible(self, _visible: bool) -> None:
+        pass
+
+    def connect(self, name: str, handler: Callable) -> int:
+        assert name == "close-request"
+        self.__close_handlers.append(handler)
+        return len(self.__close_handlers)
+
+    def close(self) -> None:
+        for handler in self.__close_handlers:
+            handler(self)
+        # As a destroyed Window, anything left running on it carries on
+        self.closed = True
+
+    def get_buffer(self) -> FakeTextBuffer:
+        return self.buffer
+
+    def get_text(self) -> str:
+        return self.buffer.text
+
+    def get_char_count(self) -> int:
+        return len(self.buffer.text)
+
+    def is_blank(self) -> bool:
+        return self.buffer.text.strip() == ""
+
+    def restore_text(self, text: str, cursor_offset: int) -> None:
+        self.buffer.insert(0, text)
+        self.buffer.cursor = cursor_offset
+
+    def restore_text_in_pieces(
+        self,
+        pieces: Iterator[str],
+        cursor_offset: int,
+        finished_callback: Optional[Callable[[], None]] = None,
+    ) -> None:
+        def restore_next() -> bool:
+            piece = next(pieces, None)
+            if piece is not None:
+                self.buffer.insert(len(self.buffer.text), piece)
+                return GLib.SOURCE_CONTINUE
+            self.__restore_source_id = None
+            self.buffer.cursor = cursor_offset
+            if finished_callback is not None:
+                finished_callback()
+            return GLib.SOURCE_REMOVE
+
+        self.__restore_source_id = GLib.idle_add(restore_next, priority=GLib.PRIORITY_LOW)
+
+    def cancel_restore(self) -> None:
+        if self.__restore_source_id is not None:
+            GLib.source_remove(self.__restore_source_id)
+            self.__restore_source_id = None
@@ -0,0 +1,83 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from buffer.crash_journal import CrashJournalManager
+from buffer.recovery_store import RecoveryStore
+
+
+def create_windows(application, texts: list[str]) -> list:
+    windows = []
+    for text in texts:
+        window = application._Application__create_window(focus=False)
+        # Typed after the window opened, so only in the crash journal
+        window.buffer.insert(0, text)
+        windows.append(window)
+    return windows
+
+
+def saved_texts(application) -> list[str]:
+    store = RecoveryStore(application._Application__emergency_saves_manager.DIRECTORY)
+    texts = ("".join(store.read(path)) for path in store.list_snapshots())
+    # Those reserved but not yet written are empty
+    return sorted(text for text in texts if text)
+
+
+def recovered_texts(application) -> list[str]:
+    application._Application__crash_journal_manager.shutdown()
+    return sorted(text for _journal, text, _cursor in CrashJournalManager().recover())
+
+
+@pytest.mark.parametrize("number", [signal.SIGTERM, signal.SIGHUP])
+def test_signal_saves_every_buffer_within_deadline(application, number) -> None:
+    # As a logout with 30 windows, of up to 1MB
+    texts = [f"buffer {i}\n" * (i + 1) * 3000 for i in range(30)]
+    windows = create_windows(application, texts + ["  \n"])
+
+    start_time = time.monotonic()
+    os.kill(os.getpid(), number)
+    elapsed = time.monotonic() - start_time
+
+    assert elapsed < application.TERMINATION_SAVE_TIMEOUT
+    assert all(window.closed for window in windows)
+    assert saved_texts(application) == sorted(texts)
+    # Saved, so not left for recovery on the next launch
+    assert recovered_texts(application) == []
+
+
+def test_buffers_not_saved_by_the_deadline_are_kept_in_journals(
+    application, monkeypatch, caplog
+) -> None:
+    monkeypatch.setattr(application, "TERMINATION_SAVE_TIMEOUT", 0.5)
+    stuck = threading.Event()
+    create_writer = RecoveryStore.create_writer
+
+    def slow_create_writer(store: RecoveryStore, path: str):
+        writer = create_writer(store, path)
+        finish = writer.finish
+
+        def slow_finish(text: str):
+            if text.startswith("stuck"):
+                stuck.wait(5)
+            return finish(text)
+
+        writer.finish = slow_finish
+        return writer
+
+    monkeypatch.setattr(RecoveryStore, "create_writer", slow_create_writer)
+    create_windows(application, ["first", "stuck", "last"])
+
+    start_time = time.monotonic()
+    os.kill(os.getpid(), signal.SIGTERM)
+    elapsed = time.monotonic() - start_time
+    saved = saved_texts(application)
+    stuck.set()
+
+    assert elapsed < 1
+    # With a single thread, the last is left queued behind the stuck write
+    assert "first" in saved and "stuck" not in saved
+    assert sorted(saved + recovered_texts(application)) == ["first", "last", "stuck"]
+    assert "Buffer of 5 characters not saved before termination" in caplog.messages
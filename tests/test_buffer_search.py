@@ -0,0 +1,41 @@
+from fake_text_buffer import FakeTextBuffer
+
+from buffer.buffer_search import BufferSearch
+
+
+def search(main_loop, query: str, buffers: list[FakeTextBuffer]) -> dict:
+    search = BufferSearch()
+    found = {}
+    finished = []
+    search.search(
+        query,
+        buffers,
+        lambda buffer, title, results: found.setdefault(buffer, (title, results)),
+        lambda: finished.append(True),
+    )
+    main_loop.run_until(lambda: finished)
+    search.close()
+    return found
+
+
+def test_snippet_marks_only_the_match(main_loop):
+    marks = BufferSearch.MATCH_START + BufferSearch.MATCH_END
+    buffer = FakeTextBuffer(f"title\nbefore {marks}x{BufferSearch.MATCH_END} needle{marks} after")
+    _title, results = search(main_loop, "needle", [buffer])[buffer]
+    assert [result.snippet for result in results] == [
+        f"before x {BufferSearch.MATCH_START}needle{BufferSearch.MATCH_END} after"
+    ]
+    assert buffer.text[results[0].start : results[0].end] == "needle"
+
+
+def test_matches_are_found_across_chunks(main_loop, monkeypatch):
+    monkeypatch.setattr(BufferSearch, "CHUNK", 8)
+    buffer = FakeTextBuffer("first\n" + "ab needle\n" * 5)
+    empty = FakeTextBuffer("nothing here")
+    found = search(main_loop, "NEEDLE", [buffer, empty])
+    assert list(found) == [buffer]
+    title, results = found[buffer]
+    assert title == "first"
+    assert [(result.start, result.line) for result in results] == [
+        (9 + 10 * i, 2 + i) for i in range(5)
+    ]
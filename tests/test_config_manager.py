@@ -0,0 +1,188 @@
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable
+import weakref
+
+import pytest
+
+
+def test_values_are_read_once_watched(config_manager, settings) -> None:
+    assert settings.unwatched_reads == 0
+    assert config_manager.get_font_size() == 12
+
+
+def test_burst_of_changes_is_written_once(config_manager, settings, main_loop) -> None:
+    # As on key repeat, every 30ms
+    for size in range(13, 33):
+        config_manager.set_font_size(size)
+        assert config_manager.get_font_size() == size
+        main_loop.advance(30)
+    assert settings.writes == 0
+
+    main_loop.advance(config_manager.WRITE_DELAY)
+    assert settings.writes == 1
+    assert settings.written["font-size"] == 32
+    assert main_loop.pending == 0
+
+
+def test_changes_apart_are_written_separately(config_manager, settings, main_loop) -> None:
+    config_manager.set_font_size(14)
+    main_loop.advance(config_manager.WRITE_DELAY)
+    config_manager.set_line_length(900)
+    main_loop.advance(config_manager.WRITE_DELAY)
+
+    assert settings.writes == 2
+    assert settings.written["line-length"] == 900
+
+
+def test_flush_writes_held_back_changes(config_manager, settings, main_loop, monkeypatch) -> None:
+    from gi.repository import Gio
+
+    monkeypatch.setattr(Gio.Settings, "sync", lambda: None, raising=False)
+    config_manager.set_font_size(14)
+    config_manager.flush()
+
+    assert settings.writes == 1
+    assert main_loop.pending == 0
+
+
+class FakeWindow:
+    """Subscribes as windows and their widgets do, holding a reference cycle as they do."""
+
+    calls_after_close = 0
+
+    def __init__(self) -> None:
+        # As imported by the config_manager fixture
+        import buffer.config_manager as config_manager
+
+        self.calls = 0
+        self.closed = False
+        self.cycle = self
+        config_manager.subscribe(config_manager.FONT_SIZE, self.on_font_size_changed)
+        config_manager.subscribe(config_manager.FONT_SIZE, self.on_style_changed)
+        config_manager.subscribe(config_manager.SHOW_LINE_NUMBERS, self.on_style_changed)
+
+    def on_font_size_changed(self) -> None:
+        self.__record()
+
+    def on_style_changed(self) -> None:
+        self.__record()
+
+    def __record(self) -> None:
+        self.calls += 1
+        if self.closed:
+            FakeWindow.calls_after_close += 1
+
+
+def soak(config_manager, open_window: Callable[[], Any]) -> None:
+    """Open and close windows, checking that neither they nor their subscriptions pile up."""
+    iterations = 1000
+    kept = open_window()
+    closed = []
+    calls_after_close = FakeWindow.calls_after_close
+    for i in range(iterations):
+        if i == 100:
+            # Once caches, the subscriber lists and the like have grown to size
+            gc.collect()
+            objects = len(gc.get_objects())
+            tracemalloc.start()
+            memory, _peak = tracemalloc.get_traced_memory()
+        window = open_window()
+        config_manager.set_font_size(i % 50 + 6)
+        assert window.calls == 2
+        window.closed = True
+        if i % 100 == 0:
+            closed.append(weakref.ref(window))
+        del window
+        # As the windows are in reference cycles, the younger generations only to be quick
+        gc.collect(1)
+
+    gc.collect()
+    memory_growth = tracemalloc.get_traced_memory()[0] - memory
+    tracemalloc.stop()
+    object_growth = len(gc.get_objects()) - objects
+    print(f"\nAfter {iterations} windows: {object_growth} objects, {memory_growth} bytes more")
+    # Allowing for the references to sample windows
+    assert object_growth < 50
+    assert memory_growth < 20000
+
+    config_manager.set_font_size(60)
+    config_manager.set_show_line_numbers(True)
+
+    assert all(reference() is None for reference in closed)
+    assert FakeWindow.calls_after_close == calls_after_close
+    assert kept.calls == iterations * 2 + 3
+    assert len(config_manager._subscribers[config_manager.FONT_SIZE]) == 2
+    assert len(config_manager._subscribers[config_manager.SHOW_LINE_NUMBERS]) == 1
+
+
+def test_closed_windows_are_collected_and_not_called(config_manager, settings) -> None:
+    soak(config_manager, FakeWindow)
+
+
+def test_closed_widgets_are_collected_and_not_called(config_manager, settings, gtk) -> None:
+    class SubscribingWidget(gtk.Box):
+        """A widget subscribing with its own bound methods, as Window and its children do."""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.calls = 0
+            self.closed = False
+            self.append(gtk.Label())
+            config_manager.subscribe(config_manager.FONT_SIZE, self.on_font_size_changed)
+            config_manager.subscribe(config_manager.FONT_SIZE, self.on_style_changed)
+            config_manager.subscribe(config_manager.SHOW_LINE_NUMBERS, self.on_style_changed)
+
+        def on_font_size_changed(self) -> None:
+            self.__record()
+
+        def on_style_changed(self) -> None:
+            self.__record()
+
+        def __record(self) -> None:
+            self.calls += 1
+            if self.closed:
+                FakeWindow.calls_after_close += 1
+
+    soak(config_manager, SubscribingWidget)
+
+
+class SchemaWalkingSettings:
+    """Reads as the getters did before the mirror: through GSettings on each call, the line length
+    maximum walking the schema."""
+
+    def __init__(self, settings) -> None:
+        self.__settings = settings
+
+    def get_font_size(self) -> int:
+        return self.__settings.get_value("font-size").unpack()
+
+    def get_line_length_max(self) -> int:
+        schema = self.__settings.get_property("settings-schema")
+        return schema.get_key("line-length").get_range()[1][-1]
+
+
+@pytest.mark.benchmark
+def test_getter_cost(config_manager, settings) -> None:
+    calls = 100000
+    before = SchemaWalkingSettings(settings)
+    timings = {}
+    for name, getters in (
+        ("before", before),
+        ("after", config_manager),
+    ):
+        for getter in ("get_font_size", "get_line_length_max"):
+            function = getattr(getters, getter)
+            start_time = time.perf_counter()
+            for _ in range(calls):
+                function()
+            timings[name, getter] = (time.perf_counter() - start_time) / calls * 1000000
+
+    print()
+    for getter in ("get_font_size", "get_line_length_max"):
+        print(
+            f"{getter}: {timings['before', getter]:.3f}us through settings,"
+            f" {timings['after', getter]:.3f}us from the mirror"
+        )
+        assert timings["after", getter] < timings["before", getter]
@@ -0,0 +1,80 @@
+import random
+import time
+
+import pytest
+from fake_text_buffer import FakeTextBuffer
+
+from buffer.crash_journal import CrashJournalManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch, main_loop) -> CrashJournalManager:
+    monkeypatch.setattr(CrashJournalManager, "DIRECTORY", str(tmp_path))
+    return CrashJournalManager()
+
+
+def edit_randomly(buffer: FakeTextBuffer, rng: random.Random, edits: int) -> None:
+    for _ in range(edits):
+        offset = rng.randrange(len(buffer.text) + 1)
+        if rng.random() < 0.3 and offset < len(buffer.text):
+            buffer.delete(offset, min(offset + rng.randrange(1, 20), len(buffer.text)))
+        else:
+            buffer.insert(offset, rng.choice(["x", "yz", "\n", "typed text "]))
+        buffer.cursor = offset
+
+
+def test_edits_are_recovered(manager, main_loop, monkeypatch) -> None:
+    # So that the journal is compacted into a snapshot part way through
+    monkeypatch.setattr(CrashJournalManager, "COMPACT_AFTER_RECORDS", 50)
+    rng = random.Random(1)
+    buffer = FakeTextBuffer("the snapshot\n" * 100)
+    manager.create_journal(buffer)
+    for _ in range(10):
+        edit_randomly(buffer, rng, 30)
+        main_loop.advance(CrashJournalManager.FLUSH_INTERVAL * 1000)
+
+    # As after a crash, with the journal left behind
+    manager.shutdown()
+
+    assert [(text, cursor) for _journal, text, cursor in CrashJournalManager().recover()] == [
+        (buffer.text, buffer.cursor)
+    ]
+
+
+class KeystrokeBuffer(FakeTextBuffer):
+    """Leaves its text as it was, as copying the text on each edit would swamp the timings."""
+
+    def _replace(self, start: int, end: int, text: str) -> None:
+        pass
+
+
+@pytest.mark.benchmark
+def test_keystroke_latency_is_flat_with_buffer_size(manager, main_loop) -> None:
+    keystrokes = 6000
+    timings = {}
+    for size in (10_000, 50_000_000):
+        rng = random.Random(1)
+        buffer = KeystrokeBuffer(("lorem ipsum dolor sit amet\n" * (size // 27 + 1))[:size])
+        manager.create_journal(buffer)
+        latencies = []
+        for i in range(keystrokes):
+            # Scattered, so that each is a record and the journal is compacted as typing goes on
+            offset = rng.randrange(size)
+            start_time = time.perf_counter()
+            buffer.insert(offset, "x")
+            # A keystroke every 10ms, running the flush timeout as it becomes due
+            if i % 10 == 0:
+                main_loop.advance(100)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            # Leaving the worker time to write and compact, as between keystrokes
+            time.sleep(0.0005)
+        manager.shutdown()
+        latencies.sort()
+        timings[size] = (latencies[keystrokes // 2], latencies[keystrokes * 99 // 100])
+        print(
+            f"{size:>9} characters: keystroke p50 {timings[size][0]:.3f}ms, "
+            f"p99 {timings[size][1]:.3f}ms, max {latencies[-1]:.3f}ms"
+        )
+
+    # Typing at 50MB costs the same as at 10KB, give or take a thread switch
+    assert timings[50_000_000][1] < max(timings[10_000][1] * 4, 1)
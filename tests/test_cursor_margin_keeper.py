@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+from typing import Callable
+
+from buffer.cursor_margin_keeper import CursorMarginKeeper
+
+LINE_HEIGHT = 20
+
+
+class Adjustment:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.page_size = 400.0
+
+    def get_value(self) -> float:
+        return self.value
+
+    def set_value(self, value: float) -> None:
+        self.value = value
+
+    def get_page_size(self) -> float:
+        return self.page_size
+
+
+class Buffer:
+    def __init__(self) -> None:
+        self.offset = 0
+        self.line = 0
+        self.line_count = 1
+        self.__handlers: list[Callable] = []
+
+    def connect(self, _name: str, handler: Callable) -> int:
+        self.__handlers.append(handler)
+        return len(self.__handlers)
+
+    def move_cursor(self, line: int) -> None:
+        self.offset += 1
+        self.line = line
+        self.line_count = max(self.line_count, line + 1)
+        for handler in self.__handlers:
+            handler(self)
+
+    def get_insert(self) -> str:
+        return "insert"
+
+    def get_iter_at_mark(self, _mark: str) -> SimpleNamespace:
+        return SimpleNamespace(get_offset=lambda: self.offset, line=self.line)
+
+    def get_line_count(self) -> int:
+        return self.line_count
+
+
+class View:
+    def __init__(self, buffer: Buffer) -> None:
+        self.buffer = buffer
+        self.tick_callbacks: list[Callable] = []
+        self.ticks_added = 0
+        self.location_lookups = 0
+
+    def get_buffer(self) -> Buffer:
+        return self.buffer
+
+    def add_tick_callback(self, callback: Callable) -> int:
+        self.tick_callbacks.append(callback)
+        self.ticks_added += 1
+        return len(self.tick_callbacks)
+
+    def get_iter_location(self, location: SimpleNamespace) -> SimpleNamespace:
+        self.location_lookups += 1
+        return SimpleNamespace(y=location.line * LINE_HEIGHT, height=LINE_HEIGHT)
+
+    def get_top_margin(self) -> int:
+        return 0
+
+    def run_frame(self) -> None:
+        callbacks = self.tick_callbacks
+        self.tick_callbacks = []
+        for callback in callbacks:
+            callback(self, None)
+
+
+def make_keeper() -> tuple[View, Adjustment]:
+    buffer = Buffer()
+    view = View(buffer)
+    adjustment = Adjustment()
+    CursorMarginKeeper(view, SimpleNamespace(get_vadjustment=lambda: adjustment))
+    return view, adjustment
+
+
+def test_changes_within_a_frame_are_checked_once() -> None:
+    view, adjustment = make_keeper()
+
+    for line in range(10000):
+        view.buffer.move_cursor(line)
+
+    assert view.ticks_added == 1
+    view.run_frame()
+    assert view.location_lookups == 1
+    lowest_visible = 10000 * LINE_HEIGHT
+    assert adjustment.value == (
+        lowest_visible + CursorMarginKeeper.MARGIN_BELOW_CURSOR - adjustment.page_size
+    )
+
+    # Nothing further queued until the next change
+    view.run_frame()
+    assert view.location_lookups == 1
+
+
+def test_edits_spanning_frames_are_checked_once_per_frame() -> None:
+    view, adjustment = make_keeper()
+    edits_per_frame = 7
+    frames = 0
+
+    for line in range(10000):
+        view.buffer.move_cursor(line)
+        if line % edits_per_frame == edits_per_frame - 1:
+            assert len(view.tick_callbacks) == 1
+            view.run_frame()
+            frames += 1
+            assert view.location_lookups == frames
+    view.run_frame()
+    frames += 1
+
+    assert view.ticks_added == frames
+    assert view.location_lookups == frames
+    assert adjustment.value == (
+        10000 * LINE_HEIGHT + CursorMarginKeeper.MARGIN_BELOW_CURSOR - adjustment.page_size
+    )
+
+
+def test_check_is_skipped_when_nothing_has_moved() -> None:
+    view, adjustment = make_keeper()
+    view.buffer.move_cursor(5)
+    view.run_frame()
+    assert view.location_lookups == 1
+
+    # A change that leaves the cursor, line count and scroll position as they were
+    view.buffer.offset -= 1
+    view.buffer.move_cursor(5)
+    view.run_frame()
+    assert view.location_lookups == 1
+
+    adjustment.value = 50.0
+    view.buffer.offset -= 1
+    view.buffer.move_cursor(5)
+    view.run_frame()
+    assert view.location_lookups == 2
+    # Well clear of the bottom, so left where it is
+    assert adjustment.value == 50.0
@@ -0,0 +1,219 @@
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from fake_text_buffer import FakeTextBuffer, FakeTextIter
+
+
+class TaggedBuffer(FakeTextBuffer):
+    """Keeps which characters carry the one tag, so that removing it costs in proportion to the
+    range, and has marks that stay put."""
+
+    def __init__(self, text: str) -> None:
+        super().__init__(text)
+        self.tagged = bytearray(len(text))
+
+    def apply_tag(self, _tag: str, start: FakeTextIter, end: FakeTextIter) -> None:
+        self.tagged[start.get_offset() : end.get_offset()] = b"\1" * (
+            end.get_offset() - start.get_offset()
+        )
+
+    def remove_tag(self, _tag: str, start: FakeTextIter, end: FakeTextIter) -> None:
+        self.tagged[start.get_offset() : end.get_offset()] = bytes(
+            end.get_offset() - start.get_offset()
+        )
+
+    def create_mark(self, _name: None, location: FakeTextIter, _left_gravity: bool) -> Any:
+        return location
+
+    def get_iter_at_mark(self, mark: Any) -> FakeTextIter:
+        return super().get_iter_at_mark(mark) if mark == "insert" else mark
+
+    def delete_mark(self, _mark: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def header_bar_class(config_manager) -> Any:
+    from buffer.editor_search_header_bar import EditorSearchHeaderBar
+
+    return EditorSearchHeaderBar
+
+
+class ReplacedBuffer(FakeTextBuffer):
+    """Edits at iters as a Gtk.TextBuffer does, counting user actions, optionally leaving its text
+    as it was as copying the text on each edit would swamp the timings."""
+
+    def __init__(self, text: str, keep_text: bool = True) -> None:
+        super().__init__(text)
+        self.keep_text = keep_text
+        self.edits = 0
+        self.user_actions = 0
+
+    def begin_user_action(self) -> None:
+        self.user_actions += 1
+
+    def end_user_action(self) -> None:
+        pass
+
+    def insert(self, location: FakeTextIter, text: str) -> None:
+        self.edits += 1
+        super().insert(location.get_offset(), text)
+
+    def delete(self, start: FakeTextIter, end: FakeTextIter) -> None:
+        self.edits += 1
+        super().delete(start.get_offset(), end.get_offset())
+
+    def _replace(self, start: int, end: int, text: str) -> None:
+        if self.keep_text:
+            super()._replace(start, end, text)
+            # As the insert mark, which has right gravity
+            if self.cursor >= end:
+                self.cursor += start - end
+            elif self.cursor > start:
+                self.cursor = start
+            if self.cursor >= start:
+                self.cursor += len(text)
+
+
+def make_replacing_header_bar(header_bar_class: Any, buffer: FakeTextBuffer, term: str) -> Any:
+    """A header bar ready to replace all matches of the term with "pain", searching again after
+    left out as the match tracker is benchmarked on its own."""
+    from buffer.search_pattern import compile_search_pattern
+
+    header_bar = header_bar_class.__new__(header_bar_class)
+    header_bar.replaced = []
+    attributes = {
+        "sourceview": SimpleNamespace(get_buffer=lambda: buffer),
+        "search_text_source_id": None,
+        "active": True,
+        "pattern": compile_search_pattern(term, False, False, False),
+        "current_match_marks": None,
+        "match_tracker": SimpleNamespace(stop=lambda: None),
+        "highlighter": SimpleNamespace(set_pattern=lambda _pattern: None),
+        "replace_action": SimpleNamespace(set_enabled=lambda _enabled: None),
+        "get_option": lambda _name: False,
+        "track_search_text": lambda: None,
+    }
+    for name, value in attributes.items():
+        setattr(header_bar, f"_EditorSearchHeaderBar__{name}", value)
+    header_bar._replace_entry = SimpleNamespace(get_text=lambda: "pain")
+    header_bar.emit = lambda _signal, count: header_bar.replaced.append(count)
+    return header_bar
+
+
+def time_cursor_moves(header_bar_class, size: int, whole_buffer: bool) -> float:
+    """Tag a match and clear it as on moving the cursor, returning the median time to clear."""
+    buffer = TaggedBuffer("lorem ipsum dolor sit amet\n" * (size // 27))
+    # Only what clearing the current match uses, as the widget itself needs GTK
+    header_bar = header_bar_class.__new__(header_bar_class)
+    header_bar._EditorSearchHeaderBar__sourceview = type(
+        "View", (), {"get_buffer": lambda _self: buffer}
+    )()
+    header_bar._EditorSearchHeaderBar__current_match_tag = "current-match"
+
+    timings = []
+    for i in range(200):
+        start = buffer.get_iter_at_offset(i * 27 % len(buffer.text))
+        end = buffer.get_iter_at_offset(start.get_offset() + 5)
+        buffer.apply_tag("current-match", start, end)
+        header_bar._EditorSearchHeaderBar__current_match_marks = (
+            buffer.create_mark(None, start, True),
+            buffer.create_mark(None, end, False),
+        )
+        start_time = time.perf_counter()
+        if whole_buffer:
+            # As before, the tag removed across the whole buffer
+            buffer.remove_tag("current-match", *buffer.get_bounds())
+        else:
+            header_bar._EditorSearchHeaderBar__clear_current_match()
+        timings.append((time.perf_counter() - start_time) * 1000000)
+        assert not any(buffer.tagged[start.get_offset() : end.get_offset()])
+    return statistics.median(timings)
+
+
+@pytest.mark.benchmark
+def test_clearing_the_current_match_takes_constant_time(header_bar_class) -> None:
+    small, large = 10 * 1024, 10 * 1024 * 1024
+    timings = {
+        (size, whole_buffer): time_cursor_moves(header_bar_class, size, whole_buffer)
+        for size in (small, large)
+        for whole_buffer in (False, True)
+    }
+    print(
+        f"\nClearing the current match: {timings[small, False]:.1f}us at 10KB,"
+        f" {timings[large, False]:.1f}us at 10MB; across the whole buffer"
+        f" {timings[small, True]:.1f}us at 10KB, {timings[large, True]:.1f}us at 10MB"
+    )
+    # Allowing for timer noise at such short durations
+    assert timings[large, False] < timings[small, False] * 3 + 5
+    assert timings[large, True] > timings[large, False] * 10
+
+
+@pytest.mark.parametrize("cursor", [0, 6, 8, 11, 14, 30, 78])
+def test_replacing_across_the_span_matches_replacing_each(
+    header_bar_class, monkeypatch, cursor
+) -> None:
+    results = []
+    for threshold in (1000, 0):
+        monkeypatch.setattr(header_bar_class, "REPLACE_ALL_SPAN_THRESHOLD", threshold)
+        buffer = ReplacedBuffer("lorem dolor sit\nthe dolorous dolor\nend\n" * 2)
+        buffer.cursor = cursor
+        header_bar = make_replacing_header_bar(header_bar_class, buffer, "dolor")
+        header_bar._EditorSearchHeaderBar__replace_all()
+        assert header_bar.replaced == [6]
+        assert buffer.user_actions == 1
+        results.append((buffer.text, buffer.cursor, buffer.edits))
+
+    (text, cursor_after, edits), (span_text, span_cursor_after, span_edits) = results
+    assert span_text == text == "lorem pain sit\nthe painous pain\nend\n" * 2
+    assert span_cursor_after == cursor_after
+    assert (edits, span_edits) == (12, 2)
+
+
+@pytest.mark.benchmark
+def test_replace_all_edits_the_buffer_once_above_the_threshold(
+    header_bar_class, monkeypatch, tmp_path, main_loop, config_manager
+) -> None:
+    from buffer.crash_journal import CrashJournalManager
+    from buffer.cursor_margin_keeper import CursorMarginKeeper
+    from buffer.editor_text_view import EditorTextView
+
+    monkeypatch.setattr(CrashJournalManager, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr("buffer.editor_text_view.config_manager", config_manager)
+    manager = CrashJournalManager()
+    matches = 100_000
+    timings = {}
+    for threshold in (matches, header_bar_class.REPLACE_ALL_SPAN_THRESHOLD):
+        monkeypatch.setattr(header_bar_class, "REPLACE_ALL_SPAN_THRESHOLD", threshold)
+        buffer = ReplacedBuffer("lorem ipsum dolor sit amet\n" * matches, keep_text=False)
+        # The handlers each edit runs: journalling, the spelling mode check and the cursor margin
+        manager.create_journal(buffer)
+        view = EditorTextView.__new__(EditorTextView)
+        ticks = []
+        view.get_buffer = lambda: buffer
+        view.add_tick_callback = lambda callback: ticks.append(callback) or len(ticks)
+        view._EditorTextView__spelling_adapter = SimpleNamespace(
+            get_enabled=lambda: False, set_enabled=lambda _enabled: None
+        )
+        view._EditorTextView__viewport_spell_checker = SimpleNamespace(
+            set_enabled=lambda _enabled: None
+        )
+        view._EditorTextView__spelling_wanted = True
+        view._EditorTextView__spelling_relaxed = False
+        buffer.connect("changed", lambda _o: view._EditorTextView__update_spelling_mode())
+        CursorMarginKeeper(view, None)
+        header_bar = make_replacing_header_bar(header_bar_class, buffer, "dolor")
+
+        start_time = time.perf_counter()
+        header_bar._EditorSearchHeaderBar__replace_all()
+        timings[threshold] = (time.perf_counter() - start_time) * 1000
+        assert header_bar.replaced == [matches]
+        assert len(ticks) == 1
+        assert buffer.edits == (2 * matches if threshold == matches else 2)
+        manager.shutdown()
+    each, span = timings[matches], timings[header_bar_class.REPLACE_ALL_SPAN_THRESHOLD]
+    print(f"\nReplacing 100k matches in 2.7MB: {each:.0f}ms edit by edit, {span:.0f}ms as one")
+    assert span * 3 < each
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+WINDOWS = 50
+
+
+class CountingCssProvider:
+    """Stands in for Gtk.CssProvider, keeping the CSS loaded."""
+
+    loads: list[str] = []
+
+    def load_from_data(self, data: str, _length: int) -> None:
+        CountingCssProvider.loads.append(data)
+
+
+class PerViewStyle:
+    """Styles a view as each editor view did before, with its own provider reparsed on change."""
+
+    def __init__(self, config_manager) -> None:
+        self.__config_manager = config_manager
+        self.__css_provider = CountingCssProvider()
+        config_manager.subscribe(config_manager.FONT_SIZE, self.update)
+
+    def update(self) -> None:
+        size = self.__config_manager.get_font_size()
+        self.__css_provider.load_from_data(
+            f"""
+        .editor-textview {{
+            font-size: {size}pt;
+            font-family: monospace, monospace;
+        }}""",
+            -1,
+        )
+
+
+@pytest.fixture
+def editor_style(config_manager, monkeypatch):
+    from gi.repository import Gtk
+
+    import buffer.editor_style
+    from buffer.editor_style import EditorStyle
+
+    monkeypatch.setattr(buffer.editor_style, "config_manager", config_manager)
+    monkeypatch.setattr(Gtk, "CssProvider", CountingCssProvider)
+    monkeypatch.setattr(CountingCssProvider, "loads", [])
+    return EditorStyle(None)
+
+
+def time_font_size_change(config_manager, size: int) -> float:
+    CountingCssProvider.loads.clear()
+    start_time = time.perf_counter()
+    config_manager.set_font_size(size)
+    return (time.perf_counter() - start_time) * 1000
+
+
+def test_font_size_change_loads_style_once(editor_style, config_manager) -> None:
+    CountingCssProvider.loads.clear()
+    config_manager.set_font_size(20)
+
+    assert len(CountingCssProvider.loads) == 1
+    assert "font-size: 20pt;" in CountingCssProvider.loads[0]
+    assert ".editor-textview.monospace-font {" in CountingCssProvider.loads[0]
+
+
+@pytest.mark.benchmark
+def test_font_size_change_across_windows(editor_style, config_manager) -> None:
+    elapsed = min(time_font_size_change(config_manager, 10 + i % 2) for i in range(20))
+    loads = len(CountingCssProvider.loads)
+
+    views = [PerViewStyle(config_manager) for _ in range(WINDOWS)]
+    per_view_elapsed = min(time_font_size_change(config_manager, 10 + i % 2) for i in range(20))
+    # Less the shared provider's load, still made
+    per_view_loads = len(CountingCssProvider.loads) - loads
+
+    print(
+        f"\nFont size change with {len(views)} windows: shared provider {loads} parse, "
+        f"{elapsed:.3f}ms; per view providers {per_view_loads} parses, {per_view_elapsed:.3f}ms"
+    )
+    assert loads == 1
+    assert per_view_loads == WINDOWS
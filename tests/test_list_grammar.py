@@ -0,0 +1,129 @@
+from timeit import timeit
+
+import pytest
+
+from buffer.list_grammar import (
+    ListGrammar,
+    calculate_ordered_list_index,
+    format_ordered_list_item,
+)
+
+
+@pytest.fixture
+def grammar() -> ListGrammar:
+    return ListGrammar()
+
+
+@pytest.mark.parametrize(
+    "line, matched, continuation",
+    [
+        ("- item", "- ", "- "),
+        ("+ item", "+ ", "+ "),
+        ("* item", "* ", "* "),
+        ("- [ ] task", "- [ ] ", "- [ ] "),
+        # A checked item is continued unchecked
+        ("- [x] done", "- [x] ", "- [ ] "),
+        ("  - nested", "  - ", "  - "),
+        ("\t\t* nested", "\t\t* ", "\t\t* "),
+    ],
+)
+def test_bullet_items_are_continued(grammar, line, matched, continuation) -> None:
+    match = grammar.match_bullet_item(line)
+    assert match is not None and match.group() == matched
+    assert grammar.continue_bullet_item(match.group()) == continuation
+
+
+@pytest.mark.parametrize("line", ["-item", "text - item", "", "-", "[ ] task"])
+def test_lines_without_a_bullet_token_are_not_matched(grammar, line) -> None:
+    assert grammar.match_bullet_item(line) is None
+
+
+def test_custom_tokens_take_precedence_in_order() -> None:
+    grammar = ListGrammar({"-> ": "-> ", "- ": "- "})
+    assert grammar.match_bullet_item("-> arrow").group() == "-> "
+    assert grammar.match_bullet_item("* star") is None
+
+
+@pytest.mark.parametrize(
+    "line, groups, next_item",
+    [
+        ("1. one", ("", "1", "."), "2. "),
+        ("9) nine", ("", "9", ")"), "10) "),
+        ("a. first", ("", "a", "."), "b. "),
+        ("   C) third", ("   ", "C", ")"), "   D) "),
+    ],
+)
+def test_ordered_items_are_continued(grammar, line, groups, next_item) -> None:
+    match = grammar.match_ordered_item(line)
+    assert match is not None and match.groups() == groups
+    spacing, index, delimiter = match.groups()
+    continued = format_ordered_list_item(spacing, calculate_ordered_list_index(index, 1), delimiter)
+    assert continued == next_item
+
+
+@pytest.mark.parametrize("line", ["1.one", "ab. two letters", "1: colon", "text 1. item"])
+def test_lines_without_an_ordered_index_are_not_matched(grammar, line) -> None:
+    assert grammar.match_ordered_item(line) is None
+
+
+@pytest.mark.parametrize(
+    "reference, direction, expected",
+    [("3", -1, "2"), ("b", -1, "a"), ("z", 1, None), ("Z", 1, None), ("A", -1, None)],
+)
+def test_ordered_list_index_sequence(reference, direction, expected) -> None:
+    assert calculate_ordered_list_index(reference, direction) == expected
+
+
+def test_indent_for_list_items_and_text(grammar) -> None:
+    assert grammar.indent_for("- item") == "  "
+    assert grammar.indent_for("1. item") == "  "
+    assert grammar.indent_for("text") == "\t"
+    assert grammar.is_list_item("  - [ ] nested")
+    assert not grammar.is_list_item("text")
+
+
+def test_indent_lines(grammar) -> None:
+    text = "- item\ntext\n\n1. item\r\n  - nested"
+
+    indented, deltas = grammar.indent_lines(text, True)
+
+    # Empty lines are left alone, and line breaks kept as they were
+    assert indented == "  - item\n\ttext\n\n  1. item\r\n    - nested"
+    assert deltas == [2, 1, 0, 2, 2]
+
+
+def test_outdent_lines(grammar) -> None:
+    text = "    - nested\n\t\ttext\n- top\nplain\n  1. item"
+
+    outdented, deltas = grammar.indent_lines(text, False)
+
+    # Lines not indented by a step are left alone
+    assert outdented == "  - nested\n\ttext\n- top\nplain\n1. item"
+    assert deltas == [-2, -1, 0, 0, -2]
+
+
+def test_indent_and_outdent_round_trip(grammar) -> None:
+    text = "\n".join(["- item", "text", "", "  * nested", "2) item", "\tindented"] * 100)
+
+    indented, _deltas = grammar.indent_lines(text, True)
+
+    assert grammar.indent_lines(indented, False)[0] == text
+
+
+@pytest.mark.benchmark
+def test_indent_lines_scales_linearly(grammar) -> None:
+    lines = ["- item", "text of a line", "", "  * nested", "12) item", "\tindented text"]
+    per_line = {}
+    for count in (1000, 10000, 100000):
+        text = "\n".join(lines[i % len(lines)] + f" {i}" for i in range(count))
+        timings = []
+        for increase in (True, False):
+            # Best of several, to leave out interruptions
+            best = min(
+                timeit(lambda: grammar.indent_lines(text, increase), number=1) for _ in range(5)
+            )
+            timings.append(best * 1000)
+        per_line[count] = max(timings) / count
+        print(f"{count:>6} lines: indent {timings[0]:.1f}ms, outdent {timings[1]:.1f}ms")
+
+    assert per_line[100000] < per_line[1000] * 3
@@ -0,0 +1,156 @@
+import random
+import sqlite3
+import statistics
+import threading
+import time
+
+import pytest
+
+from buffer.recovery_search_index import RecoverySearchIndex
+from buffer.recovery_store import RecoveryStore
+
+
+def save(store: RecoveryStore, directory, name: str, text: str) -> str:
+    path = str(directory / f"{name}{RecoveryStore.SNAPSHOT_SUFFIX}")
+    assert store.create_writer(path).finish(text) is not None
+    return path
+
+
+def test_search_finds_snapshots_with_snippets(tmp_path) -> None:
+    store = RecoveryStore(str(tmp_path))
+    padding = "lorem ipsum " * 20000
+    path = save(store, tmp_path, "a", padding + "the quick brown fox jumps\n" + padding)
+    save(store, tmp_path, "b", "nothing of interest")
+    index = RecoverySearchIndex(str(tmp_path), store)
+
+    index.open()
+    assert index.search("brown jump") == [path]
+    snippet = index.snippet(path, "brown jump")
+    start, end = RecoverySearchIndex.MATCH_START, RecoverySearchIndex.MATCH_END
+    assert f"quick {start}brown{end} fox {start}jumps{end}" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert len(snippet) < RecoverySearchIndex.SNIPPET_LENGTH + 10
+
+
+def test_index_holds_no_copy_of_the_text(tmp_path) -> None:
+    store = RecoveryStore(str(tmp_path))
+    text = "distinctivewordxyz and more " * 20000
+    save(store, tmp_path, "a", text)
+    index = RecoverySearchIndex(str(tmp_path), store)
+    index.open()
+    assert len(index.search("distinctivewordxyz")) == 1
+    del index
+
+    with open(tmp_path / RecoverySearchIndex.FILENAME, "rb") as f:
+        assert b"distinctivewordxyz and more" not in f.read()
+
+
+def test_snippet_drops_marker_characters_from_text(tmp_path) -> None:
+    store = RecoveryStore(str(tmp_path))
+    path = save(store, tmp_path, "a", "before \x03 needle \x02 after")
+    snippet = RecoverySearchIndex(str(tmp_path), store).snippet(path, "needle")
+
+    assert snippet == "before  \x02needle\x03  after"
+
+
+def test_removed_snapshots_are_not_found(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(RecoverySearchIndex, "CONTENTLESS_DELETE", False)
+    monkeypatch.setattr(RecoverySearchIndex, "MIN_REBUILD_ORPHANS", 2)
+    store = RecoveryStore(str(tmp_path))
+    paths = [save(store, tmp_path, str(i), f"common word{i}") for i in range(4)]
+    index = RecoverySearchIndex(str(tmp_path), store)
+    index.open()
+    assert len(index.search("common")) == 4
+
+    store.remove(paths[:2])
+    index.remove(paths[:2])
+    assert sorted(index.search("common")) == sorted(paths[2:])
+
+    # Once removed rows outnumber the rest the table is rebuilt without them
+    store.remove(paths[2:3])
+    index.remove(paths[2:3])
+    connection = sqlite3.connect(tmp_path / RecoverySearchIndex.FILENAME)
+    assert connection.execute("SELECT count(*) FROM snapshots").fetchone() == (1,)
+    assert index.search("common") == paths[3:]
+
+
+def test_index_with_copy_of_text_is_replaced(tmp_path) -> None:
+    store = RecoveryStore(str(tmp_path))
+    path = save(store, tmp_path, "a", "kept text")
+    connection = sqlite3.connect(tmp_path / RecoverySearchIndex.FILENAME)
+    connection.execute("CREATE TABLE names (name TEXT PRIMARY KEY)")
+    connection.execute("CREATE VIRTUAL TABLE snapshots USING fts5(content, prefix='1 2 3')")
+    connection.execute("INSERT INTO names (name) VALUES ('gone.snapshot')")
+    connection.execute("INSERT INTO snapshots (rowid, content) VALUES (1, 'kept text')")
+    connection.commit()
+
+    index = RecoverySearchIndex(str(tmp_path), store)
+    index.open()
+
+    assert index.search("kept") == [path]
+    assert connection.execute("SELECT content FROM snapshots").fetchall() == [(None,)]
+
+
+def test_only_recent_matches_are_ranked(tmp_path, monkeypatch) -> None:
+    store = RecoveryStore(str(tmp_path))
+    # Names are timestamps, so these were saved in order
+    oldest = save(store, tmp_path, "1", "term term term")
+    middle = save(store, tmp_path, "2", "term and other words")
+    newest = save(store, tmp_path, "3", "term term")
+    index = RecoverySearchIndex(str(tmp_path), store)
+    index.open()
+    assert index.search("term") == [oldest, newest, middle]
+
+    monkeypatch.setattr(RecoverySearchIndex, "RANKED_CANDIDATES", 2)
+    assert index.search("term") == [newest, middle]
+
+
+def test_search_doesnt_wait_for_saves(tmp_path, monkeypatch, main_loop, config_manager) -> None:
+    import buffer.emergency_saves_manager
+    from buffer.emergency_saves_manager import EmergencySavesManager
+
+    monkeypatch.setattr(buffer.emergency_saves_manager, "config_manager", config_manager)
+    monkeypatch.setattr(EmergencySavesManager, "DIRECTORY", str(tmp_path))
+    path = save(RecoveryStore(str(tmp_path)), tmp_path, "a", "saved text")
+    manager = EmergencySavesManager()
+    results = []
+    manager.search("saved", results.append)
+    main_loop.run_until(lambda: results)
+
+    # As a long save or export
+    saving = threading.Event()
+    manager._EmergencySavesManager__worker.submit(lambda: saving.wait(10))
+    manager.search("text", results.append)
+    snippets = []
+    manager.get_snippet(path, "text", snippets.append)
+    main_loop.run_until(lambda: snippets)
+    saving.set()
+    manager.shutdown()
+
+    assert results == [[path], [path]]
+    assert snippets == ["saved \x02text\x03"]
+
+
+@pytest.mark.benchmark
+def test_search_of_tens_of_thousands_of_snapshots(tmp_path) -> None:
+    snapshots = 20000
+    store = RecoveryStore(str(tmp_path))
+    rng = random.Random(1)
+    # Common words match nearly every snapshot, the rest a few hundred
+    words = [f"word{i}" for i in range(5000)] + ["the", "and", "meeting", "draft", "notes"] * 200
+    for i in range(snapshots):
+        save(store, tmp_path, f"{i:06d}", " ".join(rng.choices(words, k=600)) + "\n")
+    index = RecoverySearchIndex(str(tmp_path), store)
+    start_time = time.perf_counter()
+    index.open()
+    print(f"\nIndexed {snapshots} snapshots in {time.perf_counter() - start_time:.1f}s")
+
+    for query in ["meeting", "meeting draft", "mee", "m", "word123", "word12", "word1 word2"]:
+        timings = []
+        for _ in range(5):
+            start_time = time.perf_counter()
+            paths = index.search(query)
+            timings.append((time.perf_counter() - start_time) * 1000)
+        print(f"{query!r}: {len(paths)} results, {statistics.median(timings):.1f}ms")
+        assert len(paths) == 50
+        assert max(timings) < 50
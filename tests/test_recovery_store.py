@@ -0,0 +1,173 @@
+import errno
+import os
+import random
+import statistics
+import time
+
+import pytest
+
+from buffer import recovery_store
+from buffer.recovery_store import RecoveryStore
+
+
+def make_text(seed: int, lines: int = 40000) -> str:
+    rng = random.Random(seed)
+    return "".join(f"{rng.random()} {rng.random()}\n" for _ in range(lines))
+
+
+def list_chunks(directory: str) -> list[str]:
+    chunks = os.path.join(directory, RecoveryStore.CHUNKS_DIRECTORY)
+    return sorted(
+        os.path.join(root, name) for root, _directories, names in os.walk(chunks) for name in names
+    )
+
+
+def fail_chunk_writes_after(monkeypatch: pytest.MonkeyPatch, successes: int) -> None:
+    replace = os.replace
+    remaining = successes
+
+    def failing_replace(source: str, destination: str) -> None:
+        nonlocal remaining
+        if os.sep + RecoveryStore.CHUNKS_DIRECTORY + os.sep in destination:
+            if remaining == 0:
+                raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+            remaining -= 1
+        replace(source, destination)
+
+    monkeypatch.setattr(recovery_store.os, "replace", failing_replace)
+
+
+def test_failed_chunk_write_releases_earlier_chunks(tmp_path, monkeypatch) -> None:
+    store = RecoveryStore(str(tmp_path))
+    fail_chunk_writes_after(monkeypatch, 3)
+
+    path = str(tmp_path / f"a{RecoveryStore.SNAPSHOT_SUFFIX}")
+    assert store.create_writer(path).finish(make_text(1)) is None
+
+    assert list_chunks(str(tmp_path)) == []
+    assert not os.path.exists(path)
+
+
+def test_failed_feed_releases_earlier_chunks(tmp_path, monkeypatch) -> None:
+    store = RecoveryStore(str(tmp_path))
+    fail_chunk_writes_after(monkeypatch, 2)
+
+    text = make_text(2)
+    writer = store.create_writer(str(tmp_path / f"a{RecoveryStore.SNAPSHOT_SUFFIX}"))
+    results = [writer.feed(text[i : i + 100000]) for i in range(0, len(text), 100000)]
+
+    assert False in results
+    assert list_chunks(str(tmp_path)) == []
+
+
+def test_failed_snapshot_write_releases_chunks(tmp_path, monkeypatch) -> None:
+    store = RecoveryStore(str(tmp_path))
+    replace = os.replace
+
+    def failing_replace(source: str, destination: str) -> None:
+        if destination.endswith(RecoveryStore.SNAPSHOT_SUFFIX):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        replace(source, destination)
+
+    monkeypatch.setattr(recovery_store.os, "replace", failing_replace)
+
+    assert store.create_writer(str(tmp_path / "a.snapshot")).finish(make_text(3)) is None
+    assert list_chunks(str(tmp_path)) == []
+
+
+def test_failed_write_keeps_chunks_shared_with_other_snapshots(tmp_path, monkeypatch) -> None:
+    store = RecoveryStore(str(tmp_path))
+    kept = str(tmp_path / f"kept{RecoveryStore.SNAPSHOT_SUFFIX}")
+    text = make_text(4)
+    assert store.create_writer(kept).finish(text) is not None
+    chunks = list_chunks(str(tmp_path))
+    assert len(chunks) > 1
+
+    # The same text followed by new text, so the kept snapshot's chunks are referenced first
+    fail_chunk_writes_after(monkeypatch, 0)
+    failed = str(tmp_path / f"failed{RecoveryStore.SNAPSHOT_SUFFIX}")
+    assert store.create_writer(failed).finish(text + make_text(5)) is None
+
+    assert list_chunks(str(tmp_path)) == chunks
+    assert "".join(store.read(kept)) == text
+
+    # Removing the kept snapshot leaves no references behind
+    store.remove([kept])
+    assert list_chunks(str(tmp_path)) == []
+
+
+def test_raising_write_releases_chunks(tmp_path, monkeypatch) -> None:
+    store = RecoveryStore(str(tmp_path))
+    write_chunk = store.write_chunk
+    calls = 0
+
+    def raising_write_chunk(digest: str, data: bytes):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise MemoryError()
+        return write_chunk(digest, data)
+
+    monkeypatch.setattr(store, "write_chunk", raising_write_chunk)
+
+    with pytest.raises(MemoryError):
+        store.create_writer(str(tmp_path / "a.snapshot")).finish(make_text(6))
+    assert list_chunks(str(tmp_path)) == []
+
+
+def disk_usage(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _directories, names in os.walk(directory)
+        for name in names
+    )
+
+
+def revise(text: str, rng: random.Random) -> str:
+    # As a scratch buffer between saves, a few lines edited and a few added
+    lines = text.splitlines(keepends=True)
+    for _ in range(3):
+        i = rng.randrange(len(lines))
+        lines[i] = f"edited {rng.random()}\n"
+    lines.extend(f"note {rng.random()} {i}\n" for i in range(rng.randrange(1, 20)))
+    return "".join(lines)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("lines", [2000, 100000])
+def test_saves_of_revisions_against_plain_copies(tmp_path, lines) -> None:
+    revisions = 50
+    rng = random.Random(lines)
+    words = ["buffer", "scratch", "note", "todo", "the", "and", "meeting", "draft", "- item"]
+    text = "".join(" ".join(rng.choices(words, k=8)) + f" {i}\n" for i in range(lines))
+
+    os.makedirs(tmp_path / "store")
+    os.makedirs(tmp_path / "plain")
+    store = RecoveryStore(str(tmp_path / "store"))
+    store_times = []
+    plain_times = []
+    for revision in range(revisions):
+        text = revise(text, rng)
+
+        start_time = time.perf_counter()
+        path = str(tmp_path / "store" / f"{revision}{RecoveryStore.SNAPSHOT_SUFFIX}")
+        assert store.create_writer(path).finish(text) is not None
+        store_times.append(time.perf_counter() - start_time)
+
+        # As recovery files were written before
+        start_time = time.perf_counter()
+        with open(tmp_path / "plain" / f"{revision}.txt", "w") as f:
+            f.write(text)
+        plain_times.append(time.perf_counter() - start_time)
+
+    store_bytes = disk_usage(str(tmp_path / "store"))
+    plain_bytes = disk_usage(str(tmp_path / "plain"))
+    print(
+        f"\n{revisions} revisions of {len(text) / 1e6:.1f}MB: "
+        f"plain {plain_bytes / 1e6:.1f}MB on disk, "
+        f"{statistics.median(plain_times) * 1000:.1f}ms per save; "
+        f"store {store_bytes / 1e6:.2f}MB on disk, "
+        f"{statistics.median(store_times) * 1000:.1f}ms per save"
+    )
+    assert "".join(store.read(path)) == text
+    assert store_bytes < plain_bytes / 5
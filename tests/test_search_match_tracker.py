@@ -0,0 +1,227 @@
+import random
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from fake_text_buffer import FakeTextBuffer, FakeTextIter
+
+from buffer.search_match_tracker import SearchMatchTracker
+from buffer.search_pattern import compile_search_pattern, max_match_length
+from buffer.viewport_search_highlighter import ViewportSearchHighlighter
+
+# Terms which overlap themselves, and some which don't
+TERMS = ["aa", "  ", "--", "==", "aaa", "aba", "a", "ab", "b-"]
+ALPHABET = "aaab -=A\n"
+
+
+@pytest.fixture
+def small_windows(monkeypatch) -> None:
+    # So that scans and rescans cross several windows, and reach the limit on rescanning
+    monkeypatch.setattr(SearchMatchTracker, "SEARCH_CHUNK", 16)
+
+
+def expected_matches(buffer: FakeTextBuffer, term: str, case_sensitive: bool, whole_words: bool):
+    pattern = compile_search_pattern(term, case_sensitive, whole_words, False)
+    return [match.span() for match in pattern.finditer(buffer.text) if match.end() > match.start()]
+
+
+def indexed_matches(tracker: SearchMatchTracker) -> list[tuple[int, int]]:
+    return [tracker.index.get(position) for position in range(1, len(tracker.index) + 1)]
+
+
+def track(main_loop, buffer: FakeTextBuffer, term: str, case_sensitive: bool, whole_words: bool):
+    tracker = SearchMatchTracker(buffer)
+    pattern = compile_search_pattern(term, case_sensitive, whole_words, False)
+    tracker.set_pattern(pattern, len(term))
+    main_loop.run_until(lambda: tracker.ready)
+    return tracker
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def test_scan_finds_every_match(main_loop, small_windows) -> None:
+    rng = random.Random(1)
+    for trial in range(200):
+        buffer = FakeTextBuffer(random_text(rng, rng.randint(0, 120)))
+        term = rng.choice(TERMS)
+        options = (rng.random() < 0.5, rng.random() < 0.5)
+        tracker = track(main_loop, buffer, term, *options)
+        assert indexed_matches(tracker) == expected_matches(buffer, term, *options), trial
+        tracker.stop()
+
+
+def test_index_kept_current_through_edits(main_loop, small_windows) -> None:
+    rng = random.Random(2)
+    for trial in range(300):
+        buffer = FakeTextBuffer(random_text(rng, rng.randint(0, 200)))
+        term = rng.choice(TERMS)
+        options = (rng.random() < 0.5, rng.random() < 0.5)
+        tracker = track(main_loop, buffer, term, *options)
+        for step in range(20):
+            if buffer.text and rng.random() < 0.5:
+                start = rng.randint(0, len(buffer.text))
+                buffer.delete(start, min(start + rng.randint(1, 6), len(buffer.text)))
+            else:
+                # Runs of a character, as well as mixed text
+                if rng.random() < 0.3:
+                    text = rng.choice(ALPHABET) * rng.randint(1, 40)
+                else:
+                    text = random_text(rng, rng.randint(1, 6))
+                buffer.insert(rng.randint(0, len(buffer.text)), text)
+            if not tracker.ready:
+                # Left to a full rescan
+                main_loop.advance(SearchMatchTracker.RESCAN_DELAY)
+                main_loop.run_until(lambda: tracker.ready)
+            assert indexed_matches(tracker) == expected_matches(buffer, term, *options), (
+                trial,
+                step,
+            )
+        tracker.stop()
+
+
+def test_edits_during_scan_are_caught_up(main_loop, small_windows) -> None:
+    rng = random.Random(3)
+    for trial in range(50):
+        buffer = FakeTextBuffer(random_text(rng, 500))
+        tracker = SearchMatchTracker(buffer)
+        tracker.set_pattern(compile_search_pattern("aa", False, False, False), 2)
+        buffer.insert(rng.randint(0, len(buffer.text)), "a" * rng.randint(1, 5))
+        main_loop.run_until(lambda: tracker.ready)
+        assert indexed_matches(tracker) == expected_matches(buffer, "aa", False, False), trial
+        tracker.stop()
+
+
+def test_scan_reads_a_window_at_a_time(main_loop, small_windows, monkeypatch) -> None:
+    buffer = FakeTextBuffer(random_text(random.Random(4), 1000))
+    read_lengths = []
+    get_text = buffer.get_text
+
+    def recording_get_text(start, end, include_hidden: bool) -> str:
+        text = get_text(start, end, include_hidden)
+        read_lengths.append(len(text))
+        return text
+
+    monkeypatch.setattr(buffer, "get_text", recording_get_text)
+    tracker = track(main_loop, buffer, "aa", False, True)
+
+    assert indexed_matches(tracker) == expected_matches(buffer, "aa", False, True)
+    assert len(read_lengths) > 1000 / SearchMatchTracker.SEARCH_CHUNK
+    assert max(read_lengths) <= SearchMatchTracker.SEARCH_CHUNK + len("aa") + 2
+
+
+class HighlightedBuffer(FakeTextBuffer):
+    """Adds the tags and marks the highlighter uses, its marks not moving with edits."""
+
+    def __init__(self, text: str) -> None:
+        super().__init__(text)
+        self.highlights = 0
+
+    def create_tag(self) -> str:
+        return "match"
+
+    def get_style_scheme(self) -> None:
+        return None
+
+    def get_tag_table(self) -> SimpleNamespace:
+        return SimpleNamespace(remove=lambda _tag: None)
+
+    def apply_tag(self, _tag: str, _start: FakeTextIter, _end: FakeTextIter) -> None:
+        pass
+
+    def remove_tag(self, _tag: str, _start: FakeTextIter, _end: FakeTextIter) -> None:
+        pass
+
+    def create_mark(self, _name: None, location: FakeTextIter, left_gravity: bool) -> FakeTextIter:
+        # The highlighter marks the region once highlighted
+        if not left_gravity:
+            self.highlights += 1
+        return location
+
+    def get_iter_at_mark(self, mark: Any) -> FakeTextIter:
+        return super().get_iter_at_mark(mark) if mark == "insert" else mark
+
+    def delete_mark(self, _mark: FakeTextIter) -> None:
+        pass
+
+
+class FixedLineView:
+    """A view scrolled to a line, its lines all LINE_LENGTH characters."""
+
+    LINE_LENGTH = 80
+    LINE_HEIGHT = 20
+
+    def __init__(self, buffer: HighlightedBuffer, top_line: int) -> None:
+        self.buffer = buffer
+        self.top_line = top_line
+
+    def get_buffer(self) -> HighlightedBuffer:
+        return self.buffer
+
+    def get_vadjustment(self) -> SimpleNamespace:
+        return SimpleNamespace(connect=lambda _name, _handler: 0, disconnect=lambda _id: None)
+
+    def get_visible_rect(self) -> SimpleNamespace:
+        return SimpleNamespace(y=self.top_line * self.LINE_HEIGHT, height=40 * self.LINE_HEIGHT)
+
+    def get_line_at_y(self, y: int) -> tuple[FakeTextIter, int]:
+        offset = max(y // self.LINE_HEIGHT, 0) * self.LINE_LENGTH
+        return self.buffer.get_iter_at_offset(offset), y
+
+
+@pytest.mark.benchmark
+def test_typing_latency_on_a_large_buffer(main_loop) -> None:
+    # As the search bar in relaxed mode: the first match is sought in the buffer directly, from
+    # the previous term's first match where the term extends it, and the visible matches
+    # highlighted, while the count runs in the background
+    rng = random.Random(1)
+    words = (
+        "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt"
+        " ut labore et dolore magna aliqua enim ad minim veniam quis nostrud exercitation"
+    ).split()
+    lines = []
+    for _ in range(1000):
+        line = ""
+        while len(line) < 60:
+            line += rng.choice(words) + " "
+        lines.append(line.ljust(FixedLineView.LINE_LENGTH - 1) + "\n")
+    text_lines = rng.choices(lines, k=20 * 1024 * 1024 // FixedLineView.LINE_LENGTH)
+    # Before the cursor, so found only on wrapping around
+    text_lines[10] = "zyzzyva".ljust(FixedLineView.LINE_LENGTH - 1) + "\n"
+    buffer = HighlightedBuffer("".join(text_lines))
+    buffer.cursor = len(buffer.text) // 2
+    view = FixedLineView(buffer, len(text_lines) // 2)
+    tracker = SearchMatchTracker(buffer)
+    highlighter = ViewportSearchHighlighter(view)
+
+    print(f"\n{len(buffer.text) / 1024 / 1024:.0f}MB, typed from the middle:")
+    for word in ("magna", "zyzzyva", "zyzzyvas"):
+        found_timings = []
+        highlighted_timings = []
+        narrowing_offset = None
+        for length in range(1, len(word) + 1):
+            term = word[:length]
+            start_time = time.perf_counter()
+            pattern = compile_search_pattern(term, False, False, False)
+            highlighter.set_pattern(pattern)
+            tracker.set_pattern(pattern, max_match_length(term, False))
+            offset = buffer.cursor if narrowing_offset is None else narrowing_offset
+            found = tracker.find(offset, True)
+            found_timings.append((time.perf_counter() - start_time) * 1000)
+            narrowing_offset = found[0] if found is not None else None
+
+            highlights = buffer.highlights
+            while buffer.highlights == highlights:
+                assert main_loop.step() or time.sleep(0.001) is None
+            highlighted_timings.append((time.perf_counter() - start_time) * 1000)
+        print(
+            f"{word}: first match p50 {statistics.median(found_timings):.1f}ms"
+            f" max {max(found_timings):.1f}ms, highlighted p50"
+            f" {statistics.median(highlighted_timings):.1f}ms max {max(highlighted_timings):.1f}ms"
+        )
+        assert max(highlighted_timings) < 1000
+    tracker.stop()
+    highlighter.set_pattern(None)
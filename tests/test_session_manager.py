@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from buffer.session_manager import SessionManager
+
+
+@pytest.fixture
+def session_manager(tmp_path, monkeypatch) -> SessionManager:
+    monkeypatch.setattr(SessionManager, "DIRECTORY", str(tmp_path))
+    return SessionManager()
+
+
+def save(session_manager: SessionManager, buffers: list) -> None:
+    session_manager.save(buffers)
+    # Waits for the write
+    session_manager.shutdown()
+
+
+def read_all(session_manager: SessionManager) -> list[tuple[str, int]]:
+    return [
+        ("".join(session_manager.read(buffer)), buffer.cursor) for buffer in session_manager.load()
+    ]
+
+
+def test_save_and_load(session_manager) -> None:
+    save(session_manager, [("first", 1), ("second", 2)])
+
+    assert read_all(session_manager) == [("first", 1), ("second", 2)]
+    assert session_manager.load() == []
+
+
+def test_buffers_not_yet_restored_are_carried_over(session_manager, tmp_path) -> None:
+    save(session_manager, [("first", 1), ("second", 2), ("third", 3)])
+    loaded = session_manager.load()
+    # Quitting with only the first restored
+    session_manager.remove(loaded[0])
+
+    save(session_manager, [loaded[2], ("edited first", 4), loaded[1]])
+
+    assert read_all(session_manager) == [("third", 3), ("edited first", 4), ("second", 2)]
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_files_no_longer_in_the_session_are_removed(session_manager, tmp_path) -> None:
+    save(session_manager, [("first", 1), ("second", 2)])
+    loaded = session_manager.load()
+
+    save(session_manager, [loaded[1]])
+
+    assert read_all(session_manager) == [("second", 2)]
+    assert [path.name for path in tmp_path.iterdir()] == [os.path.basename(loaded[1].path)]
+
+
+def restore_session(application, main_loop, texts: list[str], restored: int) -> None:
+    """Restore a saved session, stopping with the first window part way through its text."""
+    save(SessionManager(), [(text, 0) for text in texts])
+    application._Application__restore_session()
+    window = application.get_windows()[-1]
+    while len(window.get_text()) < restored:
+        assert main_loop.step()
+
+
+def test_window_closed_while_restoring_is_saved_whole(application, main_loop, monkeypatch):
+    from buffer.recovery_store import RecoveryStore
+
+    monkeypatch.setattr(SessionManager, "READ_LENGTH", 4)
+    text = "a buffer of several pieces"
+    restore_session(application, main_loop, [text], 8)
+    window = application.get_windows()[-1]
+    buffer = application._Application__restoring[window]
+
+    window.close()
+    main_loop.run_until(lambda: not os.path.exists(buffer.path))
+
+    store = RecoveryStore(application._Application__emergency_saves_manager.DIRECTORY)
+    assert ["".join(store.read(path)) for path in store.list_snapshots()] == [text]
+    # The restore doesn't carry on into the closed window
+    assert window.get_text() == text[:8]
+
+
+def test_window_closed_while_restoring_is_carried_over(
+    application, main_loop, config_manager, monkeypatch
+):
+    monkeypatch.setattr(SessionManager, "READ_LENGTH", 4)
+    config_manager.set_emergency_recover_files(0)
+    restore_session(application, main_loop, ["first buffer", "second"], 8)
+    application.get_windows()[-1].close()
+    main_loop.run_pending()
+
+    application._Application__save_session()
+    application._Application__session_manager.shutdown()
+
+    session_manager = SessionManager()
+    assert sorted(read_all(session_manager)) == [("first buffer", 0), ("second", 0)]
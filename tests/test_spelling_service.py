@@ -0,0 +1,47 @@
+from typing import Any
+
+import pytest
+
+
+@pytest.fixture
+def spelling(config_manager, monkeypatch) -> list[str]:
+    """Records what of libspelling is used."""
+    import gi
+    from gi.repository import Spelling
+
+    import buffer.spelling_service
+
+    used: list[str] = []
+    provider = Spelling.Provider()
+    monkeypatch.setattr(buffer.spelling_service, "config_manager", config_manager)
+    monkeypatch.setattr(
+        gi, "require_version", lambda namespace, _version: used.append(f"require {namespace}")
+    )
+    monkeypatch.setattr(
+        Spelling.Provider,
+        "get_default",
+        lambda: used.append("provider") or provider,
+        raising=False,
+    )
+    monkeypatch.setattr(
+        provider, "load_dictionary", lambda code: used.append(f"dictionary {code}"), raising=False
+    )
+    return used
+
+
+def test_spelling_is_loaded_once_the_loop_is_idle(spelling, main_loop) -> None:
+    from buffer.spelling_service import SpellingService
+
+    service = SpellingService()
+    checkers: list[Any] = []
+    service.load(checkers.append)
+    service.load(checkers.append)
+    assert spelling == []
+
+    main_loop.run_until(lambda: len(checkers) == 2)
+    assert spelling == ["require Spelling", "provider", "dictionary en_US"]
+    assert checkers[0] is checkers[1] is not None
+
+    # Then immediately
+    service.load(checkers.append)
+    assert len(checkers) == 3
@@ -0,0 +1,233 @@
+import itertools
+import random
+import re
+import string
+import time
+from types import SimpleNamespace
+from typing import Any, Callable
+
+import pytest
+
+from fake_text_buffer import FakeTextBuffer, FakeTextIter
+
+LINE_HEIGHT = 20
+LINES = 3000
+
+
+class TaggedBuffer(FakeTextBuffer):
+    """Keeps which characters carry the one tag."""
+
+    def __init__(self, text: str) -> None:
+        super().__init__(text)
+        self.tagged = bytearray(len(text))
+
+    def create_tag(self, _name: None, **_properties: object) -> str:
+        return "misspelt"
+
+    def apply_tag(self, _tag: str, start: FakeTextIter, end: FakeTextIter) -> None:
+        self.tagged[start.get_offset() : end.get_offset()] = b"\1" * (
+            end.get_offset() - start.get_offset()
+        )
+
+    def remove_tag(self, _tag: str, start: FakeTextIter, end: FakeTextIter) -> None:
+        self.tagged[start.get_offset() : end.get_offset()] = bytes(
+            end.get_offset() - start.get_offset()
+        )
+
+    def _replace(self, start: int, end: int, text: str) -> None:
+        super()._replace(start, end, text)
+        # As in a Gtk.TextBuffer, inserted text is untagged
+        self.tagged[start:end] = bytes(len(text))
+
+
+class View:
+    def __init__(self, buffer: TaggedBuffer) -> None:
+        self.buffer = buffer
+        self.scroll_handlers: list[Callable] = []
+        self.vadjustment = SimpleNamespace(
+            connect=lambda _name, handler: self.scroll_handlers.append(handler)
+        )
+        self.top_line = 0
+
+    def get_buffer(self) -> TaggedBuffer:
+        return self.buffer
+
+    def get_vadjustment(self) -> SimpleNamespace:
+        return self.vadjustment
+
+    def get_visible_rect(self) -> SimpleNamespace:
+        return SimpleNamespace(y=self.top_line * LINE_HEIGHT, height=20 * LINE_HEIGHT)
+
+    def scroll_to(self, line: int) -> None:
+        self.top_line = line
+        for handler in self.scroll_handlers:
+            handler(self.vadjustment)
+
+    def get_line_at_y(self, y: int) -> tuple[FakeTextIter, int]:
+        location = self.buffer.get_iter_at_offset(0)
+        line = max(y // LINE_HEIGHT, 0)
+        offset = -1
+        for _ in range(line):
+            offset = self.buffer.text.find("\n", offset + 1)
+            if offset == -1:
+                location.forward_to_line_end()
+                return location, y
+        return self.buffer.get_iter_at_offset(offset + 1), y
+
+
+class SpellingService:
+    """Takes words starting with "q" to be misspelt."""
+
+    def __init__(self) -> None:
+        self.checked: list[str] = []
+
+    def check_word(self, word: str) -> bool:
+        self.checked.append(word)
+        return not word.startswith("q")
+
+
+def line_word(line: int) -> str:
+    return "q" + "".join(chr(ord("a") + int(digit)) for digit in str(line))
+
+
+@pytest.fixture
+def checker_class(config_manager) -> Any:
+    # Imported once the settings are stubbed, as the spelling service imports the config manager
+    from buffer.viewport_spell_checker import ViewportSpellChecker
+
+    return ViewportSpellChecker
+
+
+def make_checker(checker_class: Any) -> tuple[TaggedBuffer, View, SpellingService]:
+    buffer = TaggedBuffer("".join(f"fine {line_word(line)} words\n" for line in range(LINES)))
+    view = View(buffer)
+    view.top_line = 1500
+    service = SpellingService()
+    checker_class(view, service).set_enabled(True)
+    return buffer, view, service
+
+
+def assert_tagged_exactly_misspelt(buffer: TaggedBuffer) -> None:
+    expected = bytearray(len(buffer.text))
+    for match in re.finditer(r"\bq\w+", buffer.text):
+        expected[match.start() : match.end()] = b"\1" * len(match.group())
+    assert buffer.tagged == expected
+
+
+def test_visible_text_is_checked_first_then_the_rest(main_loop, checker_class, monkeypatch) -> None:
+    monkeypatch.setattr(checker_class, "CHUNK", 1000)
+    buffer, view, service = make_checker(checker_class)
+
+    main_loop.run_pending()
+    visible = {line_word(line) for line in range(1480, 1541)}
+    misspelt = [word for word in service.checked if word.startswith("q")]
+    assert set(misspelt[: len(visible)]) == visible
+    assert_tagged_exactly_misspelt(buffer)
+    # Each word once
+    assert len(service.checked) == LINES * 3
+
+
+def test_only_edited_lines_are_checked_again(main_loop, checker_class) -> None:
+    buffer, view, service = make_checker(checker_class)
+    main_loop.run_pending()
+
+    service.checked.clear()
+    offset = buffer.text.index(line_word(10))
+    buffer.insert(offset, "qinserted and\n")
+    main_loop.run_pending()
+    assert service.checked == ["fine", "qinserted", "and", line_word(10), "words"]
+    assert_tagged_exactly_misspelt(buffer)
+
+    # Across lines, and out of view
+    service.checked.clear()
+    start = buffer.text.index(line_word(100))
+    end = buffer.text.index(line_word(102))
+    buffer.delete(start, end)
+    main_loop.run_pending()
+    assert service.checked == ["fine", line_word(102), "words"]
+    assert_tagged_exactly_misspelt(buffer)
+
+    # Nothing left to check on scrolling to where the edits were
+    service.checked.clear()
+    view.scroll_to(0)
+    main_loop.run_pending()
+    assert service.checked == []
+
+
+class CountingChecker:
+    """Stands in for Spelling.Checker, counting the words looked up."""
+
+    def __init__(self) -> None:
+        self.lookups = 0
+
+    def check_word(self, word: str, _length: int) -> bool:
+        self.lookups += 1
+        return not word.startswith("q")
+
+    def set_language(self, _language: str) -> None:
+        pass
+
+    def get_language(self) -> str:
+        return "en_US"
+
+    def connect(self, _name: str, _handler: Callable) -> int:
+        return 0
+
+
+@pytest.mark.benchmark
+def test_revalidation_of_a_large_document(
+    checker_class, config_manager, main_loop, monkeypatch
+) -> None:
+    from gi.repository import Spelling
+
+    import buffer.spelling_service
+    from buffer.spelling_service import SpellingService
+
+    monkeypatch.setattr(buffer.spelling_service, "config_manager", config_manager)
+    checker = CountingChecker()
+    monkeypatch.setattr(Spelling.Checker, "get_default", lambda: checker, raising=False)
+    monkeypatch.setattr(checker_class, "TIME_BUDGET", 1.0)
+    service = SpellingService()
+    loaded: list[Any] = []
+    service.load(loaded.append)
+    main_loop.run_until(lambda: loaded)
+
+    # 1MB of words from a vocabulary of 20,000, the more common used more often
+    rng = random.Random(1)
+    vocabulary = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(20000)
+    ]
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    lines = []
+    size = 0
+    while size < 1024 * 1024:
+        line = " ".join(rng.choices(vocabulary, cum_weights=weights, k=12)) + "\n"
+        lines.append(line)
+        size += len(line)
+    text = "".join(lines)
+
+    def check_in_new_view() -> tuple[float, int, int]:
+        view = View(TaggedBuffer(text))
+        lookups, hits = checker.lookups, service.hits
+        start_time = time.perf_counter()
+        checker_class(view, service).set_enabled(True)
+        main_loop.run_pending()
+        elapsed = (time.perf_counter() - start_time) * 1000
+        assert_tagged_exactly_misspelt(view.buffer)
+        return elapsed, checker.lookups - lookups, service.hits - hits
+
+    first, first_lookups, _hits = check_in_new_view()
+    second, second_lookups, second_hits = check_in_new_view()
+    words = text.split()
+    start_time = time.perf_counter()
+    for word in words:
+        service.check_word(word)
+    per_hit = (time.perf_counter() - start_time) / len(words) * 1000000
+    print(
+        f"\n{len(words)} words in 1MB: first view {first:.0f}ms, {first_lookups} checker lookups;"
+        f" second view {second:.0f}ms, {second_lookups} checker lookups, {second_hits} cache hits;"
+        f" {per_hit:.2f}us a cache hit"
+    )
+    assert first_lookups <= len(set(words))
+    assert second_lookups == 0
+    assert second_hits == len(words)